@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os, sys, subprocess
+
+'''
+timing checks for the command-line entry points.
+
+the import budget check imports each entry point in a fresh interpreter with python -X importtime, and fails if it takes longer than its budget or if it pulls in one of the heavy stacks that should only be loaded on demand (see lazyimport.py):
+
+    $ python benchmarks.py --imports
+
+the budgets are generous, so that a slow disk doesn't trip them; what they catch is someone adding a module-level "import plotter" again, which costs seconds.
+'''
+
+heavy = ('seaborn', 'pandas', 'matplotlib', 'scipy.stats', 'nltk')
+
+#milliseconds
+import_budgets = {
+    'lex_comparison': 750,
+    'segments': 500,
+    'prosody': 500,
+    'lexindex': 500,
+    'nclasses': 150,
+    'queryserver': 250,
+}
+
+
+def import_profile(module, python=sys.executable):
+    '''
+    imports module in a fresh interpreter and returns (milliseconds, set of everything it imported)
+    '''
+    here = os.path.dirname(os.path.abspath(__file__))
+    out = subprocess.run([python, '-X', 'importtime', '-c', f'import {module}'], cwd=here, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{out.stderr}")
+    total, loaded = 0, set()
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cum_us, name = [x.strip() for x in line[len('import time:'):].split('|')]
+        loaded.add(name)
+        if name==module:
+            total = int(cum_us)/1000
+    return total, loaded
+
+
+def check_imports(budgets=import_budgets, repeat=3, verbosity=1):
+    '''
+    the best of repeat runs for each module against its budget; returns the list of failures
+    '''
+    failures = []
+    for module, budget in budgets.items():
+        runs = [import_profile(module) for _ in range(repeat)]
+        ms = min(r[0] for r in runs)
+        loaded = runs[0][1]
+        bad = sorted(h for h in heavy if h in loaded)
+        ok = ms <= budget and not bad
+        if verbosity > 0:
+            note = f"\tloads {', '.join(bad)}" if bad else ''
+            print(f"{module}\t{ms:.0f} ms\t(budget {budget} ms)\t{'ok' if ok else 'FAIL'}{note}")
+        if not ok:
+            failures.append(module)
+    return failures
+
+
+if __name__=="__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="timing checks for the entry points")
+    parser.add_argument("--imports", help="check import times against their budgets and fail if a heavy stack is loaded at import", type=bool, default=True)
+    parser.add_argument("--repeat", help="import each module this many times and keep the fastest (default 3)", type=int, default=3)
+    args = parser.parse_args()
+    if args.imports:
+        failures = check_imports(repeat=args.repeat)
+        if failures:
+            sys.exit(f"over budget: {', '.join(failures)}")
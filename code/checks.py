@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os, sys, shutil, tempfile
+
+'''
+correctness checks for the approximate and out-of-process parts of the code, which the paper's numbers don't exercise. each check runs on a small lexicon in data/ and prints what it compared; the script fails if any check does.
+
+    $ python checks.py --sketch russian/freq_astyj
+    $ python checks.py --workqueue True
+
+the counterpart of benchmarks.py, which checks how fast things are rather than whether they are right.
+'''
+
+datapath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+
+def check_sketch(language, max_mb=4, verbosity=1):
+    '''
+    counts the ngrams of language exactly (segments.py) and with count-min sketches (ngramsketch.py), and checks that the sketch answers every exact key, segmental and natural class, with an estimate no lower than the exact count.
+    returns the list of failures
+    '''
+    import segments as sgs
+    import ngramsketch as ngs
+    import learningdata as ldr
+    lgpath = os.path.join(datapath, language)
+    opts = {'featpath':os.path.join(lgpath, 'Features.txt'), 'verbosity':0}
+    words = ldr.read_ld(ld=os.path.join(lgpath, 'LearningData.txt'), dedupe=True, verbosity=0)
+    exact = sgs.make_natclass_ngrams(**sgs.count_seg_ngrams(ld=words, **opts))
+    sk = ngs.sketch_ngrams(ld=words, natclasses=True, max_mb=max_mb, **opts)
+    failures = []
+    for name in ('seg_ngrams', 'natclass_ngrams'):
+        grams = list(exact[name])
+        est = sk[name].get_many(grams)
+        low = [g for g, e in zip(grams, est) if e < exact[name][g]]
+        if verbosity > 0:
+            print(f"{name}\t{len(exact[name])} exact keys\t{len(low)} estimated too low\t{'ok' if not low else 'FAIL'}")
+        if low:
+            failures.append(f"{name}: {len(low)} keys estimated too low, e.g. {low[0]}")
+    return failures
+
+
+def check_workqueue(lexicon='russian/freq_noun_stems', sublexicon='russian/freq_astyj', nsamples=4000, shard=500, jobs=3, verbosity=1):
+    '''
+    runs one small job through workqueue.py three times, each in its own temporary queue: with one worker; with several worker processes; and with two shards claimed by a worker that never finishes, requeued, and a result from another job sorting first for shard 0. the merged results have to be identical.
+    returns the list of failures
+    '''
+    import workqueue as wq
+    job = {'analysis':'last', 'lexicon':lexicon, 'sublexicon':sublexicon, 'nsamples':nsamples, 'engine':'numpy', 'seed':None}
+    top = tempfile.mkdtemp(prefix='workqueue_check_')
+    merged = {}
+    try:
+        for run in ('one', 'pool', 'requeue'):
+            queue = os.path.join(top, run)
+            wq.submit(queue, job, shard=shard)
+            if run=='one':
+                wq.work(queue, worker='w0', verbosity=0)
+            elif run=='pool':
+                wq.work_pool(queue, jobs)
+            else:
+                dead = [wq.claim(queue, 'dead') for _ in range(2)]
+                wq.write_json({'shard':0, 'nsamples':shard, 'seed':0, 'job':'another', 'worker':'0', 'counts':{}}, os.path.join(queue, 'results', 'shard_00000.0.json'))
+                wq.work_pool(queue, jobs)
+                if len(wq.requeue(queue, 0)) != len(dead):
+                    return [f"requeue moved the wrong claims back from {queue}"]
+                wq.work_pool(queue, jobs)
+            merged[run] = wq.merge(queue, verbosity=verbosity)
+    finally:
+        shutil.rmtree(top, ignore_errors=True)
+    failures = []
+    for run in ('pool', 'requeue'):
+        same = merged[run]['result']==merged['one']['result'] and merged[run]['nsamples']==nsamples and not merged[run]['missing']
+        if verbosity > 0:
+            print(f"workqueue {run}	{merged[run]['shards']} shards, {merged[run]['nsamples']} samples	{'ok' if same else 'FAIL'}")
+        if not same:
+            failures.append(f"workqueue: the {run} run merged to a different result than one worker")
+    return failures
+
+
+if __name__=="__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="correctness checks for the ngram sketches and the work queue")
+    parser.add_argument("--sketch", help="check the count-min sketches against exact counts for this lexicon (a path to a directory in 'data', e.g. russian/freq_astyj)", type=str, default=None)
+    parser.add_argument("--workqueue", help="run a small job through workqueue.py with one worker, with several, and with a requeue, and check that they merge to the same result", type=bool, default=False)
+    args = parser.parse_args()
+    failures = []
+    if args.sketch:
+        failures += check_sketch(args.sketch)
+    if args.workqueue:
+        failures += check_workqueue()
+    if failures:
+        sys.exit('\n'.join(failures))
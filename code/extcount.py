@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os, json, heapq, tempfile
+from itertools import islice
+import numpy
+
+# should be in the same code directory
+import learningdata as ldr
+
+'''
+exact ngram counting for word lists too big to count in memory (say, a full Aranea extraction rather than astyj_auto.txt). segments.count_seg_ngrams keeps every ngram in a dictionary; this keeps at most one chunk of them in memory at a time:
+    1. words are read in chunks; every ngram is packed into one 64-bit integer (16 bits per symbol, so up to 4-grams over up to 65535 symbols), and the chunk's keys are sorted and counted with numpy
+    2. each counted chunk is spilled to disk as a sorted run of (key, count) records
+    3. the runs are merged, a block of each at a time (at most fan_in runs at once; more runs are merged in several passes), into one sorted count file
+the count file (ngrams.bin, plus symbols.json to decode the keys) is read back with CountFile, a read-only mapping: cf['a s t'] (a binary search on disk), iteration in key order, len, and most_common(k), which streams the file and keeps only the top k.
+
+    counts = count_ngrams(ld=ldr.stream_ld(ld=path), outdir='spill', chunk=2**22)
+    cf = CountFile('spill')
+    cf.most_common(20)
+
+or with "python extcount.py --infile ../data/raw_searches/astyj_auto.txt --chars True --outdir spill --topk 50"; --chars counts letter ngrams in unsegmented text (one word per line), padded with # as transcriptions are.
+'''
+
+record = numpy.dtype([('key', '<u8'), ('count', '<u8')])
+bits = 16
+maxn = 64//bits
+
+
+def pack_keys(ids, starts, lengths, n):
+    '''
+    the packed keys of every n-gram in a chunk. ids is the concatenated symbol ids (counting from 1) of all the words, starts and lengths say where each word is
+    '''
+    ends = starts + lengths
+    pos = numpy.arange(len(ids))
+    word = numpy.repeat(numpy.arange(len(starts)), lengths)
+    ok = pos + n <= ends[word]
+    first = pos[ok]
+    keys = numpy.zeros(len(first), dtype=numpy.uint64)
+    for j in range(n):
+        keys = (keys << numpy.uint64(bits)) | ids[first+j]
+    return keys
+
+
+def count_chunk(words, symbols, nmin=1, nmax=3, split=' '):
+    '''
+    sorted unique keys and their counts for all the n-grams (nmin to nmax) of a list of words. symbols ({symbol: id}) grows as new symbols turn up
+    '''
+    seqs = [w.split(split) if split else list(w) for w in words]
+    flat = []
+    for s in seqs:
+        for x in s:
+            if x not in symbols:
+                if len(symbols) >= 2**bits-1:
+                    raise ValueError(f"more than {2**bits-1} distinct symbols")
+                symbols[x] = len(symbols)+1
+            flat.append(symbols[x])
+    ids = numpy.array(flat, dtype=numpy.uint64)
+    lengths = numpy.array([len(s) for s in seqs], dtype=numpy.int64)
+    starts = numpy.concatenate([[0], numpy.cumsum(lengths)[:-1]]).astype(numpy.int64)
+    keys = numpy.concatenate([pack_keys(ids, starts, lengths, n) for n in range(nmin, nmax+1)])
+    return numpy.unique(keys, return_counts=True)
+
+
+def write_run(keys, counts, path):
+    run = numpy.empty(len(keys), dtype=record)
+    run['key'] = keys
+    run['count'] = counts
+    run.tofile(path)
+
+
+def merge_runs(paths, outpath, block=2**20):
+    '''
+    merges sorted runs into one sorted run, adding up the counts of keys found in several. reads block records of each run at a time
+    '''
+    runs = [numpy.memmap(p, dtype=record, mode='r') if os.path.getsize(p) else numpy.empty(0, dtype=record) for p in paths]
+    pos = [0]*len(runs)
+    with open(outpath, 'wb') as out:
+        while True:
+            live = [i for i in range(len(runs)) if pos[i] < len(runs[i])]
+            if not live:
+                break
+            blocks = {i:runs[i][pos[i]:pos[i]+block] for i in live}
+            #everything up to the smallest last key of a block is complete: no run can have more of it later
+            limit = min(blocks[i]['key'][-1] if pos[i]+block < len(runs[i]) else numpy.iinfo(numpy.uint64).max for i in live)
+            parts = []
+            for i in live:
+                take = numpy.searchsorted(blocks[i]['key'], limit, side='right')
+                parts.append(blocks[i][:take])
+                pos[i] += take
+            merged = numpy.concatenate(parts)
+            keys, inverse = numpy.unique(merged['key'], return_inverse=True)
+            sums = numpy.zeros(len(keys), dtype=numpy.uint64)
+            numpy.add.at(sums, inverse, merged['count'])
+            write_run(keys, sums, out)
+    del runs
+
+
+def count_ngrams(**kwargs):
+    '''
+    counts the n-grams of the words in kwargs['ld'] (a list or a stream) out of core, into kwargs['outdir'] (ngrams.bin and symbols.json; temporary runs go to a subdirectory that is removed afterwards).
+    options: chunk (words per run, default 200000), nmin/nmax (default 1 to 3, as count_seg_ngrams; at most 4), split (the symbol separator, ' ' for transcriptions; '' for letters), fan_in (runs merged at once, default 64), block (records read per run per step)
+    returns kwargs with 'seg_ngrams': a CountFile over the result
+    '''
+    outdir = kwargs['outdir']
+    nmin, nmax = kwargs.get('nmin', 1), kwargs.get('nmax', 3)
+    if nmax > maxn:
+        raise ValueError(f"keys hold at most {maxn}-grams")
+    chunk = kwargs.get('chunk', 200000)
+    fan_in = kwargs.get('fan_in', 64)
+    block = kwargs.get('block', 2**20)
+    split = kwargs.get('split', ' ')
+    verbosity = kwargs.get('verbosity', 1)
+    os.makedirs(outdir, exist_ok=True)
+    symbols = {}
+    words = iter(kwargs['ld'])
+    with tempfile.TemporaryDirectory(dir=outdir) as tmp:
+        runs = []
+        while True:
+            wds = list(islice(words, chunk))
+            if not wds:
+                break
+            keys, counts = count_chunk(wds, symbols, nmin, nmax, split)
+            runs.append(os.path.join(tmp, f'run{len(runs)}.bin'))
+            write_run(keys, counts, runs[-1])
+        if verbosity > 0:
+            print(f"{len(runs)} sorted runs spilled")
+        passes = 0
+        while len(runs) > 1:
+            merged = []
+            for i in range(0, len(runs), fan_in):
+                group = runs[i:i+fan_in]
+                if len(group)==1:
+                    merged.append(group[0])
+                    continue
+                merged.append(os.path.join(tmp, f'merge{passes}_{i}.bin'))
+                merge_runs(group, merged[-1], block)
+                for p in group:
+                    os.remove(p)
+            runs = merged
+            passes += 1
+        outpath = os.path.join(outdir, 'ngrams.bin')
+        if runs:
+            os.replace(runs[0], outpath)
+        else:
+            open(outpath, 'wb').close()
+    with open(os.path.join(outdir, 'symbols.json'), 'w', encoding='utf-8') as f:
+        json.dump({'symbols':sorted(symbols, key=symbols.get), 'split':split}, f, ensure_ascii=False)
+    kwargs['seg_ngrams'] = CountFile(outdir)
+    if verbosity > 0:
+        print(f"{len(kwargs['seg_ngrams'])} ngrams counted in {passes} merge passes, written to {outpath}")
+    return kwargs
+
+
+class CountFile:
+    '''
+    read-only {ngram: count} mapping over a count file made by count_ngrams. lookups are binary searches in the file; nothing is loaded into memory
+    '''
+    def __init__(self, outdir):
+        with open(os.path.join(outdir, 'symbols.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        self.symbols = meta['symbols']
+        self.split = meta['split']
+        self.ids = {s:i+1 for i, s in enumerate(self.symbols)}
+        path = os.path.join(outdir, 'ngrams.bin')
+        self.records = numpy.memmap(path, dtype=record, mode='r') if os.path.getsize(path) else numpy.empty(0, dtype=record)
+
+    def key(self, ngram):
+        syms = ngram.split(' ') if isinstance(ngram, str) else ngram
+        if not syms or len(syms) > maxn or any(s not in self.ids for s in syms):
+            return None
+        k = 0
+        for s in syms:
+            k = (k << bits) | self.ids[s]
+        return numpy.uint64(k)
+
+    def decode(self, key):
+        key = int(key)
+        out = []
+        while key:
+            out.append(self.symbols[(key & (2**bits-1))-1])
+            key >>= bits
+        return ' '.join(reversed(out))
+
+    def get(self, ngram, default=None):
+        k = self.key(ngram)
+        if k is None:
+            return default
+        i = numpy.searchsorted(self.records['key'], k)
+        if i < len(self.records) and self.records['key'][i]==k:
+            return int(self.records['count'][i])
+        return default
+
+    def __getitem__(self, ngram):
+        c = self.get(ngram)
+        if c is None:
+            raise KeyError(ngram)
+        return c
+
+    def __contains__(self, ngram):
+        return self.get(ngram) is not None
+
+    def __len__(self):
+        return len(self.records)
+
+    def items(self, block=2**20):
+        for i in range(0, len(self.records), block):
+            part = self.records[i:i+block]
+            for k, c in zip(part['key'].tolist(), part['count'].tolist()):
+                yield self.decode(k), c
+
+    def __iter__(self):
+        for ngram, c in self.items():
+            yield ngram
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        for ngram, c in self.items():
+            yield c
+
+    def most_common(self, k=None, block=2**20):
+        '''
+        [(ngram, count)] for the k most frequent ngrams (all of them if k is None), streaming the file a block at a time
+        '''
+        if k is None:
+            k = len(self.records)
+        best = []
+        for i in range(0, len(self.records), block):
+            part = self.records[i:i+block]
+            if len(part) > k:
+                part = part[numpy.argpartition(part['count'], -k)[-k:]]
+            best = heapq.nlargest(k, best + list(zip(part['count'].tolist(), part['key'].tolist())))
+        return [(self.decode(key), c) for c, key in best]
+
+    def to_dict(self):
+        '''
+        the whole thing as the {ngram: count} dictionary count_seg_ngrams makes, for results small enough to hold
+        '''
+        return dict(self.items())
+
+
+if __name__=="__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="exact ngram counts for word lists too big to count in memory")
+    parser.add_argument("--language", help="partial path to a transcribed lexicon inside 'data' (e.g. russian/freq_noun_stems)", default=None)
+    parser.add_argument("--infile", help="or any one-word-per-line file", default=None)
+    parser.add_argument("--chars", help="count letter ngrams in unsegmented words (padded with #)", type=bool, default=False)
+    parser.add_argument("--outdir", help="where the count file goes (temporary runs are spilled under it)", required=True)
+    parser.add_argument("--chunk", help="words per sorted run (default 200000)", type=int, default=200000)
+    parser.add_argument("--nmax", help="longest ngram counted (default 3, at most 4)", type=int, default=3)
+    parser.add_argument("--topk", help="print the most frequent ngrams", type=int, default=20)
+    parser.add_argument("--keep_mb", help="keep morpheme boundaries (|) as segments instead of dropping them", type=bool, default=False)
+    args = parser.parse_args()
+    kwargs = {'outdir':args.outdir, 'chunk':args.chunk, 'nmax':args.nmax}
+    if args.language:
+        ld = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', args.language, 'LearningData.txt')
+        kwargs['ld'] = ldr.stream_ld(ld=ld, keep_mb=args.keep_mb, dedupe=True, verbosity=0)
+    elif args.chars:
+        f = open(args.infile, encoding='utf-8')
+        kwargs['ld'] = (['#'] + list(line.strip()) + ['#'] for line in f if line.strip())
+        kwargs['split'] = None
+    else:
+        kwargs['ld'] = ldr.stream_ld(ld=args.infile, keep_mb=args.keep_mb, dedupe=True, verbosity=0)
+    cf = count_ngrams(**kwargs)['seg_ngrams']
+    for ngram, c in cf.most_common(args.topk):
+        print(f"{ngram}\t{c}")
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import importlib.util
+
+'''
+deferred imports for the heavy dependencies (seaborn, pandas, matplotlib via plotter.py; scipy.stats; nltk), so that a script only pays for them if the subcommand it runs actually uses them.
+
+    scipy_stats = lazy_module('scipy.stats')
+
+returns a module object whose code runs the first time one of its attributes is looked up. if the module has already been imported, it is returned as is.
+'''
+
+
+def lazy_module(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import gzip, hashlib
+from array import array
+
+'''
+one streaming reader for LearningData.txt files, so that every module tokenises words the same way.
+
+a LearningData line is a space-separated transcription, optionally followed by tab-separated columns (which are ignored). morpheme boundaries are written as "|" and are kept as segments unless you ask to drop them. every word comes out as a single-space-separated string padded with word boundaries:
+
+    a b b rʲ e vʲ i | a t | ú r     -->     # a b b rʲ e vʲ i | a t | ú r #
+    (keep_mb=False)                 -->     # a b b rʲ e vʲ i a t ú r #
+
+by default every line is a word, doublets included, just as the simulations have always read the lexicon (freq_noun_stems has 13113 lines but 13013 distinct words, and the published numbers come from the 13113). the ngram counts read the words as a set; they ask for dedupe, which detects doublets with a compact hash set (8 bytes per word), so million-line exports can be streamed through without holding the words themselves in memory. files ending in .gz (or any gzip-compressed file) are read transparently.
+'''
+
+
+def open_ld(path):
+    '''
+    opens a learning data file for reading as text, gzip-compressed or not
+    '''
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def normalise(line, keep_mb=True, pad=True):
+    '''
+    turns one LearningData line into a word string, or returns None for blank lines
+    '''
+    segs = line.split('\t')[0].split()
+    if not keep_mb:
+        segs = [x for x in segs if x != '|']
+    if not segs:
+        return None
+    if pad:
+        return "# " + " ".join(segs) + " #"
+    return " ".join(segs)
+
+
+def make_doublet_check(capacity=1024):
+    '''
+    returns a function that takes a word and says whether it has been seen before.
+    words are stored as 64-bit blake2b fingerprints in an open-addressing table (an unsigned array that doubles when it is half full), so memory stays at 8-16 bytes per distinct word no matter how long the words are. the chance of two different words sharing a fingerprint is about n^2/2^65, which is negligible for any word list we are likely to have.
+    '''
+    size = 1
+    while size < capacity*2:
+        size *= 2
+    state = {'table': array('Q', bytes(8*size)), 'n': 0}
+
+    def insert(table, fp):
+        mask = len(table)-1
+        i = fp & mask
+        while table[i]:
+            if table[i] == fp:
+                return False
+            i = (i+1) & mask
+        table[i] = fp
+        return True
+
+    def seen(word):
+        #0 marks an empty slot, so it is never used as a fingerprint
+        fp = int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+        if not insert(state['table'], fp):
+            return True
+        state['n'] += 1
+        if state['n']*2 > len(state['table']):
+            old = state['table']
+            state['table'] = array('Q', bytes(16*len(old)))
+            for x in old:
+                if x:
+                    insert(state['table'], x)
+        return False
+
+    return seen
+
+
+def stream_ld(**kwargs):
+    '''
+    generator over the normalised words in kwargs['ld'] (a path).
+    options:
+        keep_mb: keep "|" morpheme boundaries as segments (default True)
+        pad: add "#" word boundaries (default True)
+        dedupe: skip doublets, printing a message for each one if verbosity>0 (default False: every line is a word)
+    '''
+    keep_mb = kwargs.get('keep_mb', True)
+    pad = kwargs.get('pad', True)
+    dedupe = kwargs.get('dedupe', False)
+    verbosity = kwargs.get('verbosity', 1)
+    seen = make_doublet_check() if dedupe else None
+    with open_ld(kwargs['ld']) as f:
+        for line in f:
+            word = normalise(line, keep_mb=keep_mb, pad=pad)
+            if word is None:
+                continue
+            if seen is not None and seen(word):
+                if verbosity > 0:
+                    print(f"your word list has doublets! {word.strip('# ')} appears at least twice")
+                continue
+            yield word
+
+
+def read_ld(**kwargs):
+    '''
+    like stream_ld, only returns a list (for the functions that need to go over the words more than once)
+    '''
+    return list(stream_ld(**kwargs))
@@ -1,15 +1,24 @@
 #!usr/bin/env python3
 
-import os, random, sys
+import os, random, sys, time
 import numpy
-import scipy.stats
-import plotter
-import matplotlib.pyplot as plt
-from nltk import ngrams
 
+from lazyimport import lazy_module
 import prosody as pros
+import learningdata as ldr
 import nclasses as pnc
 import segments as sgs
+import simstore as sst
+import sampling as smp
+import simengine as sim
+import simstats as sts
+import lexindex as lxi
+
+#the plotting and stats stacks take seconds to import, and most runs (--last, --stats) never touch them
+plotter = lazy_module('plotter')
+special = lazy_module('scipy.special')
+stats = lazy_module('scipy.stats')
+sparse = lazy_module('scipy.sparse')
 
 
 '''
@@ -23,31 +32,113 @@ Or replace freq_astyj with freq_izm and freq_ist to do same for the suffixes in
 def ransample(**kwargs):
     '''
     samples N times from a dictionary of words and tracks how often word length (in syll) exceeds some max size. 
+    draws are uniform over word types unless kwargs['weights'] (one weight per item in lex) is given, see sampling.py
+    kwargs['engine'] is 'python' (one sample at a time), 'numpy' (batched draws, see simengine.py) or 'exact' (closed-form expected counts); kwargs['without_replacement'] draws samples with no repeated words
     '''
-    random.seed(4)
+    seed = kwargs['seed'] if kwargs.get('seed') is not None else 4
+    random.seed(seed)
     lex = kwargs.get('lex')
     samsize = kwargs.get('samsize')
     nsamples = kwargs.get('nsamples')
     maxlenth = kwargs.get('maxsize')
     verbosity = kwargs.get('verbosity', 1)
-    sdic = {'max_length':[], 'min_length':[], 'number_over_maxsize':[]}
-    for n in range(nsamples):
-        wds = random.choices(lex, k=samsize)
-        sdic['max_length'].append(max(wds))
-        sdic['min_length'].append(min(wds))
-        if max(wds)>maxlenth:
-            sdic['number_over_maxsize'].append(1)
-        else:
-            sdic['number_over_maxsize'].append(0)
-    return sdic
+    engine = kwargs.get('engine', 'python')
+    replace = not kwargs.get('without_replacement')
+    weights = kwargs.get('weights')
+    #each statistic is kept as a histogram {value: number of samples}, so memory doesn't grow with nsamples
+    sdic = {'max_length':{}, 'min_length':{}, 'number_over_maxsize':{}}
+    if engine=='exact':
+        #expected number of samples for each value, from the closed-form distributions
+        maxd = sim.max_dist(lex, samsize, replace, weights)
+        sdic['max_length'] = {v:p*nsamples for v, p in maxd.items()}
+        sdic['min_length'] = {v:p*nsamples for v, p in sim.min_dist(lex, samsize, replace, weights).items()}
+        over = sum(p for v, p in maxd.items() if v>maxlenth)
+        sdic['number_over_maxsize'] = {0:(1-over)*nsamples, 1:over*nsamples}
+        return sdic
+    rng = None
+    if engine=='python':
+        draw = smp.make_drawer(lex, weights, replace)
+        def step(sdic, n):
+            for i in range(n):
+                wds = draw(samsize)
+                hist_add(sdic['max_length'], max(wds))
+                hist_add(sdic['min_length'], min(wds))
+                if max(wds)>maxlenth:
+                    hist_add(sdic['number_over_maxsize'], 1)
+                else:
+                    hist_add(sdic['number_over_maxsize'], 0)
+    else:
+        rng = numpy.random.default_rng(seed)
+        vals = numpy.asarray(lex)
+        table = smp.alias_table(weights) if weights is not None and replace else None
+        batch = kwargs.get('batch') or sim.batch_size(len(lex), samsize)
+        def step(sdic, n):
+            done = 0
+            while done < n:
+                b = min(batch, n-done)
+                drawn = vals[sim.draw_indices(len(vals), samsize, b, rng, replace, weights, table)]
+                mx = drawn.max(axis=1)
+                for name, col in (('max_length', mx), ('min_length', drawn.min(axis=1)), ('number_over_maxsize', (mx>maxlenth).astype(int))):
+                    for v, c in zip(*numpy.unique(col, return_counts=True)):
+                        hist_add(sdic[name], int(v), int(c))
+                done += b
+    key = sst.make_key(func='ransample', lex=lex, weights=weights, samsize=samsize, maxsize=maxlenth, nsamples=nsamples, seed=seed, engine=engine, replace=replace, batch=kwargs.get('batch'), checkpoint=kwargs.get('checkpoint', 10000))
+    return sst.run_cached(sdic, step, key=key, rng=rng, **store_opts(kwargs))
+
+def store_opts(kwargs):
+    '''
+    the settings simstore.run_cached needs from a simulation's kwargs
+    '''
+    return {k:kwargs[k] for k in ('nsamples', 'store', 'checkpoint', 'verbosity') if k in kwargs}
+
+def hist_add(hist, value, count=1):
+    if value in hist:
+        hist[value]+=count
+    else:
+        hist[value]=count
+
+def hist_mean(hist):
+    '''
+    mean of a histogram {value: count}
+    '''
+    return sum(v*c for v, c in hist.items())/sum(hist.values())
+
+def write_hist(hist, outpath):
+    '''
+    writes a histogram {value: count} to a tab-separated file, one value per line
+    '''
+    with open(outpath, 'w', encoding='utf-8') as f:
+        for v in sorted(hist):
+            f.write(f"{v}\t{hist[v]}\n")
+
+def read_hist(path):
+    '''
+    reads a histogram written by write_hist (or any value<tab>count file, e.g. the max stem lengths printed by --last). counts are ints, except for the exact engine's expected counts, which stay floats
+    '''
+    hist = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip().split('\t')
+            if len(line)==2:
+                count = float(line[1])
+                hist_add(hist, int(line[0]), int(count) if count.is_integer() else count)
+    return hist
 
 def finc_syllcount_monte(**kwargs):
     '''
     samples N times from a dictionary of words and tracks how often segments with certain final segments *and* a certain syllable count appear in the sample at the same time.
     needs a lexicon and a sublexicon, a natural class dictionary, and a number of simulations (samples)
     this also tracks how often segments from various natural classes fail to occur in stem-final position, comparing the sublexicon and the reference lexicon.
+    draws are uniform over word types unless kwargs['weights'] (one weight per word in lex) is given, see sampling.py
+    kwargs['engine']:
+        'python' (default): one sample at a time, as in the paper
+        'numpy': the lexicon is compiled into arrays and samples are drawn and scored in batches (simengine.py). here the tightest class of the drawn final segments is reported with its full feature description, and 'joint' requires every drawn final segment to fall into the sublexicon's tightest class (rather than comparing one feature of each description)
+        'exact': no sampling; the expected counts come from the binomial/hypergeometric formulas, so the class of the drawn finals isn't tracked
+    kwargs['without_replacement'] draws samples in which no word occurs twice, as in a real sublexicon
+    kwargs['importance'] also estimates the probability of the joint event by importance sampling (simengine.importance_prob), with nsamples draws tilted toward words within the syllable cap that end in the sublexicon's tightest class (kwargs['tilt'] is their share of the draws, default 1). the result goes into finc['joint_is']: {'p', 'se', 'hits', 'nsamples', 'ess'}
     '''
-    random.seed(55)
+    seed = kwargs['seed'] if kwargs.get('seed') is not None else 55
+    random.seed(seed)
     samsize = kwargs.get('samsize')
     lex = kwargs.get('lex') # this is a set of transcribed words
     sublex = kwargs.get('sublex')
@@ -67,50 +158,358 @@ def finc_syllcount_monte(**kwargs):
         sylls.add(len([x for x in wd if x in kwargs['vowels']]))
     sublexmaxsyll = max(sylls)
     print(f"The maximum syllable count in the sublexicon is {sublexmaxsyll}")
-    outdic = {'lastnclass': {}, 'maxlenth': {}, 'joint':0}
+    engine = kwargs.get('engine', 'python')
+    replace = not kwargs.get('without_replacement')
+    weights = kwargs.get('weights')
+    #the running counts: 'absent' tracks how many simulations each class was absent from
+    outdic = {'lastnclass': {}, 'maxlenth': {}, 'joint':0, 'absent':{cl:0 for cl in nclasses}}
+    rng = None
+    if engine!='python' or kwargs.get('importance'):
+        comp = sim.compile_lex(lex, kwargs['vowels'], fclassdic)
+        #the sublexicon's tightest class, as a mask over segments: the smallest class that has all of its final segments
+        submask = sim.tightest_mask(comp, kwargs['segset'])
+        classpos = {cl:c for c, cl in enumerate(comp['classes'])}
+    if engine=='exact':
+        infinal = comp['classmat'][:, comp['final']]
+        absentp = sim.subset_prob(~infinal, samsize, replace, weights)
+        outdic['absent'] = {cl:float(absentp[classpos[cl]])*nsamples for cl in nclasses}
+        outdic['maxlenth'] = {v:p*nsamples for v, p in sim.max_dist(comp['syll'], samsize, replace, weights).items()}
+        outdic['joint'] = float(sim.subset_prob((comp['syll']<=sublexmaxsyll) & submask[comp['final']], samsize, replace, weights))*nsamples
+        outdic['exact'] = True
+    elif engine=='numpy':
+        rng = numpy.random.default_rng(seed)
+        table = smp.alias_table(weights) if weights is not None and replace else None
+        batch = kwargs.get('batch') or sim.batch_size(len(lex), samsize)
+        def step(outdic, n):
+            done = 0
+            while done < n:
+                b = min(batch, n-done)
+                idx = sim.draw_indices(len(lex), samsize, b, rng, replace, weights, table)
+                res = sim.finc_batch(comp, idx, submask, sublexmaxsyll)
+                for v, c in zip(*numpy.unique(res['maxsyll'], return_counts=True)):
+                    hist_add(outdic['maxlenth'], int(v), int(c))
+                for t, c in zip(*numpy.unique(res['tightest'], return_counts=True)):
+                    hist_add(outdic['lastnclass'], comp['classes'][t] if t>=0 else 'none', int(c))
+                for cl in nclasses:
+                    outdic['absent'][cl] += int(res['absent'][classpos[cl]])
+                outdic['joint'] += res['joint']
+                done += b
     #drawing random samples now and checking for feat co-occurrence:
-    for n in range(nsamples):
-        wds = random.choices(lex, k=samsize)
-        #collect actual lenths and put them in a dict:
-        lenths = [len([x for x in wd if x in kwargs['vowels']]) for wd in wds]
-        #collect nat classes and put them in a dict:
-        kwargs['segset']=[x.strip("# ").split(" ")[-1] for x in wds]
-        for cl in nclasses:
-            if len(fclassdic[cl]&set(kwargs['segset']))==0:
-                nclasses[cl]['sim']+=1 #means it was absent from that simulation!!
-        #check against sublex and enter result in 'joint':
-        simmaxsyll = max(lenths)
-        simnatclass = list(list(pnc.tightest_class(**kwargs).values())[0])[0]
-        if simnatclass in outdic['lastnclass']:
-            outdic['lastnclass'][simnatclass]+=1
-        else:
-            outdic['lastnclass'][simnatclass]=1
-        if simmaxsyll in outdic['maxlenth']:
-            outdic['maxlenth'][simmaxsyll]+=1
-        else:
-            outdic['maxlenth'][simmaxsyll]=1
-        if simmaxsyll <= sublexmaxsyll and kwargs['featdic'][simnatclass].issubset(kwargs['featdic'][sublexnatclass]):#check simnatclass is a subset of sublexnatclass
-            outdic['joint']+=1
-    cl_to_remove = []
+    draw = smp.make_drawer(lex, weights, replace) if engine=='python' else None
+    def python_step(outdic, n):
+        for i in range(n):
+            wds = draw(samsize)
+            #collect actual lenths and put them in a dict:
+            lenths = [len([x for x in wd if x in kwargs['vowels']]) for wd in wds]
+            #collect nat classes and put them in a dict:
+            kwargs['segset']=[x.strip("# ").split(" ")[-1] for x in wds]
+            for cl in nclasses:
+                if len(fclassdic[cl]&set(kwargs['segset']))==0:
+                    outdic['absent'][cl]+=1 #means it was absent from that simulation!!
+            #check against sublex and enter result in 'joint':
+            simmaxsyll = max(lenths)
+            simnatclass = list(list(pnc.tightest_class(**kwargs).values())[0])[0]
+            hist_add(outdic['lastnclass'], simnatclass)
+            hist_add(outdic['maxlenth'], simmaxsyll)
+            if simmaxsyll <= sublexmaxsyll and kwargs['featdic'][simnatclass].issubset(kwargs['featdic'][sublexnatclass]):#check simnatclass is a subset of sublexnatclass
+                outdic['joint']+=1
+    if engine=='python':
+        step = python_step
+    if engine!='exact':
+        key = sst.make_key(func='finc_syllcount_monte', lex=lex, weights=weights, sublex=sublex, featpath=kwargs.get('featpath'), nsamples=nsamples, seed=seed, engine=engine, replace=replace, batch=kwargs.get('batch'), checkpoint=kwargs.get('checkpoint', 10000))
+        outdic = sst.run_cached(outdic, step, key=key, rng=rng, **store_opts(kwargs))
+    if kwargs.get('importance'):
+        good = (comp['syll']<=sublexmaxsyll) & submask[comp['final']]
+        outdic['joint_is'] = sim.importance_prob(good, samsize, nsamples, numpy.random.default_rng(seed), replace, weights, kwargs.get('tilt', 1.0))
     for cl in nclasses:
-        for xcl in nclasses:
-            if cl != xcl and nclasses[cl]['segs'].issuperset(nclasses[xcl]['segs']):
-                 cl_to_remove.append(xcl)
+        nclasses[cl]['sim'] = outdic['absent'].get(cl, 0)
+    del outdic['absent']
+    #only report the largest absent classes: the ones with no absent class above them in the lattice
+    keep = set(pnc.maximal_classes(pnc.class_lattice(fclassdic), lambda cl: cl in nclasses))
     kwargs['finc']=outdic
-    kwargs['nclinc']={k:nclasses[k] for k in nclasses if not k in cl_to_remove}
+    kwargs['nclinc']={k:nclasses[k] for k in nclasses if k in keep}
+    return kwargs
+
+
+def finc_crn(**kwargs):
+    '''
+    finc_syllcount_monte (the numpy engine's statistics) for several sublexicons at once (kwargs['sublexes'], {name: list of words}), against the same lexicon and with common random numbers: one stream of samples the size of the largest sublexicon is drawn, and each sublexicon is scored on the first samsize words of every sample. the draws are made in order (sim.draw_indices with ordered=True), so each prefix is a proper sample of its own size, with or without replacement, weighted or not.
+    since every sublexicon sees the same draws, the differences between them aren't buried in independent Monte Carlo noise, and the syllable and final segment lookups are done once for all of them.
+    returns kwargs with
+        'crn': {name: {'samsize', 'maxsyll', 'natclass', 'joint', 'maxlenth', 'lastnclass', 'nclinc'}}, as finc_syllcount_monte reports them
+        'crn_pairs': {(a, b): {'diff', 'se', 'se_indep'}}: the difference in joint rates, its standard error from the paired draws, and what it would be with independent draws
+    '''
+    seed = kwargs['seed'] if kwargs.get('seed') is not None else 55
+    lex = kwargs['lex']
+    sublexes = kwargs['sublexes']
+    nsamples = kwargs.get('nsamples')
+    replace = not kwargs.get('without_replacement')
+    weights = kwargs.get('weights')
+    vowels = pnc.get_vowels(**kwargs)
+    fclassdic = pnc.featclassdic(**kwargs['nclassdic'])['featclassdic']
+    comp = sim.compile_lex(lex, vowels, fclassdic)
+    classpos = {cl:c for c, cl in enumerate(comp['classes'])}
+    names = list(sublexes)
+    subs = {}
+    for name in names:
+        finals = [sim.word_segs(wd)[-1] for wd in sublexes[name]]
+        submask = sim.tightest_mask(comp, finals)
+        subs[name] = {'samsize':len(sublexes[name]), 'submask':submask,
+                      'maxsyll':max(len([x for x in sim.word_segs(wd) if x in vowels]) for wd in sublexes[name]),
+                      'natclass':next((cl for c, cl in enumerate(comp['classes']) if (comp['classmat'][c]==submask).all()), None),
+                      'absent':[cl for cl in fclassdic if not fclassdic[cl] & set(finals)]}
+    kmax = max(subs[name]['samsize'] for name in names)
+    state = {}
+    for name in names:
+        state[f'joint:{name}'] = 0
+        state[f'maxlenth:{name}'] = {}
+        state[f'lastnclass:{name}'] = {}
+        state[f'absent:{name}'] = {cl:0 for cl in subs[name]['absent']}
+        #how often this sublexicon's joint event happened and each other one's didn't
+        state[f'only:{name}'] = {other:0 for other in names if other!=name}
+    rng = numpy.random.default_rng(seed)
+    table = smp.alias_table(weights) if weights is not None and replace else None
+    batch = kwargs.get('batch') or sim.batch_size(len(lex), kmax)
+    def step(state, n):
+        done = 0
+        while done < n:
+            b = min(batch, n-done)
+            idx = sim.draw_indices(len(lex), kmax, b, rng, replace, weights, table, ordered=True)
+            maxsyll = numpy.maximum.accumulate(comp['syll'][idx], axis=1)
+            first = sim.first_positions(comp['final'][idx], len(comp['segs']))
+            hits = {}
+            for name in names:
+                k = subs[name]['samsize']
+                res = sim.finc_stats(comp, first < k, maxsyll[:, k-1], subs[name]['submask'], subs[name]['maxsyll'])
+                for v, c in zip(*numpy.unique(res['maxsyll'], return_counts=True)):
+                    hist_add(state[f'maxlenth:{name}'], int(v), int(c))
+                for t, c in zip(*numpy.unique(res['tightest'], return_counts=True)):
+                    hist_add(state[f'lastnclass:{name}'], comp['classes'][t] if t>=0 else 'none', int(c))
+                for cl in subs[name]['absent']:
+                    state[f'absent:{name}'][cl] += int(res['absent'][classpos[cl]])
+                state[f'joint:{name}'] += res['joint']
+                hits[name] = res['hit']
+            for name in names:
+                for other in state[f'only:{name}']:
+                    state[f'only:{name}'][other] += int((hits[name] & ~hits[other]).sum())
+            done += b
+    key = sst.make_key(func='finc_crn', lex=lex, weights=weights, sublex=[f"{name}\t{wd}" for name in names for wd in sublexes[name]], featpath=kwargs.get('featpath'), nsamples=nsamples, seed=seed, replace=replace, batch=kwargs.get('batch'), checkpoint=kwargs.get('checkpoint', 10000))
+    state = sst.run_cached(state, step, key=key, rng=rng, **store_opts(kwargs))
+    lattice = pnc.class_lattice(fclassdic)
+    out = {}
+    for name in names:
+        absent = state[f'absent:{name}']
+        keep = set(pnc.maximal_classes(lattice, lambda cl: cl in absent))
+        out[name] = {'samsize':subs[name]['samsize'], 'maxsyll':subs[name]['maxsyll'], 'natclass':subs[name]['natclass'], 'joint':state[f'joint:{name}'],
+                     'maxlenth':state[f'maxlenth:{name}'], 'lastnclass':state[f'lastnclass:{name}'],
+                     'nclinc':{cl:{'sim':absent[cl], 'segs':fclassdic[cl]} for cl in absent if cl in keep}}
+    pairs = {}
+    for i, a in enumerate(names):
+        for bname in names[i+1:]:
+            pa, pb = out[a]['joint']/nsamples, out[bname]['joint']/nsamples
+            discordant = (state[f'only:{a}'][bname] + state[f'only:{bname}'][a])/nsamples
+            pairs[(a, bname)] = {'diff':pa-pb, 'se':numpy.sqrt(max(discordant - (pa-pb)**2, 0)/nsamples),
+                                 'se_indep':numpy.sqrt((pa*(1-pa) + pb*(1-pb))/nsamples)}
+    kwargs['crn'] = out
+    kwargs['crn_pairs'] = pairs
+    return kwargs
+
+
+def finc_sweep(**kwargs):
+    '''
+    how the probabilities finc_syllcount_monte estimates change with the size of the sample, for every size from kwargs['minsize'] (default 5) to kwargs['maxsize'] (default: the size of the sublexicon), in one simulation:
+        syll: no word over the sublexicon's max syllable count
+        class: every final segment in the sublexicon's tightest class
+        joint: both (the numpy engine's 'joint')
+        absent: for each of the largest classes missing from the sublexicon's finals, that no drawn word ends in it
+    each sample is drawn at the largest size, in order (sim.draw_indices with ordered=True), and only the position of the first word that breaks each condition is recorded: a condition holds for the first k words exactly when that position is k or later, so one histogram of positions gives the whole curve.
+    with kwargs['engine']=='exact', the curves come from the binomial/hypergeometric formulas instead.
+    returns kwargs with 'sweep': {'sizes', 'syll', 'class', 'joint', 'absent': {class: [...]}, 'counts' (the numbers of samples behind each, for the numpy engine), 'cap', 'natclass', 'samsize'}
+    '''
+    seed = kwargs['seed'] if kwargs.get('seed') is not None else 55
+    lex = kwargs['lex']
+    sublex = kwargs['sublex']
+    nsamples = kwargs.get('nsamples')
+    replace = not kwargs.get('without_replacement')
+    weights = kwargs.get('weights')
+    vowels = pnc.get_vowels(**kwargs)
+    fclassdic = pnc.featclassdic(**kwargs['nclassdic'])['featclassdic']
+    comp = sim.compile_lex(lex, vowels, fclassdic)
+    finals = [sim.word_segs(wd)[-1] for wd in sublex]
+    submask = sim.tightest_mask(comp, finals)
+    cap = max(len([x for x in sim.word_segs(wd) if x in vowels]) for wd in sublex)
+    absent = [cl for cl in fclassdic if not fclassdic[cl] & set(finals)]
+    absent = pnc.maximal_classes(pnc.class_lattice(fclassdic), lambda cl: cl in absent)
+    classpos = {cl:c for c, cl in enumerate(comp['classes'])}
+    nmax = kwargs.get('maxsize') or len(sublex)
+    sizes = list(range(min(kwargs.get('minsize') or 5, nmax), nmax+1))
+    good = {'syll':comp['syll'] <= cap, 'class':submask[comp['final']]}
+    good['joint'] = good['syll'] & good['class']
+    for cl in absent:
+        good[cl] = ~comp['classmat'][classpos[cl]][comp['final']]
+    sweep = {'sizes':sizes, 'cap':cap, 'samsize':len(sublex),
+             'natclass':next((cl for c, cl in enumerate(comp['classes']) if (comp['classmat'][c]==submask).all()), None)}
+    if kwargs.get('engine')=='exact':
+        curves = {name:[float(sim.subset_prob(g, k, replace, weights)) for k in sizes] for name, g in good.items()}
+    else:
+        state = {name:{} for name in good}
+        rng = numpy.random.default_rng(seed)
+        table = smp.alias_table(weights) if weights is not None and replace else None
+        batch = kwargs.get('batch') or sim.batch_size(len(lex), nmax)
+        def step(state, n):
+            done = 0
+            while done < n:
+                b = min(batch, n-done)
+                idx = sim.draw_indices(len(lex), nmax, b, rng, replace, weights, table, ordered=True)
+                for name, g in good.items():
+                    bad = ~g[idx]
+                    #the position of the first word that breaks the condition, nmax if none does
+                    first = numpy.where(bad.any(axis=1), bad.argmax(axis=1), nmax)
+                    for v, c in zip(*numpy.unique(first, return_counts=True)):
+                        hist_add(state[name], int(v), int(c))
+                done += b
+        key = sst.make_key(func='finc_sweep', lex=lex, weights=weights, sublex=sublex, featpath=kwargs.get('featpath'), maxsize=nmax, nsamples=nsamples, seed=seed, replace=replace, batch=kwargs.get('batch'), checkpoint=kwargs.get('checkpoint', 10000))
+        state = sst.run_cached(state, step, key=key, rng=rng, **store_opts(kwargs))
+        counts = {}
+        for name in good:
+            hold = numpy.zeros(nmax+2, dtype=numpy.int64)
+            for v, c in state[name].items():
+                hold[v] += c
+            #samples in which the condition still holds after k words: those whose first break is at position k or later
+            survive = numpy.cumsum(hold[::-1])[::-1]
+            counts[name] = [int(survive[k]) for k in sizes]
+        curves = {name:[c/nsamples for c in counts[name]] for name in counts}
+        sweep['counts'] = counts
+    for name in ('syll', 'class', 'joint'):
+        sweep[name] = curves[name]
+    sweep['absent'] = {cl:curves[cl] for cl in absent}
+    kwargs['sweep'] = sweep
+    return kwargs
+
+
+def write_sweep(sweep, outpath, nsamples=None, method='clopper-pearson'):
+    '''
+    the finc_sweep curves as a table, one row per size, with an interval for the joint probability if it was simulated
+    '''
+    absent = list(sweep['absent'])
+    if 'counts' in sweep:
+        lo, hi = sts.binom_ci(numpy.array(sweep['counts']['joint']), nsamples, method)
+    with open(outpath, 'w', encoding='utf-8') as f:
+        f.write('\t'.join(['SIZE', 'P_SYLL', 'P_CLASS', 'P_JOINT'] + (['JOINT_LOW', 'JOINT_HIGH'] if 'counts' in sweep else []) + [f'ABSENT:{cl}' for cl in absent]) + '\n')
+        for i, k in enumerate(sweep['sizes']):
+            row = [str(k)] + [f"{sweep[name][i]:.6g}" for name in ('syll', 'class', 'joint')]
+            if 'counts' in sweep:
+                row += [f"{lo[i]:.6g}", f"{hi[i]:.6g}"]
+            row += [f"{sweep['absent'][cl][i]:.6g}" for cl in absent]
+            f.write('\t'.join(row) + '\n')
+
+
+def restriction_scan(**kwargs):
+    '''
+    scores every restriction of the kind finc_syllcount_monte tests (all final segments in one natural class, no word longer than a syllable cap) at once, with the exact formulas: the chance that a sample of samsize words (default: the size of the sublexicon) from the lexicon satisfies it.
+    caps run from 1 to the longest word in the lexicon, or kwargs['caps']. weighted draws need replacement, as with the exact engine.
+    returns kwargs with 'scan': a list of {'class', 'segs', 'cap', 'words', 'p', 'satisfied'}, the restrictions the sublexicon satisfies first, least probable first; then the rest, by p
+    '''
+    lex = kwargs['lex']
+    sublex = kwargs['sublex']
+    samsize = kwargs.get('samsize') or len(sublex)
+    replace = not kwargs.get('without_replacement')
+    vowels = pnc.get_vowels(**kwargs)
+    fclassdic = pnc.featclassdic(**kwargs['nclassdic'])['featclassdic']
+    comp = sim.compile_lex(lex, vowels, fclassdic)
+    caps = numpy.asarray(kwargs.get('caps') or range(1, int(comp['syll'].max())+1))
+    inside, probs = sim.scan_probs(comp, caps, samsize, replace, kwargs.get('weights'))
+    subfinals = set(sim.word_segs(wd)[-1] for wd in sublex)
+    submax = max(len([x for x in sim.word_segs(wd) if x in vowels]) for wd in sublex)
+    rows = []
+    for c, cl in enumerate(comp['classes']):
+        covers = subfinals <= fclassdic[cl]
+        for j, cap in enumerate(caps):
+            rows.append({'class':cl, 'segs':fclassdic[cl], 'cap':int(cap), 'words':int(inside[c, j]), 'p':float(probs[c, j]), 'satisfied':bool(covers and submax <= cap)})
+    kwargs['scan'] = sorted(rows, key=lambda r: (not r['satisfied'], r['p']))
     return kwargs
 
 
+def write_scan(rows, outpath):
+    with open(outpath, 'w', encoding='utf-8') as f:
+        f.write("CLASS\tSIZE\tCAP\tWORDS\tP\tSATISFIED\n")
+        for r in rows:
+            f.write(f"{r['class']}\t{len(r['segs'])}\t{r['cap']}\t{r['words']}\t{r['p']:.6g}\t{r['satisfied']}\n")
+
+
+def stat_monte(**kwargs):
+    '''
+    a Monte Carlo simulation for any set of word predicates (kwargs['stats'], a list of specs such as 'final=-son' or 'syll<=3&stress=-1', see simengine.parse_stat).
+    each stat is compiled into a column over the lexicon once, and the samples are drawn and scored in batches (the numpy engine), or not drawn at all (the exact engine: binomial/hypergeometric counts).
+    for every stat, this keeps a histogram of how many words in a sample satisfy it, and compares it to the number of words in the sublexicon that do:
+        sublex: the sublexicon's count
+        mean: the mean count in the simulations
+        p_absent, p_all: the proportion of samples in which no word / every word satisfied the stat
+        p_low, p_high: the proportion of samples with a count <= / >= the sublexicon's (one-sided Monte Carlo p-values)
+    needs kwargs['featdic'] as well as lex, sublex, nsamples
+    '''
+    seed = kwargs['seed'] if kwargs.get('seed') is not None else 55
+    lex = kwargs.get('lex')
+    sublex = kwargs.get('sublex')
+    specs = kwargs.get('stats')
+    nsamples = kwargs.get('nsamples')
+    samsize = kwargs.get('samsize') or len(sublex)
+    engine = kwargs.get('engine', 'numpy')
+    replace = not kwargs.get('without_replacement')
+    weights = kwargs.get('weights')
+    cols = sim.compile_stats(lex, specs, kwargs['featdic'])
+    observed = sim.compile_stats(sublex, specs, kwargs['featdic']).sum(axis=0)
+    names = [f'stat{j}' for j in range(len(specs))]
+    outdic = {name:{} for name in names}
+    if engine=='exact':
+        for j, name in enumerate(names):
+            share = float(numpy.asarray(weights) @ cols[:, j])/float(numpy.sum(weights)) if weights is not None else None
+            pmf = sim.count_dist(int(cols[:, j].sum()), len(lex), samsize, replace, share)
+            outdic[name] = {c:float(p)*nsamples for c, p in enumerate(pmf) if p > 0}
+    else:
+        if engine=='python':
+            print("stat simulations have no python engine; using numpy")
+        rng = numpy.random.default_rng(seed)
+        table = smp.alias_table(weights) if weights is not None and replace else None
+        batch = kwargs.get('batch') or sim.batch_size(len(lex), samsize*len(specs))
+        def step(outdic, n):
+            done = 0
+            while done < n:
+                b = min(batch, n-done)
+                counts = sim.stat_batch(cols, sim.draw_indices(len(lex), samsize, b, rng, replace, weights, table))
+                for j, name in enumerate(names):
+                    for v, c in zip(*numpy.unique(counts[:, j], return_counts=True)):
+                        hist_add(outdic[name], int(v), int(c))
+                done += b
+        key = sst.make_key(func='stat_monte', lex=lex, weights=weights, sublex=sublex, featpath=kwargs.get('featpath'), stats=list(specs), nsamples=nsamples, seed=seed, engine='numpy', replace=replace, batch=kwargs.get('batch'), checkpoint=kwargs.get('checkpoint', 10000))
+        outdic = sst.run_cached(outdic, step, key=key, rng=rng, **store_opts(kwargs))
+    kwargs['statsims'] = {spec:stat_summary(outdic[name], obs, samsize) for spec, name, obs in zip(specs, names, observed)}
+    return kwargs
+
+
+def stat_summary(hist, obs, samsize):
+    '''
+    the stat_monte numbers for one stat, from its histogram of simulated counts and the sublexicon's count
+    '''
+    total = sum(hist.values())
+    return {'sublex':int(obs), 'mean':hist_mean(hist), 'hist':hist,
+            'p_absent':hist.get(0, 0)/total, 'p_all':hist.get(samsize, 0)/total,
+            'p_low':sum(c for v, c in hist.items() if v<=obs)/total,
+            'p_high':sum(c for v, c in hist.items() if v>=obs)/total}
+
+
 def analyze_word(**kwargs):
     '''
     return some specified property of the word (e.g., the last segment or a series of ngrams it contains)
     current options include:
     "last": last segment of the word. (string)
-    "ngrams": supplied with integer value. returns a list of segments of length N, padded with pound signs for word edges. 
+    "syllcount": number of vowels
+    plus everything in simengine.word_props ("initial", "penult", "stresspos", "xgrid", and "cv" if kwargs['consonants'] is given), which the predicates of stat_monte are built from
     '''
     vowels = kwargs.get('vowels') # should be a set
-    wdsegs = kwargs.get('word').strip("# ").split(' ')
-    return {'last':wdsegs[-1], 'syllcount':len([x for x in wdsegs if x in vowels])}    
+    props = sim.word_props(kwargs.get('word'), vowels, kwargs.get('stress', ()), kwargs.get('consonants'))
+    props['last'] = props['final']
+    return props
 
 def run_segsyll_monte(**kwargs):
     '''
@@ -140,30 +539,60 @@ def run_segsyll_monte(**kwargs):
 
 def runsim(**kwargs):
     '''
-    runs the monte carlo simulation that focuses on syllable count/size and plots the results
+    runs the monte carlo simulation that focuses on syllable count/size and plots the results into kwargs['plotdir'] (default plotter.plotdir_default), without showing them
     '''
     sim = ransample(**kwargs)
-    ci = ci_long(sim['max_length'])
+    ci = sim_ci(sim['max_length'], **kwargs)
     for k in sim:
-        print(f'{k}\t{numpy.mean(sim[k])}')
+        print(f'{k}\t{hist_mean(sim[k])}')
     print(f'confidence intervals: {ci}')
-    plotter.plot_sim_with_ci(sim['max_length'], ci, abline=kwargs.get('maxsize'), fname=kwargs.get('fname'), color=kwargs.get('color'))
+    if kwargs.get('ci', 'normal')=='normal':
+        print(f"bootstrap BCa interval for the mean max length: {sts.bootstrap_ci(sim['max_length'], method='bca', seed=kwargs.get('seed'))}")
+    over = sim['number_over_maxsize'].get(1, 0)
+    print(f"proportion of samples over the sublexicon's max length: {over/kwargs['nsamples']:.5f}, 95% Clopper-Pearson interval {sts.binom_ci(round(over), kwargs['nsamples'])}")
+    if kwargs.get('histdir'):
+        write_hist(sim['max_length'], os.path.join(kwargs['histdir'], f"{kwargs.get('fname')}_max_length.txt"))
+    outdir = kwargs.get('plotdir') or plotter.plotdir_default
+    os.makedirs(outdir, exist_ok=True)
+    plotter.plot_sim_with_ci(sim['max_length'], ci, abline=kwargs.get('maxsize'), fname=kwargs.get('fname'), color=kwargs.get('color'), show=False, outdir=outdir)
+
+def sim_ci(hist, **kwargs):
+    '''
+    the confidence interval for the mean of a simulated histogram, by kwargs['ci']: 'normal' (ci_long, the default), 'percentile' or 'bca' (bootstrap, see simstats.py)
+    '''
+    method = kwargs.get('ci', 'normal')
+    if method=='normal':
+        return ci_long(hist)
+    return sts.bootstrap_ci(hist, method=method, seed=kwargs.get('seed'))
 
 def ci_long(inlist):
     '''
     manual method for confidence interval calculation
+    takes either a list of values or a histogram {value: count}
     '''
-    mean = sum(inlist)/len(inlist)
-    std = numpy.std(inlist)
-    lowerb = mean-1.96*(std/numpy.sqrt(len(inlist)))
-    upperb = mean+1.96*(std/numpy.sqrt(len(inlist)))
+    if isinstance(inlist, dict):
+        vals = numpy.array(list(inlist.keys()), dtype=float)
+        counts = numpy.array(list(inlist.values()), dtype=float)
+    else:
+        vals = numpy.asarray(inlist, dtype=float)
+        counts = numpy.ones(len(vals))
+    n = counts.sum()
+    mean = (vals*counts).sum()/n
+    std = numpy.sqrt((counts*(vals-mean)**2).sum()/n)
+    lowerb = mean-1.96*(std/numpy.sqrt(n))
+    upperb = mean+1.96*(std/numpy.sqrt(n))
     return (lowerb, upperb)
 
 def plot_hist(values, ci, bins=30):
     '''
     plots the frequency of your chosen feature's occurrence in a histogram, with confidence intervals marked in red.
+    values can be a list or a histogram {value: count}
     '''
-    fig = plt.hist(values, bins)
+    import matplotlib.pyplot as plt
+    if isinstance(values, dict):
+        fig = plt.hist(list(values.keys()), bins, weights=list(values.values()))
+    else:
+        fig = plt.hist(values, bins)
     plt.axvline(ci[0], color='r')
     plt.axvline(ci[1], color='r')
     plt.show()
@@ -171,16 +600,199 @@ def plot_hist(values, ci, bins=30):
     plt.close()
 
 def fisher_test(nums):
-    x = scipy.stats.fisher_exact(nums)
+    x = stats.fisher_exact(nums)
     print(f'fisher exact test: {x[0]}, p = {x[1]:5f}')
     return x 
 
 def chisq(nums):
-    x = scipy.stats.chi2_contingency(nums)
+    x = stats.chi2_contingency(nums)
     #x[0] is odds ratio; x[1] is p val; x[2] is degs of freedom
     print(f'X2{x[2]} = {x[0]}, p={x[1]}')
     return x
 
+def read_lsub_table(path):
+    '''
+    reads an NGRAM/LEX/SUBLEX table, as written by segments.py --countall or prosody.py --lex, back into the {ngram: {'lex':.., 'sublex':..}} format
+    '''
+    outdic = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        header = f.readline()
+        for line in f:
+            line = line.rstrip('\n').split('\t')
+            if len(line)>2:
+                outdic[line[0]] = {'lex':int(line[1]), 'sublex':int(line[2])}
+    return outdic
+
+def bh_correct(pvals):
+    '''
+    Benjamini-Hochberg adjusted p values (false discovery rate) for an array of p values, in the original order
+    '''
+    pvals = numpy.asarray(pvals, dtype=float)
+    n = len(pvals)
+    if n==0:
+        return pvals
+    order = numpy.argsort(pvals)
+    ranked = pvals[order]*n/numpy.arange(1, n+1)
+    ranked = numpy.minimum.accumulate(ranked[::-1])[::-1]
+    qvals = numpy.empty(n)
+    qvals[order] = numpy.minimum(ranked, 1)
+    return qvals
+
+def batch_fisher(a, b, c, d, chunk=2**22):
+    '''
+    two-sided fisher exact test for many 2x2 tables [[a, b], [c, d]] at once (each argument is an array with one value per table).
+    same logic as scipy.stats.fisher_exact: the p value sums the hypergeometric probabilities of all the tables with the same margins that are no more likely than the observed one.
+    tables are grouped by the width of their support, and each group is evaluated as one padded matrix of log probabilities, about chunk cells at a time.
+    '''
+    a, b, c, d = [numpy.asarray(x, dtype=numpy.int64) for x in (a, b, c, d)]
+    M = a+b+c+d
+    n = a+c
+    N = a+b
+    lo = numpy.maximum(0, N-(M-n))
+    hi = numpy.minimum(n, N)
+    def logpmf(x, M, n, N):
+        return (special.gammaln(n+1) - special.gammaln(x+1) - special.gammaln(n-x+1)
+                + special.gammaln(M-n+1) - special.gammaln(N-x+1) - special.gammaln(M-n-N+x+1)
+                - special.gammaln(M+1) + special.gammaln(N+1) + special.gammaln(M-N+1))
+    thr = logpmf(a, M, n, N) + numpy.log1p(1e-7)
+    pvals = numpy.ones(len(a))
+    width = hi-lo+1
+    order = numpy.argsort(width, kind='stable')
+    start = 0
+    while start < len(order):
+        stop = start+1
+        while stop < len(order) and (stop-start+1)*width[order[stop]] <= chunk:
+            stop += 1
+        rows = order[start:stop]
+        w = width[rows].max()
+        xs = lo[rows,None] + numpy.arange(w)
+        valid = xs <= hi[rows,None]
+        xs = numpy.minimum(xs, hi[rows,None])
+        lp = logpmf(xs, M[rows,None], n[rows,None], N[rows,None])
+        pvals[rows] = numpy.where(valid & (lp <= thr[rows,None]), numpy.exp(lp), 0).sum(axis=1)
+        start = stop
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        odds = (a*d)/(b*c)
+    return odds, numpy.minimum(pvals, 1)
+
+def batch_chisq(a, b, c, d):
+    '''
+    chi square test (1 degree of freedom, with the Yates correction that scipy.stats.chi2_contingency applies to 2x2 tables) for many 2x2 tables [[a, b], [c, d]] at once
+    '''
+    obs = numpy.stack([numpy.asarray(x, dtype=float) for x in (a, b, c, d)], axis=1)
+    M = obs.sum(axis=1)
+    rows = numpy.stack([obs[:,0]+obs[:,1], obs[:,0]+obs[:,1], obs[:,2]+obs[:,3], obs[:,2]+obs[:,3]], axis=1)
+    cols = numpy.stack([obs[:,0]+obs[:,2], obs[:,1]+obs[:,3], obs[:,0]+obs[:,2], obs[:,1]+obs[:,3]], axis=1)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        expected = rows*cols/M[:,None]
+        diff = numpy.abs(expected-obs)
+        diff = diff - numpy.minimum(0.5, diff)
+        stat = (diff**2/expected).sum(axis=1)
+        odds = (obs[:,0]*obs[:,3])/(obs[:,1]*obs[:,2])
+    stat = numpy.where(numpy.isfinite(stat), stat, 0)
+    return stat, odds, stats.chi2.sf(stat, 1)
+
+def batch_contingency(**kwargs):
+    '''
+    runs a fisher exact (kwargs['test']='fisher', the default) or chi square ('chisq') test on every row of a LEX/SUBLEX ngram table (kwargs['lsub'], as made by segments.lexsublex_seg_ngrams or prosody.lexsublex_pros_ngrams), and corrects the p values for multiple comparisons with Benjamini-Hochberg.
+    each ngram gets the table [[sublex count, other sublex ngrams], [lex count, other lex ngrams]], where the totals are over ngrams of the same length.
+    returns kwargs with 'contingency': a list of dicts sorted by p value.
+    '''
+    lsub = kwargs.get('lsub')
+    test = kwargs.get('test', 'fisher')
+    grams = list(lsub)
+    order = numpy.array([len(g.split(" ")) for g in grams])
+    lexc = numpy.array([lsub[g]['lex'] for g in grams], dtype=numpy.int64)
+    subc = numpy.array([lsub[g]['sublex'] for g in grams], dtype=numpy.int64)
+    lextot = numpy.zeros(len(grams), dtype=numpy.int64)
+    subtot = numpy.zeros(len(grams), dtype=numpy.int64)
+    for n in numpy.unique(order):
+        lextot[order==n] = lexc[order==n].sum()
+        subtot[order==n] = subc[order==n].sum()
+    a, b, c, d = subc, subtot-subc, lexc, lextot-lexc
+    if test=='chisq':
+        stat, odds, pvals = batch_chisq(a, b, c, d)
+    else:
+        odds, pvals = batch_fisher(a, b, c, d)
+        stat = odds
+    qvals = bh_correct(pvals)
+    out = [{'ngram':g, 'lex':int(lexc[i]), 'sublex':int(subc[i]), 'odds':odds[i], 'stat':stat[i], 'p':pvals[i], 'q':qvals[i]} for i, g in enumerate(grams)]
+    out.sort(key=lambda x: (x['p'], x['ngram']))
+    if kwargs.get('verbosity', 1)>0:
+        print(f"{test}: {len(out)} ngrams tested, {len([x for x in out if x['q']<0.05])} significant at FDR 0.05")
+    kwargs['contingency'] = out
+    return kwargs
+
+def write_contingency(rows, outpath):
+    with open(outpath, 'w', encoding='utf-8') as f:
+        f.write("NGRAM\tLEX\tSUBLEX\tODDS\tSTAT\tP\tQ_BH\n")
+        for r in rows:
+            f.write(f"{r['ngram']}\t{r['lex']}\t{r['sublex']}\t{r['odds']:.4g}\t{r['stat']:.4g}\t{r['p']:.4g}\t{r['q']:.4g}\n")
+    print(f"results written to {outpath}")
+
+def perm_ngram_test(**kwargs):
+    '''
+    permutation test for ngrams that are missing or underrepresented in the sublexicon.
+    draws kwargs['nsamples'] random subsets of the lexicon that are the same size as the sublexicon (without replacement) and, for every ngram at once, counts how often a random subset has as few occurrences of the ngram as the sublexicon does.
+    lexicon and sublexicon are integer-encoded as sparse word-by-ngram matrices (kwargs['ngram_type'] is 'seg', 'cv' or 'xgrid'), and each batch of subsets is a sparse selection matrix, so a batch of draws is one sparse matrix product instead of a loop over ngrams and samples.
+    returns kwargs with 'perm_ngrams': {ngram: {'lex', 'sublex', 'expected', 'p_absent', 'p'}}, where p is the (add-one) probability of a count at or below the sublexicon's, and p_absent is the proportion of subsets lacking the ngram altogether.
+    '''
+    nsamples = kwargs.get('nsamples', 1000)
+    ngram_type = kwargs.get('ngram_type', 'seg')
+    verbosity = kwargs.get('verbosity', 1)
+    rng = numpy.random.default_rng(kwargs['seed'] if kwargs.get('seed') is not None else 26)
+    if ngram_type=='seg':
+        fnc = sgs.seg_ngram_incidence
+        extra = {}
+    else:
+        fnc = pros.pros_ngram_incidence
+        extra = {'featpath':kwargs['featpath'], 'CV':ngram_type=='cv', 'xgrids':ngram_type=='xgrid', 'ignore_stress':kwargs.get('ignore_stress')}
+    lexinc = fnc(words=sorted(kwargs['lex']), **extra)
+    X = lexinc['incidence']
+    index = lexinc['ngram_index']
+    subinc = fnc(words=sorted(kwargs['sublex']), ngram_index=index, **extra)
+    obs = numpy.asarray(subinc['incidence'].sum(axis=0)).ravel()
+    lexcounts = numpy.asarray(X.sum(axis=0)).ravel()
+    nwords, nngrams = X.shape
+    samsize = subinc['incidence'].shape[0]
+    if samsize > nwords:
+        print(f"The sublexicon ({samsize} words) is bigger than the lexicon ({nwords} words), so it cannot be a sample of it")
+        return kwargs
+    #enough subsets per batch to keep the random keys to about 16M floats
+    batch = kwargs.get('batch', max(1, min(nsamples, 2**24//nwords)))
+    at_or_below = numpy.zeros(nngrams, dtype=numpy.int64)
+    absent = numpy.zeros(nngrams, dtype=numpy.int64)
+    total = numpy.zeros(nngrams, dtype=numpy.float64)
+    done = 0
+    while done < nsamples:
+        b = min(batch, nsamples-done)
+        #random keys + argpartition = b subsets of size samsize drawn without replacement
+        idx = numpy.argpartition(rng.random((b, nwords)), samsize-1, axis=1)[:, :samsize]
+        S = sparse.csr_matrix((numpy.ones(b*samsize, dtype=numpy.int32), (numpy.repeat(numpy.arange(b), samsize), idx.ravel())), shape=(b, nwords))
+        sims = (S @ X).tocsc()
+        sims.eliminate_zeros()
+        cols = numpy.repeat(numpy.arange(nngrams), numpy.diff(sims.indptr))
+        #unstored entries are zero, which is always at or below the observed count
+        above = numpy.bincount(cols[sims.data > obs[cols]], minlength=nngrams)
+        at_or_below += b - above
+        absent += b - numpy.diff(sims.indptr)
+        total += numpy.asarray(sims.sum(axis=0)).ravel()
+        done += b
+        if verbosity>1:
+            print(f"{done}/{nsamples} subsets drawn")
+    outdic = {}
+    for ngram, col in index.items():
+        outdic[ngram] = {'lex':int(lexcounts[col]),
+                         'sublex':int(obs[col]),
+                         'expected':total[col]/nsamples,
+                         'p_absent':absent[col]/nsamples,
+                         'p':(at_or_below[col]+1)/(nsamples+1)}
+    if verbosity>0:
+        missing = [k for k in outdic if outdic[k]['sublex']==0]
+        print(f"{len(outdic)} ngrams tested in {nsamples} permutations; {len(missing)} are absent from the sublexicon, {len([k for k in missing if outdic[k]['p']<0.05])} of them with p < 0.05")
+    kwargs['perm_ngrams'] = outdic
+    return kwargs
+
 def compare_dists(**kwargs): 
     '''
     suppose we have a sublexicon where only words that look like x and xx occur.
@@ -189,7 +801,8 @@ def compare_dists(**kwargs):
     lexicon dic: {'x': 1000, 'xx': 2000, 'xxx': 300, 'xxxx': 200}
     this function will sample 50 words (length of sublexicon dic: 30 + 20) from the types of "words" that occur in the lexicon dic, 10,000 times. we'll see how often we get a distribution like that in the sublexicon
     '''
-    random.seed(5)
+    seed = kwargs['seed'] if kwargs.get('seed') is not None else 5
+    random.seed(seed)
     sublex = kwargs.get('sublex')
     lex = kwargs.get('lex')
     lensublex = sum(sublex.values())
@@ -204,44 +817,77 @@ def compare_dists(**kwargs):
         print(f"\nLexicon: {lenlex}")
         for x in sorted(lex):
             print(f"{x}\t{lex[x]}\t{round(100*(lex[x]/lenlex),1)}%")
-    findic = {}.fromkeys(lex.keys(), 0)
     nsamples = kwargs.get('nsamples', 100)
     dumblex = []
-    poshits = 0
-    if customnumber:
-        custdix = {}
+    #running counts, kept together so the simulation can be checkpointed and resumed
+    state = {'findic':{}.fromkeys(lex.keys(), 0), 'poshits':0, 'custdix':{}}
     #now sample from the summary lexicon: if there are 20 words of length x, the likelihood of hitting that length is 20/length of lex (note, this samples only abstract descriptions of the words, not the words themselves. thus, 'x' not 'cat', or 'xx' and not 'doggy')
-    #this re-inflates the dictionary into a list with the same abstract structure.
-    for wd in lex:
+    #this re-inflates the dictionary into a list with the same abstract structure. (sorted, so that a given seed always gives the same draws)
+    for wd in sorted(lex):
         for i in range(lex[wd]):
             dumblex.append(wd)
-    if verbosity>2:
+    engine = kwargs.get('engine', 'python')
+    replace = not kwargs.get('without_replacement')
+    if verbosity>2 and engine=='python':
         print("\nHere are the individual sims\n\n")
-    for n in range(nsamples):
-        wds = random.choices(dumblex, k=lensublex) #this is the randomly drawn list for this iteration in the simulation
-        owds = {}.fromkeys(wds, 0)
-        if verbosity>2:
-            print(max([len(x.replace(" ","")) for x in owds]))
-        #now count how often the list includes the same types of x-grids as in the sublexicon.
-        for wd in wds:
-            owds[wd]+=1
-            findic[wd]+=1
-        if verbosity>2:
-            for wd in sorted(owds):
-                print(f'{wd}\t{owds[wd]}')
-            print('\n\n')
-        if set(wds)==set(sublex.keys()):
-            poshits+=1
+    draw = smp.make_drawer(dumblex, replace=replace)
+    def step(state, n):
+        findic, custdix = state['findic'], state['custdix']
+        for i in range(n):
+            wds = draw(lensublex) #this is the randomly drawn list for this iteration in the simulation
+            owds = {}.fromkeys(wds, 0)
+            if verbosity>2:
+                print(max([len(x.replace(" ","")) for x in owds]))
+            #now count how often the list includes the same types of x-grids as in the sublexicon.
+            for wd in wds:
+                owds[wd]+=1
+                findic[wd]+=1
+            if verbosity>2:
+                for wd in sorted(owds):
+                    print(f'{wd}\t{owds[wd]}')
+                print('\n\n')
+            if set(wds)==set(sublex.keys()):
+                state['poshits']+=1
+            if customnumber:
+                if max([len(wd.replace(" ","")) for wd in owds])==customnumber:
+                    hist_add(custdix, ','.join(sorted({wd.replace(" ","") for wd in owds})))
+            # and here, we do a manual/ad-hoc assessment of whether the monte carlo draw results in the same distrib as the extended sublexicon. this requires an extra switch:
+    rng = None
+    if engine=='numpy':
+        rng = numpy.random.default_rng(seed)
+        types = sorted(lex)
+        dumbtypes = numpy.repeat(numpy.arange(len(types)), [lex[t] for t in types])
+        submask = numpy.array([t in sublex for t in types])
+        typelens = numpy.array([len(t.replace(" ","")) for t in types])
+        batch = kwargs.get('batch') or sim.batch_size(len(dumbtypes), lensublex)
+        def step(state, n):
+            done = 0
+            while done < n:
+                b = min(batch, n-done)
+                drawn = dumbtypes[sim.draw_indices(len(dumbtypes), lensublex, b, rng, replace)]
+                for t, c in enumerate(numpy.bincount(drawn.ravel(), minlength=len(types))):
+                    state['findic'][types[t]] += int(c)
+                P = sim.presence(drawn, len(types))
+                state['poshits'] += int((P == submask[None, :]).all(axis=1).sum())
+                if customnumber:
+                    capped = P[numpy.where(P, typelens[None, :], 0).max(axis=1)==customnumber]
+                    if len(capped):
+                        rows, counts = numpy.unique(capped, axis=0, return_counts=True)
+                        for row, c in zip(rows, counts):
+                            hist_add(state['custdix'], ','.join(sorted({types[t].replace(" ","") for t in numpy.flatnonzero(row)})), int(c))
+                done += b
+    if engine=='exact':
+        #expected counts: each draw picks a type in proportion to its token count
+        state['findic'] = {wd:nsamples*lensublex*lex[wd]/lenlex for wd in lex}
+        state['poshits'] = nsamples*sim.exactly_types_prob(lex, list(sublex), lensublex, replace)
         if customnumber:
-            if max([len(wd.replace(" ","")) for wd in owds])==customnumber:
-                k = ','.join({wd.replace(" ","") for wd in owds})
-                if k in custdix:
-                    custdix[k]+=1
-                else:
-                    custdix[k]=1
-        # and here, we do a manual/ad-hoc assessment of whether the monte carlo draw results in the same distrib as the extended sublexicon. this requires an extra switch:
+            print("the exact engine doesn't break down draws by length cap; use the numpy engine for --customnumber")
+    else:
+        key = sst.make_key(func='compare_dists', lex=lex, sublex=sublex, customnumber=customnumber, nsamples=nsamples, seed=seed, engine=engine, replace=replace, batch=kwargs.get('batch'), checkpoint=kwargs.get('checkpoint', 10000))
+        state = sst.run_cached(state, step, key=key, rng=rng, **store_opts(kwargs))
+    findic, poshits, custdix = state['findic'], state['poshits'], state['custdix']
     print('\n\n\n')
-    ratio = round(poshits/nsamples, 2)
+    ratio = round(poshits/nsamples, 6 if engine=='exact' else 2)
     print(f"Number of draws with the same inventory as sublexicon: {poshits}")
     print(f'Ratio: {ratio}')
     if customnumber:
@@ -258,14 +904,24 @@ def compare_dists(**kwargs):
 
 
 def ld_process(**kwargs):
-    with open(kwargs['ld'], 'r', encoding='utf-8') as f:
-        ld = set()
-        for line in f:
-            ld.add("# " + line.strip() + " #")
-    kwargs['ld']=ld
+    kwargs['ld']=set(ldr.stream_ld(ld=kwargs['ld'], verbosity=kwargs.get('verbosity', 1)))
     return kwargs
 
 
+def lexicon_weights(words, **kwargs):
+    '''
+    the sampling weights for words (every line of the lexicon in kwargs['ld'], in order, as ldr.read_ld returns them) as a numpy array, joined to the frequencies as kwargs['weighting'] says (see sampling.freq_weights); None if kwargs['weighting'] is 'none' or missing
+    '''
+    if kwargs.get('weighting', 'none')=='none':
+        return None
+    pairs = smp.freq_weights(**kwargs)
+    if pairs is None:
+        raise ValueError("could not join frequencies to the lexicon; try --freqcat")
+    if [w for w, x in pairs]!=list(words):
+        raise ValueError(f"the words to weight are not the lines of {kwargs['ld']}")
+    return numpy.array([x for w, x in pairs])
+
+
 if __name__=="__main__":
     import argparse
     basepath=os.path.dirname(os.getcwd())
@@ -280,15 +936,50 @@ if __name__=="__main__":
     parser.add_argument("--customnumber", help="enter a cap for max number of syllables to compare monte carlo distributions to (e.g., 3)", type=int, default=None)
     parser.add_argument("--plotsims", help="run a monte carlo simulation with a given lexicon and sublexicon, and plot the results", type=bool, default=False)
     parser.add_argument('--last', help="run a monte carlo simulation with a lexicon and sublexicon and count how often segments occur in stem-final position.", type=bool, default=None)
+    parser.add_argument('--seed', help="random seed for the simulations (default: each simulation's own fixed seed)", type=int, default=None)
+    parser.add_argument('--store', help="a directory for caching simulation results: finished runs with the same lexicon, sublexicon, features, nsamples, seed, engine, batch and checkpoint sizes are loaded instead of re-run, and interrupted runs resume from their last checkpoint", type=str, default=None)
+    parser.add_argument('--checkpoint', help="with --store, save progress every this many samples (default 10,000)", type=int, default=10000)
+    parser.add_argument('--engine', help="how to run the simulations: python (one sample at a time, the default), numpy (compiled lexicon, batched draws), or exact (closed-form binomial/hypergeometric expectations, no sampling)", type=str, default='python', choices=['python', 'numpy', 'exact'])
+    parser.add_argument('--without_replacement', help="draw simulated sublexicons without replacement, so that no word occurs twice in a sample", type=bool, default=False)
+    parser.add_argument('--weighting', help="how to weight words in --plotsims and --last draws: none (uniform over types, the default), freq (ipm from the Sharoff list), or logfreq (log(1+ipm))", type=str, default='none', choices=['none', 'freq', 'logfreq'])
+    parser.add_argument('--freqpath', help="the frequency list to join for --weighting (default: data/raw_searches/sharoff_freq.txt)", type=str, default=smp.freqpath_default)
+    parser.add_argument('--freqcat', help="part of speech (noun, adj, ...) whose Sharoff lemmas are joined to a lexicon without a lemma column: line by line if the counts agree, otherwise by transcription (see translit.py)", type=str, default=None)
+    parser.add_argument('--histdir', help="a directory to save the simulated max length histograms in (from --plotsims and --last), so they can be re-plotted with --plothist", type=str, default=None)
+    parser.add_argument('--examples', help="with --last, also list up to this many lexicon words ending in each class that is absent from the sublexicon", type=int, default=0)
+    parser.add_argument('--importance', help="with --last, also estimate the joint probability by importance sampling: draws tilted toward words within the sublexicon's syllable cap and final class, reweighted by likelihood ratios. for joint probabilities far below 1/nsamples", type=bool, default=False)
+    parser.add_argument('--tilt', help="with --importance, the share of tilted draws that go to those words (default 1: all of them)", type=float, default=1.0)
+    parser.add_argument('--ci', help="the confidence interval for simulated means in --plotsims and --plothist: normal (the default), percentile or bca (bootstrap)", type=str, default='normal', choices=['normal', 'percentile', 'bca'])
+    parser.add_argument('--binom_ci', help="the interval for the joint and per-class absence rates in --last: clopper-pearson (the default) or wilson", type=str, default='clopper-pearson', choices=['clopper-pearson', 'wilson'])
+    parser.add_argument('--plothist', help="path to a saved max length histogram: plots it with confidence intervals, without re-running the simulation", type=str, default=None)
+    parser.add_argument('--abline', help="the sublexicon's max length, marked on the --plothist plot", type=int, default=None)
+    parser.add_argument('--contingency', help="path to a NGRAM/LEX/SUBLEX table (e.g., lex_sublex_segmental_ngrams.txt or cv_ngrams.txt). runs a test on every row with Benjamini-Hochberg correction and writes a sorted results file next to it", type=str, default=None)
+    parser.add_argument('--test', help="the test to run on each row of the --contingency table: fisher or chisq (default fisher)", type=str, default='fisher', choices=['fisher', 'chisq'])
+    parser.add_argument('--crn', help="compare several sublexicons (paths to directories in 'data') against --lexicon as --last does, on one shared stream of draws (common random numbers): each sublexicon is scored on the first samsize words of every sample, so differences between them have much less Monte Carlo noise", nargs='+', default=None)
+    parser.add_argument('--sweep', help="the syllable cap, final class, joint and class absence probabilities of --last for every sample size from --minsize up to the size of the sublexicon (or --maxsize), from one simulation (numpy engine) or the exact formulas (exact engine). written to size_sweep.txt in the sublexicon directory", type=bool, default=False)
+    parser.add_argument('--minsize', help="the smallest sample size in --sweep (default 5)", type=int, default=5)
+    parser.add_argument('--maxsize', help="the largest sample size in --sweep (default: the size of the sublexicon)", type=int, default=None)
+    parser.add_argument('--plotdir', help="the directory for plots: --plotsims saves its plot here (default ~/git/smallsublex/plots), and --sweep, given a --plotdir, also plots its curves here", type=str, default=None)
+    parser.add_argument('--scan', help="exact chance probabilities of every final natural class x syllable cap restriction for a sample the size of the sublexicon, ranking the ones the sublexicon satisfies; written to restriction_scan.txt in the sublexicon directory", type=bool, default=False)
+    parser.add_argument('--stats', help="Monte Carlo test for any number of word predicates, e.g. --stats 'final=-son' 'syll<=3&stress=-1' 'ngram=s t'. compares how many sublexicon words satisfy each one with simulated samples from the lexicon (numpy or exact engine)", nargs='+', default=None)
+    parser.add_argument('--permtest', help="permutation test for ngrams absent from or underrepresented in the sublexicon. specify the kind of ngram: seg, cv, or xgrid", type=str, default=None, choices=['seg', 'cv', 'xgrid'])
     args = parser.parse_args()
+    if args.weighting!='none' and args.without_replacement and (args.engine=='exact' or args.scan):
+        parser.error("there is no closed form for weighted sampling without replacement: use --engine numpy or python (and no --scan) with --without_replacement, or --weighting none")
     kwargs=vars(args)
-    kwargs['featpath']=os.path.join(datapath, args.lexicon, 'Features.txt')
-    kwargs['nclassdic']=pnc.compactdic(**kwargs)
     kwargs['ignore_stress']=False
     if args.lexicon:
+        kwargs['featpath']=os.path.join(datapath, args.lexicon, 'Features.txt')
+        kwargs['nclassdic']=pnc.compactdic(**kwargs)
         lexpath = os.path.join(datapath, args.lexicon, 'LearningData.txt')
     if args.sublexicon:
         sublexpath = os.path.join(datapath, args.sublexicon, 'LearningData.txt')
+
+    def cli_weights(words):
+        try:
+            return lexicon_weights(words, **dict(kwargs, ld=lexpath))
+        except ValueError as e:
+            sys.exit(str(e))
+
     if args.compare:
         kwargs['ld']=sublexpath
         kwargs=ld_process(**kwargs)
@@ -304,7 +995,11 @@ if __name__=="__main__":
         kwargs['sublex'] = list(pros.make_syllcount_dic(**kwargs).values())
         kwargs['ld']=lexpath
         kwargs = ld_process(**kwargs)
-        kwargs['lex']=list(pros.make_syllcount_dic(**kwargs).values())
+        sylldic = pros.make_syllcount_dic(**kwargs)
+        #weighted draws are over lines, so that doublets keep one lemma's frequency each
+        words = sorted(sylldic) if args.weighting=='none' else ldr.read_ld(ld=lexpath, verbosity=0)
+        kwargs['lex']=[sylldic[w] for w in words]
+        kwargs['weights']=cli_weights(words)
         kwargs['ld']=None
         kwargs['maxsize']=max(kwargs['sublex'])
         kwargs['samsize']=len(kwargs['sublex'])
@@ -315,26 +1010,120 @@ if __name__=="__main__":
         fstuff=pnc.make_featdic(**{'featpath':os.path.join(os.path.dirname(lexpath), 'Features.txt')})
         kwargs['featdic']=fstuff['featdic']
         kwargs['segdic']=fstuff['segdic']
-        with open(lexpath, 'r', encoding='utf-8') as f:
-            kwargs['lex']=[x.strip() for x in f.readlines()]
-        with open(sublexpath, 'r', encoding='utf-8') as f:
-            kwargs['sublex']=[x.strip() for x in f.readlines()]
+        kwargs['lex']=ldr.read_ld(ld=lexpath, verbosity=args.verbosity)
+        kwargs['sublex']=ldr.read_ld(ld=sublexpath, verbosity=args.verbosity)
+        kwargs['weights']=cli_weights(kwargs['lex'])
         kwargs['print']=True
         kwargs['samsize']=len(kwargs['sublex'])
         k = finc_syllcount_monte(**kwargs)
         print(f"How often the nat class of last seg and the max syll count were the same in simulation as in the sublexicon:\n{k['finc']['joint']}/{kwargs['nsamples']}")
+        if k['finc'].get('exact'):
+            print(f"(expected counts from the exact engine; probability {k['finc']['joint']/kwargs['nsamples']:.6g})")
+        else:
+            print(f"95% {args.binom_ci} interval for the joint rate: {sts.binom_ci(k['finc']['joint'], kwargs['nsamples'], args.binom_ci)}")
+        if 'joint_is' in k['finc']:
+            est = k['finc']['joint_is']
+            print(f"importance sampling estimate of the joint probability: {est['p']:.4g} (standard error {est['se']:.2g}, {est['hits']} of {est['nsamples']} tilted draws hit, effective sample size {est['ess']:.0f})")
         print(f"The natural classes of stem-final segments in the simulations:\n")
         for i in sorted(k['finc']['lastnclass'], key=k['finc']['lastnclass'].get, reverse=True):
             print(f"{i}\t{k['finc']['lastnclass'][i]}")
         print(f"Max stem lengths")
         for i in sorted(k['finc']['maxlenth'], key = k['finc']['maxlenth'].get, reverse=True):
             print(f"{i}\t{k['finc']['maxlenth'][i]}")
+        if args.histdir:
+            write_hist(k['finc']['maxlenth'], os.path.join(args.histdir, '_'.join([args.lexicon.split('/')[-1], 'vs', args.sublexicon.split('/')[-1], 'max_length.txt'])))
         print(f"There were {len(k['nclinc'])} natural classes out of {len(kwargs['nclassdic']['nclassdic'])} that did not occur in stem-final position in the sublexicon\n")
         print(f"Here are the nat classes of final segments absent from the sublexicon and number of times they were drawn in MC simulation\n")
-        print(f"class\tsegs\tsize\tn_sims_not_drawn\tratio\n")
-        for i in k['nclinc']:
+        print(f"class\tsegs\tsize\tn_sims_not_drawn\tratio\tabsence_ci\n")
+        absent = [round(k['nclinc'][i]['sim']) for i in k['nclinc']]
+        lo, hi = sts.binom_ci(numpy.array(absent), kwargs['nsamples'], args.binom_ci) if absent and not k['finc'].get('exact') else ([None]*len(absent), [None]*len(absent))
+        for j, i in enumerate(k['nclinc']):
+            ci = f"{lo[j]:.5f}-{hi[j]:.5f}" if lo[j] is not None else "exact"
             try:
-                print(f"{i}\t{','.join(list(k['nclinc'][i]['segs']))}\t{len(k['nclinc'][i]['segs'])}\t{k['nclinc'][i]['sim']}\t{len(k['nclinc'][i]['segs'])*kwargs['nsamples']/k['nclinc'][i]['sim']}")
+                print(f"{i}\t{','.join(list(k['nclinc'][i]['segs']))}\t{len(k['nclinc'][i]['segs'])}\t{k['nclinc'][i]['sim']}\t{len(k['nclinc'][i]['segs'])*kwargs['nsamples']/k['nclinc'][i]['sim']}\t{ci}")
             except ZeroDivisionError:
-                print(f"{i}\t{','.join(list(k['nclinc'][i]['segs']))}\t{len(k['nclinc'][i]['segs'])}\t{k['nclinc'][i]['sim']}\t{kwargs['nsamples']}")
-
+                print(f"{i}\t{','.join(list(k['nclinc'][i]['segs']))}\t{len(k['nclinc'][i]['segs'])}\t{k['nclinc'][i]['sim']}\t{kwargs['nsamples']}\t{ci}")
+        if args.examples:
+            #drill down: which lexicon words end in the classes that the sublexicon lacks
+            index = lxi.build_index(words=kwargs['lex'], featpath=kwargs['featpath'], nclassdic=kwargs['nclassdic'], positions=(-1,))
+            print(f"\nLexicon words ending in each of these classes\n")
+            for i in k['nclinc']:
+                ids = lxi.intersect(index, [[(-1, index['classes'][frozenset(k['nclinc'][i]['segs'])])]])
+                print(f"{i}\t{len(ids)}\t{', '.join(index['words'][j].strip('# ') for j in ids[:args.examples])}")
+    if args.crn:
+        kwargs['lex']=ldr.read_ld(ld=lexpath, verbosity=args.verbosity)
+        kwargs['sublexes']={s:ldr.read_ld(ld=os.path.join(datapath, s, 'LearningData.txt'), verbosity=args.verbosity) for s in args.crn}
+        kwargs['weights']=cli_weights(kwargs['lex'])
+        k = finc_crn(**kwargs)
+        print(f"sublexicon\tsize\tmax_syll\tfinal_class\tjoint\trate\t95% {args.binom_ci} interval")
+        for name, r in k['crn'].items():
+            lo, hi = sts.binom_ci(r['joint'], kwargs['nsamples'], args.binom_ci)
+            print(f"{name}\t{r['samsize']}\t{r['maxsyll']}\t{r['natclass']}\t{r['joint']}/{kwargs['nsamples']}\t{r['joint']/kwargs['nsamples']:.5f}\t{lo:.5f}-{hi:.5f}")
+        print(f"\ndifferences in joint rates on the same draws (se: paired standard error; se_indep: with independent draws)\npair\tdiff\tse\tse_indep")
+        for (a, b), d in k['crn_pairs'].items():
+            print(f"{a} - {b}\t{d['diff']:.5f}\t{d['se']:.5f}\t{d['se_indep']:.5f}")
+        if args.histdir:
+            for name, r in k['crn'].items():
+                write_hist(r['maxlenth'], os.path.join(args.histdir, '_'.join([args.lexicon.split('/')[-1], 'vs', name.split('/')[-1], 'crn', 'max_length.txt'])))
+    if args.sweep:
+        kwargs['lex']=ldr.read_ld(ld=lexpath, verbosity=args.verbosity)
+        kwargs['sublex']=ldr.read_ld(ld=sublexpath, verbosity=args.verbosity)
+        kwargs['weights']=cli_weights(kwargs['lex'])
+        if args.engine=='python':
+            kwargs['engine']='numpy'
+        start = time.time()
+        sw = finc_sweep(**kwargs)['sweep']
+        outpath = os.path.join(os.path.dirname(sublexpath), 'size_sweep.txt')
+        write_sweep(sw, outpath, kwargs['nsamples'], args.binom_ci)
+        print(f"{len(sw['sizes'])} sample sizes in {time.time()-start:.2f} s, written to {outpath}")
+        print(f"restriction: final class {sw['natclass']}, at most {sw['cap']} syllables\nsize\tp_syll\tp_class\tp_joint")
+        for i, size in enumerate(sw['sizes']):
+            if size==sw['samsize'] or i % max(1, len(sw['sizes'])//10)==0:
+                print(f"{size}\t{sw['syll'][i]:.4g}\t{sw['class'][i]:.4g}\t{sw['joint'][i]:.4g}")
+        if args.plotdir:
+            plotter.plot_sweep(sw, show=False, fname='_'.join([args.lexicon.split('/')[-1], 'vs', args.sublexicon.split('/')[-1], 'size_sweep']), outdir=args.plotdir)
+    if args.scan:
+        kwargs['lex']=ldr.read_ld(ld=lexpath, verbosity=args.verbosity)
+        kwargs['sublex']=ldr.read_ld(ld=sublexpath, verbosity=args.verbosity)
+        kwargs['weights']=cli_weights(kwargs['lex'])
+        start = time.time()
+        rows = restriction_scan(**kwargs)['scan']
+        outpath = os.path.join(os.path.dirname(sublexpath), 'restriction_scan.txt')
+        write_scan(rows, outpath)
+        print(f"{len(rows)} restrictions scanned in {time.time()-start:.2f} s, written to {outpath}")
+        print(f"the least probable restrictions the sublexicon satisfies:\nclass\tcap\twords\tp")
+        for r in [r for r in rows if r['satisfied']][:10]:
+            print(f"{r['class']}\t{r['cap']}\t{r['words']}\t{r['p']:.4g}")
+    if args.stats:
+        kwargs['featdic']=pnc.make_featdic(featpath=kwargs['featpath'])['featdic']
+        kwargs['lex']=ldr.read_ld(ld=lexpath, verbosity=args.verbosity)
+        kwargs['sublex']=ldr.read_ld(ld=sublexpath, verbosity=args.verbosity)
+        kwargs['weights']=cli_weights(kwargs['lex'])
+        if args.engine=='python':
+            kwargs['engine']='numpy'
+        k = stat_monte(**kwargs)['statsims']
+        print(f"stat\tsublex\tmean_sim\tp_absent\tp_all\tp_low\tp_high")
+        for spec in k:
+            print(f"{spec}\t{k[spec]['sublex']}/{len(kwargs['sublex'])}\t{k[spec]['mean']:.3f}\t{k[spec]['p_absent']:.5f}\t{k[spec]['p_all']:.5f}\t{k[spec]['p_low']:.5f}\t{k[spec]['p_high']:.5f}")
+    if args.permtest:
+        kwargs['lex']=ldr.read_ld(ld=lexpath, keep_mb=False, dedupe=True, verbosity=args.verbosity)
+        kwargs['sublex']=ldr.read_ld(ld=sublexpath, keep_mb=False, dedupe=True, verbosity=args.verbosity)
+        kwargs['ngram_type'] = args.permtest
+        k = perm_ngram_test(**kwargs)['perm_ngrams']
+        outpath = os.path.join(os.path.dirname(sublexpath), f'perm_{args.permtest}_ngrams.txt')
+        with open(outpath, 'w', encoding='utf-8') as f:
+            f.write("NGRAM\tLEX\tSUBLEX\tEXPECTED\tP_ABSENT\tP\n")
+            for i in sorted(k, key=lambda x: (k[x]['p'], -k[x]['lex'])):
+                f.write(f"{i}\t{k[i]['lex']}\t{k[i]['sublex']}\t{k[i]['expected']:.3f}\t{k[i]['p_absent']:.5f}\t{k[i]['p']:.5f}\n")
+        print(f"permutation test results written to {outpath}")
+    if args.contingency:
+        kwargs['lsub'] = read_lsub_table(args.contingency)
+        k = batch_contingency(**kwargs)['contingency']
+        outpath = os.path.splitext(args.contingency)[0] + f'_{args.test}.txt'
+        write_contingency(k, outpath)
+    if args.plothist:
+        hist = read_hist(args.plothist)
+        ci = sim_ci(hist, **kwargs)
+        print(f'mean\t{hist_mean(hist)}\nconfidence intervals: {ci}')
+        fname = os.path.splitext(os.path.basename(args.plothist))[0]
+        plotter.plot_sim_with_ci(hist, ci, abline=args.abline if args.abline is not None else max(hist), fname=fname, color=False, outdir=os.path.dirname(os.path.abspath(args.plothist)))
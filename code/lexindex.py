@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os, re
+import numpy
+
+import nclasses as pnc
+import segments as sgs
+import learningdata as ldr
+from lazyimport import lazy_module
+
+sparse = lazy_module('scipy.sparse')
+
+'''
+an inverted index over a lexicon, so that questions like "which words end in a [+cor,+strid] segment" or "which words contain the trigram a s t" are answered by a lookup instead of a rescan of LearningData.txt.
+
+keys are
+    (position, class): position is a segment index (0 is the first segment, -1 the last, -2 the second to last), class is a natural class named by its compact featural description, as in nclasses.featclassdic ('+cor,+strid')
+    ('ngram', ngram): any segmental 1- to 3-gram, with '#' for word edges, as counted by segments.count_seg_ngrams
+and each key maps to the sorted IDs (positions in index['words']) of the words that have it.
+
+posting lists are kept in one of two compressed forms, whichever is smaller: a sorted array of IDs in the narrowest unsigned type that fits, or, for keys that cover more than a small share of the lexicon, a packed bitmap (n/8 bytes). intersections then come down to numpy set operations or bitwise ands.
+
+usage:
+
+    index = lexindex.build_index(words=words, featpath=featpath)
+    ids = lexindex.query(index, ['final:+cor,+strid', 'ngram:a s t'])
+    [index['words'][i] for i in ids]
+'''
+
+positions_default = (0, 1, -2, -1)
+position_names = {'initial':0, 'second':1, 'penult':-2, 'final':-1}
+
+
+def compress(ids, n):
+    '''
+    a posting list (sorted word IDs out of n words) in its smaller form: ('a', array) or ('b', packed bitmap)
+    '''
+    dtype = numpy.uint16 if n <= 2**16 else numpy.uint32
+    if len(ids)*numpy.dtype(dtype).itemsize > (n+7)//8:
+        bits = numpy.zeros(n, dtype=bool)
+        bits[ids] = True
+        return ('b', numpy.packbits(bits))
+    return ('a', numpy.asarray(ids, dtype=dtype))
+
+
+def decompress(posting, n):
+    '''
+    the word IDs in a posting list, as a sorted int array
+    '''
+    kind, data = posting
+    if kind=='b':
+        return numpy.flatnonzero(numpy.unpackbits(data, count=n))
+    return data.astype(numpy.int64)
+
+
+def columns_to_postings(mat, keys, n, index):
+    '''
+    adds one posting list per column of a words x keys sparse matrix
+    '''
+    csc = sparse.csc_matrix(mat)
+    csc.sort_indices()
+    for j, key in enumerate(keys):
+        ids = csc.indices[csc.indptr[j]:csc.indptr[j+1]]
+        if len(ids):
+            index['postings'][key] = compress(ids, n)
+
+
+def build_index(**kwargs):
+    '''
+    builds the index for kwargs['words'] (padded word strings, as from learningdata.read_ld) or kwargs['ld'] (a path), with the natural classes of kwargs['featpath'].
+    kwargs['positions'] sets which segment positions get class keys (default: the first two and the last two).
+    the class memberships come from nclasses.sclassdic, the ngrams from segments.seg_ngram_incidence.
+    returns {'words': [...], 'postings': {key: posting}, 'classes': {frozenset of segs: class name}, 'featdic': the feature-to-segments dictionary}
+    '''
+    if 'words' in kwargs:
+        words = list(kwargs['words'])
+    else:
+        words = ldr.read_ld(ld=kwargs['ld'], verbosity=kwargs.get('verbosity', 1))
+    n = len(words)
+    positions = kwargs.get('positions', positions_default)
+    if 'nclassdic' in kwargs:
+        nclassdic = kwargs['nclassdic']['nclassdic']
+    else:
+        nclassdic = pnc.compactdic(featpath=kwargs['featpath'], verbosity=kwargs.get('verbosity', 1))['nclassdic']
+    fstuff = pnc.make_featdic(featpath=kwargs['featpath'])
+    segclasses = pnc.sclassdic(nclassdic=list(nclassdic.values()), segdic=fstuff['segdic'])['segclassdic']
+    classnames = sorted({','.join(sorted(cl)) for seg in segclasses for cl in segclasses[seg]})
+    classcol = {cl:j for j, cl in enumerate(classnames)}
+    segs = sorted(segclasses)
+    segcol = {seg:i for i, seg in enumerate(segs)}
+    #segment x class membership
+    rows, cols = [], []
+    for seg in segs:
+        for cl in segclasses[seg]:
+            rows.append(segcol[seg])
+            cols.append(classcol[','.join(sorted(cl))])
+    member = sparse.csr_matrix((numpy.ones(len(rows), dtype=numpy.int8), (rows, cols)), shape=(len(segs), len(classnames)))
+    #class extensions (the keys of nclassdic are comma-joined segs) to class names
+    index = {'words':words, 'postings':{}, 'featdic':fstuff['featdic'],
+             'classes':{frozenset(k.split(',')):','.join(sorted(nclassdic[k])) for k in nclassdic}}
+    wordsegs = [wd.strip('# ').split(' ') for wd in words]
+    for pos in positions:
+        #word x segment one-hot for the segment at pos, times segment x class membership
+        r = [i for i, ws in enumerate(wordsegs) if -len(ws) <= pos < len(ws) and ws[pos] in segcol]
+        c = [segcol[wordsegs[i][pos]] for i in r]
+        onehot = sparse.csr_matrix((numpy.ones(len(r), dtype=numpy.int8), (r, c)), shape=(n, len(segs)))
+        columns_to_postings(onehot @ member, [(pos, cl) for cl in classnames], n, index)
+    inc = sgs.seg_ngram_incidence(words=words)
+    columns_to_postings(inc['incidence'], [('ngram', g) for g in inc['ngram_index']], n, index)
+    return index
+
+
+key_pattern = re.compile(r'^(initial|second|penult|final|ngram|-?\d+):(.+)$')
+
+
+def parse_key(index, spec):
+    '''
+    turns a query string into a list of keys, whose postings are to be united:
+        'final:+cor,+strid' or '-1:+cor,+strid': the last segment is in the class (the features can be given in any order, and in any combination that picks out a class)
+        'final:s,z': the last segment is s or z
+        'ngram:a s t': the word contains a s t
+    '''
+    m = key_pattern.match(spec.strip())
+    if m is None:
+        raise ValueError(f"cannot parse the query {spec!r}: expected e.g. final:+cor,+strid, 0:+syllabic or ngram:a s t")
+    pos, val = m.groups()
+    if pos=='ngram':
+        return [('ngram', ' '.join(val.split()))]
+    pos = position_names[pos] if pos in position_names else int(pos)
+    items = [x for x in re.split(r'[,\s]+', val) if x]
+    if all(x[0] in '+-' for x in items):
+        #a feature bundle: look up the class with the same extension
+        unknown = [x for x in items if x not in index['featdic']]
+        if unknown:
+            raise ValueError(f"unknown feature values in the query {spec!r}: {', '.join(unknown)}")
+        ext = frozenset(pnc.feats_to_segs(index['featdic'], items))
+        return [(pos, index['classes'][ext])] if ext in index['classes'] else []
+    return [(pos, index['classes'][frozenset([seg])]) for seg in items if frozenset([seg]) in index['classes']]
+
+
+def lookup(index, key):
+    '''
+    the word IDs for one key (an empty array if no word has it)
+    '''
+    posting = index['postings'].get(key)
+    if posting is None:
+        return numpy.array([], dtype=numpy.int64)
+    return decompress(posting, len(index['words']))
+
+
+def union(index, keys):
+    ids = [lookup(index, key) for key in keys]
+    if not ids:
+        return numpy.array([], dtype=numpy.int64)
+    return numpy.unique(numpy.concatenate(ids)) if len(ids) > 1 else ids[0]
+
+
+def intersect(index, keylists):
+    '''
+    the IDs of words that have at least one key from every list, intersecting the smallest lists first.
+    bitmaps are anded directly; arrays are intersected as sorted sets
+    '''
+    n = len(index['words'])
+    sets = []
+    for keys in keylists:
+        if len(keys)==1 and keys[0] in index['postings'] and index['postings'][keys[0]][0]=='b':
+            sets.append(index['postings'][keys[0]])
+        else:
+            sets.append(('a', union(index, keys)))
+    if not sets:
+        return numpy.arange(n)
+    bitmaps = [data for kind, data in sets if kind=='b']
+    arrays = sorted((data for kind, data in sets if kind=='a'), key=len)
+    bits = None
+    if bitmaps:
+        bits = bitmaps[0]
+        for b in bitmaps[1:]:
+            bits = bits & b
+    if not arrays:
+        return numpy.flatnonzero(numpy.unpackbits(bits, count=n))
+    out = arrays[0]
+    for a in arrays[1:]:
+        out = numpy.intersect1d(out, a, assume_unique=True)
+    if bits is not None:
+        out = out[numpy.unpackbits(bits, count=n)[out].astype(bool)]
+    return out
+
+
+def query(index, specs):
+    '''
+    the IDs of the words that satisfy every query string in specs (see parse_key)
+    '''
+    return intersect(index, [parse_key(index, spec) for spec in specs])
+
+
+def index_size(index):
+    '''
+    bytes taken up by the posting lists
+    '''
+    return sum(data.nbytes for kind, data in index['postings'].values())
+
+
+if __name__=="__main__":
+    import argparse
+    basepath=os.path.dirname(os.getcwd())
+    parser = argparse.ArgumentParser(description="look up lexicon words by natural class in a position and by ngram")
+    parser.add_argument("--language", help="a path to a directory in 'data' with LearningData.txt and Features.txt, e.g. russian/freq_noun_stems", required=True)
+    parser.add_argument("--query", help="one or more conditions, all of which must hold: e.g. 'final:+cor,+strid' 'ngram:a s t' '0:+syllabic'", nargs='+', required=True)
+    parser.add_argument("--limit", help="print at most this many words (default 20; 0 prints them all)", type=int, default=20)
+    parser.add_argument("--verbosity", help="0 to print only the words", type=int, default=1)
+    args = parser.parse_args()
+    langpath = os.path.join(basepath, 'data', args.language)
+    index = build_index(ld=os.path.join(langpath, 'LearningData.txt'), featpath=os.path.join(langpath, 'Features.txt'), verbosity=args.verbosity)
+    try:
+        ids = query(index, args.query)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.verbosity > 0:
+        print(f"{len(ids)} of {len(index['words'])} words match {' & '.join(args.query)}")
+    for i in (ids if args.limit==0 else ids[:args.limit]):
+        print(index['words'][i].strip('# '))
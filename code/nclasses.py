@@ -1,10 +1,16 @@
 #!/usr/bin/env python3
 
-import os, argparse, itertools
+import os, argparse, itertools, json
 
 '''
 a module for phonological feature wrangling and natural class calculations.
 fixed the earlier problem of pynatclasses where certain classes were accidentally left out
+
+compactdic takes a few seconds on the Russian feature file. when iterating on a feature system, keep the classes in a json file and only recompute what an edit can change:
+
+    $ python nclasses.py --language russian --classcache ~/Desktop/russian_classes.json
+    (edit data/russian/Features.txt)
+    $ python nclasses.py --language russian --classcache ~/Desktop/russian_classes.json
 '''
 
 
@@ -158,37 +164,162 @@ def compactdic(**kwargs):
         verbosedic = kwargs['verbosedic']
     else:
         verbosedic = kwargs['verbosedic']
-    featnames = kwargs.get('featnames')
     featdic = kwargs.get('featdic')
     nclassdic = {}.fromkeys(verbosedic)
     for nclass in verbosedic:
-        powerfeats = powerset(verbosedic[nclass])
-        good_desc = []
-        nset = set(nclass.split(','))
-        for fp in powerfeats:
-            if fp!=tuple() and fp!=tuple(verbosedic[nclass]) and fp!=("/",):
-                kwargs['feats']=fp
-                fts = feats_to_segs(featdic, fp)
-                if fts==nset and len(fp)<len(verbosedic[nclass]):
-                    good_desc.append(fp)
-        if len(good_desc)==0:
-            nclassdic[nclass]=verbosedic[nclass]
-        elif len(good_desc)==1:
-            nclassdic[nclass]=set(good_desc[0])
-        else:
-            lenths = [len(x) for x in good_desc]
-            shortest = [x for x in good_desc if len(x)==min(lenths)]
-            if len(shortest)==1:
-                nclassdic[nclass]=set(shortest[0])
-            else:
-                cl_sizes = [avg_cl_size(featdic, cl) for cl in good_desc]
-                generalest = [x for x in good_desc if avg_cl_size(featdic, x) == min(cl_sizes)]
-                nclassdic[nclass]=set(generalest[0])
-    del fts
+        nclassdic[nclass] = shortest_desc(nclass, verbosedic[nclass], featdic)
     del kwargs['verbosedic']
     kwargs['nclassdic']=nclassdic
     return kwargs
 
+def shortest_desc(nclass, feats, featdic):
+    '''
+    the description compactdic picks for one class (a comma-joined string of segs), given its full feature specification.
+    every proper subset of the specification is tried, in powerset order; the extensions of all the subsets are built up at once as bitmasks over the segments (each subset's is the one without its lowest feature, intersected with that feature's), rather than intersecting sets for each subset
+    '''
+    spec, feats = feats, list(feats)
+    nset = set(nclass.split(','))
+    segs = set(nset)
+    for f in feats:
+        segs |= featdic[f]
+    bit = {seg:1 << i for i, seg in enumerate(segs)}
+    fmasks = [sum(bit[seg] for seg in featdic[f]) for f in feats]
+    target = sum(bit[seg] for seg in nset)
+    n = len(feats)
+    ext = [(1 << len(segs)) - 1] + [0]*((1 << n) - 1)
+    for sub in range(1, 1 << n):
+        low = sub & -sub
+        ext[sub] = ext[sub ^ low] & fmasks[low.bit_length()-1]
+    #combinations come out by size, then in lexicographic order of positions
+    hits = sorted((tuple(i for i in range(n) if sub >> i & 1) for sub in range(1, (1 << n) - 1) if ext[sub]==target), key=lambda x: (len(x), x))
+    good_desc = [tuple(feats[i] for i in pos) for pos in hits]
+    good_desc = [fp for fp in good_desc if fp!=("/",)]
+    if len(good_desc)==0:
+        return spec
+    elif len(good_desc)==1:
+        return set(good_desc[0])
+    shortlen = min(len(x) for x in good_desc)
+    shortest = [x for x in good_desc if len(x)==shortlen]
+    if len(shortest)==1:
+        return set(shortest[0])
+    cl_sizes = [avg_cl_size(featdic, cl) for cl in good_desc]
+    smallest = min(cl_sizes)
+    generalest = [x for x, size in zip(good_desc, cl_sizes) if size == smallest]
+    return set(generalest[0])
+
+def class_state(**kwargs):
+    '''
+    compactdic, keeping what update_classes needs to recompute the classes when the feature file changes: returns kwargs with segdic, featnames, featdic, verbosedic and nclassdic
+    '''
+    kwargs = make_verbose_dic(**make_featdic(**make_segdic(**kwargs)))
+    kwargs['nclassdic'] = compactdic(**kwargs)['nclassdic']
+    return kwargs
+
+def update_classes(old, **kwargs):
+    '''
+    recomputes natural classes and their descriptions after an edit to the feature file, starting from old (what class_state or an earlier update_classes returned, or load_classes read back).
+    a class is the extension of some set of feature values, so it can only appear, disappear or change its specification or description if it contains a segment whose features changed, or its specification includes a feature value whose extension changed. everything else is copied over. the candidates for new classes are the extensions of the changed feature values, intersected with every other feature value's extension until nothing new turns up (as bitmasks over the segments, which is cheap); only those and the affected old classes get the powerset search for a shortest description.
+    needs a featpath (or segdic and featnames) for the new feature table. returns the same things as class_state, plus 'classdiff':
+        appeared, disappeared: {class: description}
+        redescribed: {class: (old description, new description)}
+        feats: the feature values whose extensions changed, segs: the segments whose specifications changed
+        recomputed: how many classes got a new description search
+    new classes go after the old ones, so the class order can differ from a fresh compactdic (which depends on set iteration order anyway)
+    '''
+    if 'segdic' not in kwargs:
+        kwargs = make_segdic(**kwargs)
+    kwargs = make_featdic(**kwargs)
+    segdic, featdic = kwargs['segdic'], kwargs['featdic']
+    oldsegs, oldfeats = old['segdic'], {}
+    for seg in oldsegs:
+        for f in oldsegs[seg]:
+            oldfeats.setdefault(f, set()).add(seg)
+    dfeats = {f for f in set(featdic) | set(oldfeats) if featdic.get(f)!=oldfeats.get(f)}
+    dsegs = {seg for seg in set(segdic) | set(oldsegs) if segdic.get(seg)!=oldsegs.get(seg)}
+    verbosedic, nclassdic, redo = {}, {}, []
+    for nclass, spec in old['verbosedic'].items():
+        segs = nclass.split(',')
+        if not (set(segs) & dsegs or spec & dfeats):
+            verbosedic[nclass] = spec
+            nclassdic[nclass] = old['nclassdic'][nclass]
+            continue
+        if len(segs)==1:
+            if segs[0] in segdic:
+                redo.append((nclass, segdic[segs[0]]))
+            continue
+        if all(seg in segdic for seg in segs):
+            newspec = segs_to_feats(segdic, segs)
+            if newspec and feats_to_segs(featdic, list(newspec))==set(segs):
+                redo.append((nclass, newspec))
+    #new classes must involve a changed feature value: close its extension under intersection with all the others
+    inventory = list(segdic)
+    bit = {seg:1 << i for i, seg in enumerate(inventory)}
+    masks = {f:sum(bit[seg] for seg in featdic[f]) for f in featdic}
+    frontier = {masks[f] for f in dfeats if f in masks}
+    found = set(frontier)
+    while frontier:
+        nxt = set()
+        for m in frontier:
+            for fm in masks.values():
+                x = m & fm
+                if x and x not in found:
+                    found.add(x)
+                    nxt.add(x)
+        frontier = nxt
+    seen = set(verbosedic) | {nclass for nclass, spec in redo}
+    for seg in inventory:
+        if seg in dsegs and seg not in seen:
+            redo.append((seg, segdic[seg]))
+            seen.add(seg)
+    for m in sorted(found):
+        segs = sorted(seg for seg in inventory if m & bit[seg])
+        nclass = ','.join(segs)
+        if len(segs) > 1 and nclass not in seen:
+            redo.append((nclass, segs_to_feats(segdic, segs)))
+            seen.add(nclass)
+    for nclass, spec in redo:
+        verbosedic[nclass] = spec
+        nclassdic[nclass] = shortest_desc(nclass, spec, featdic)
+    diff = {'appeared':{cl:nclassdic[cl] for cl in nclassdic if cl not in old['nclassdic']},
+            'disappeared':{cl:old['nclassdic'][cl] for cl in old['nclassdic'] if cl not in nclassdic},
+            'redescribed':{cl:(old['nclassdic'][cl], nclassdic[cl]) for cl in nclassdic if cl in old['nclassdic'] and set(nclassdic[cl])!=set(old['nclassdic'][cl])},
+            'feats':sorted(dfeats), 'segs':sorted(dsegs), 'recomputed':len(redo)}
+    if kwargs.get('verbosity', 1) > 0:
+        print(f"{len(nclassdic)} natural classes: {len(diff['appeared'])} new, {len(diff['disappeared'])} gone, {len(diff['redescribed'])} redescribed ({len(redo)} recomputed)")
+    kwargs['verbosedic'] = verbosedic
+    kwargs['nclassdic'] = nclassdic
+    kwargs['classdiff'] = diff
+    return kwargs
+
+def write_classdiff(diff, outpath=None):
+    '''
+    the update_classes report, one class per line: + for new classes, - for the ones that are gone, ~ for new descriptions (old -> new). to the screen if there's no outpath
+    '''
+    lines = [f"# changed feature values: {','.join(diff['feats'])}", f"# changed segments: {','.join(diff['segs'])}"]
+    lines += [f"+\t{cl}\t{','.join(sorted(d))}" for cl, d in diff['appeared'].items()]
+    lines += [f"-\t{cl}\t{','.join(sorted(d))}" for cl, d in diff['disappeared'].items()]
+    lines += [f"~\t{cl}\t{','.join(sorted(a))} -> {','.join(sorted(b))}" for cl, (a, b) in diff['redescribed'].items()]
+    if outpath is None:
+        print('\n'.join(lines))
+        return
+    with open(outpath, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    print(f"class diff written to {outpath}")
+
+def save_classes(state, outpath):
+    '''
+    writes what update_classes needs (segdic, featnames, verbosedic, nclassdic) to a json file
+    '''
+    with open(outpath, 'w', encoding='utf-8') as f:
+        json.dump({k:({x:sorted(v) for x, v in state[k].items()} if isinstance(state[k], dict) else state[k]) for k in ('segdic', 'featnames', 'verbosedic', 'nclassdic')}, f, ensure_ascii=False)
+
+def load_classes(inpath):
+    with open(inpath, encoding='utf-8') as f:
+        state = json.load(f)
+    for k in ('segdic', 'verbosedic', 'nclassdic'):
+        state[k] = {x:set(v) for x, v in state[k].items()}
+    return state
+
 def featclassdic(**kwargs):
     '''
     takes in a dictionary of segment groups and feature values, and returns the inverse (feature values map to segment lists)
@@ -231,13 +362,16 @@ def nclasses(**kwargs):
     kwargs = compactdic(**kwargs)
     outdic = kwargs['nclassdic']
     if pr:
-        with open(outpath, 'w', encoding='utf-8') as f:
-            for cl in sorted(outdic):
-                f.write(f"{cl}\t{','.join(list(outdic[cl]))}\n")
-        print(f"{len(outdic)} classes written to {outpath}")
+        write_classes(outdic, outpath)
     else:
         return outdic
 
+def write_classes(outdic, outpath):
+    with open(outpath, 'w', encoding='utf-8') as f:
+        for cl in sorted(outdic):
+            f.write(f"{cl}\t{','.join(list(outdic[cl]))}\n")
+    print(f"{len(outdic)} classes written to {outpath}")
+
 def get_vocoids(**kwargs):
     '''
     gets vocoids, i.e. vowels and glides (-consonantal or -cons)
@@ -328,6 +462,96 @@ def missing_classes(**kwargs):
     return posscls
  
 
+_lattices = {}
+
+def class_lattice(classdic):
+    '''
+    builds the Hasse diagram of the subsumption lattice of a set of natural classes, given as {name: set of segs} (e.g. the featclassdic from featclassdic()).
+    a class's parents are the smallest classes that properly contain it, and its children are the largest classes it properly contains; ancestors and descendants follow the edges all the way up or down.
+    each class becomes a bitmask over the segment inventory, so that containment is a single integer operation. the lattice is cached by content, so rebuilding it for the same classes in the same run costs nothing.
+    returns {'segs': {name: segs}, 'order': names from largest to smallest, 'parents': {name: set}, 'children': {name: set}, 'roots': names with no parents}
+    '''
+    ckey = frozenset((cl, frozenset(classdic[cl])) for cl in classdic)
+    if ckey in _lattices:
+        return _lattices[ckey]
+    inventory = sorted(set().union(*classdic.values())) if classdic else []
+    bit = {seg:1 << i for i, seg in enumerate(inventory)}
+    masks = {cl:sum(bit[seg] for seg in classdic[cl]) for cl in classdic}
+    order = sorted(classdic, key=lambda cl: (-len(classdic[cl]), cl))
+    parents = {cl:set() for cl in order}
+    children = {cl:set() for cl in order}
+    for i, cl in enumerate(order):
+        m = masks[cl]
+        #proper supersets come earlier in the order; go through them from the smallest up, and keep the ones that don't contain a parent already found
+        found = []
+        for sup in reversed(order[:i]):
+            sm = masks[sup]
+            if sm != m and sm & m == m and not any(sm & masks[p] == masks[p] for p in found):
+                found.append(sup)
+        for p in found:
+            parents[cl].add(p)
+            children[p].add(cl)
+    lattice = {'segs':{cl:set(classdic[cl]) for cl in order}, 'order':order, 'parents':parents, 'children':children,
+               'roots':[cl for cl in order if not parents[cl]]}
+    _lattices[ckey] = lattice
+    return lattice
+
+def lattice_walk(lattice, cl, edges):
+    '''
+    every class reachable from cl along 'parents' (its ancestors) or 'children' (its descendants)
+    '''
+    seen = set()
+    stack = list(lattice[edges][cl])
+    while stack:
+        x = stack.pop()
+        if x not in seen:
+            seen.add(x)
+            stack.extend(lattice[edges][x])
+    return seen
+
+def ancestors(lattice, cl):
+    return lattice_walk(lattice, cl, 'parents')
+
+def descendants(lattice, cl):
+    return lattice_walk(lattice, cl, 'children')
+
+def maximal_classes(lattice, pred):
+    '''
+    the classes that satisfy pred (a function of the class name) and have no ancestor that does, in one pass over the lattice from the top down
+    '''
+    covered = {}
+    out = []
+    for cl in lattice['order']:
+        above = any(covered[p] for p in lattice['parents'][cl])
+        sat = pred(cl)
+        if sat and not above:
+            out.append(cl)
+        covered[cl] = sat or above
+    return out
+
+def export_lattice(lattice, outpath):
+    '''
+    writes the lattice to a file, by extension: .dot (graphviz, edges point from each class to its parents), .json ({class: {'segs', 'parents', 'children'}}), or anything else as a tab-separated list of class, parent pairs
+    '''
+    ext = os.path.splitext(outpath)[1]
+    with open(outpath, 'w', encoding='utf-8') as f:
+        if ext=='.dot':
+            f.write("digraph natclasses {\n  rankdir=BT;\n")
+            for cl in lattice['order']:
+                f.write(f'  "{cl}" [label="[{cl}]\\n{",".join(sorted(lattice["segs"][cl]))}"];\n')
+            for cl in lattice['order']:
+                for p in sorted(lattice['parents'][cl]):
+                    f.write(f'  "{cl}" -> "{p}";\n')
+            f.write("}\n")
+        elif ext=='.json':
+            json.dump({cl:{'segs':sorted(lattice['segs'][cl]), 'parents':sorted(lattice['parents'][cl]), 'children':sorted(lattice['children'][cl])} for cl in lattice['order']}, f, ensure_ascii=False, indent=1)
+        else:
+            for cl in lattice['order']:
+                for p in sorted(lattice['parents'][cl]):
+                    f.write(f"{cl}\t{p}\n")
+    print(f"lattice of {len(lattice['order'])} classes written to {outpath}")
+
+
 if __name__=="__main__":
     parser = argparse.ArgumentParser(description="natural classes and phonological feature queries")
     parser.add_argument("--featpath", help="full path to the feature file. Must be tab-separated and use only +, -, and 0 values for features, a la Hayes & Wilson's format")
@@ -338,6 +562,9 @@ if __name__=="__main__":
     parser.add_argument("--outpath", help="path to the file where you want the natural classes to be written. Any file by that name will be overwritten without a prompt.", default=os.path.expanduser("~/Desktop/natclasses.txt"))
     parser.add_argument("--segclassdic", help="produce a segment-to-nat-class dictionary", type=bool, default=False)
     parser.add_argument("--segset", help="return the smallest natural class that contains all the segments in a given list", type=str, default=None)
+    parser.add_argument("--classcache", help="a json file of natural classes saved by an earlier run. if it exists, the classes are recomputed incrementally from it and the classes that appeared, disappeared or got new descriptions are listed; then it is overwritten with the new classes", type=str, default=None)
+    parser.add_argument("--diffpath", help="with --classcache, write the list of changed classes here instead of to the screen", type=str, default=None)
+    parser.add_argument("--lattice", help="write the subsumption lattice (Hasse diagram) of the natural classes to this path: .dot for graphviz, .json, or a tab-separated class/parent list", type=str, default=None)
     args = parser.parse_args()
     kwargs = vars(args)
     basepath=os.path.dirname(os.getcwd())
@@ -360,8 +587,19 @@ if __name__=="__main__":
                 for seg in x['segclassdic']:
                     for cl in x['segclassdic'][seg]:
                         f.write(f"{seg}\t{cl}\n")
+        elif kwargs['classcache']!=None:
+            if os.path.exists(kwargs['classcache']):
+                state = update_classes(load_classes(kwargs['classcache']), **kwargs)
+                write_classdiff(state['classdiff'], kwargs['diffpath'])
+            else:
+                state = class_state(**kwargs)
+            save_classes(state, kwargs['classcache'])
+            write_classes(state['nclassdic'], kwargs['outpath'])
         else:
             nclasses(**kwargs)
+    if kwargs['lattice']!=None:
+        fclassdic = featclassdic(nclassdic=compactdic(**kwargs)['nclassdic'])['featclassdic']
+        export_lattice(class_lattice(fclassdic), kwargs['lattice'])
     if kwargs['segset']!=None:
         kwargs['featpath']='/home/maria/git/smallsublex/data/russian/Features.txt'
         kwargs['nclassdic']=compactdic(**kwargs)
@@ -370,5 +608,5 @@ if __name__=="__main__":
         missing = missing_classes(**kwargs)
         for cl in sorted(missing, key=missing.get, reverse=True):
             print(f"{cl}\t{missing[cl]}")
-    else:
+    elif kwargs['classcache']==None:
         nclasses(**kwargs)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import numpy
+
+# should be in the same code directory
+import learningdata as ldr
+import segments as sgs
+import prosody as pros
+from lazyimport import lazy_module
+
+sparse = lazy_module('scipy.sparse')
+
+'''
+compares one reference lexicon against any number of sublexicons at once.
+
+segments.lexsublex_seg_ngrams and prosody.lexsublex_pros_ngrams count the reference lexicon all over again for every sublexicon. here, the lexicon's ngrams are counted once into a vector, and each sublexicon becomes one row of a sparse sublexicon-by-ngram matrix over the same ngram columns (ngrams that only occur in a sublexicon get columns of their own, with a lexicon count of 0). comparing ten suffix sublexicons against freq_noun_stems is one pass over the lexicon and ten small ones.
+
+from the matrix, for every sublexicon:
+    - the NGRAM/LEX/SUBLEX table, the same as the lexsublex_* functions make (and lex_comparison.batch_contingency takes)
+    - divergences from the lexicon's ngram distribution: KL(sublexicon || lexicon), Jensen-Shannon, and cosine similarity
+
+    $ python ngrammatrix.py --lexicon russian/freq_noun_stems --sublexicons russian/freq_astyj russian/freq_ist russian/freq_izm
+    $ python ngrammatrix.py --lexicon russian/freq_noun_stems --sublexicons russian/freq_astyj --ngram_type cv --tables True
+'''
+
+datapath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+#the file names that segments.py and prosody.py use for their tables
+table_names = {'seg':'lex_sublex_segmental_ngrams.txt', 'cv':'cv_ngrams.txt', 'xgrid':'xgrid_ngrams.txt'}
+
+
+def ngram_counts(words, ngram_type='seg', featpath=None, ignore_stress=False):
+    '''
+    {ngram: count} for a list of words: segmental ngrams (ngram_type 'seg', as in segments.count_seg_ngrams), or ngrams over CV skeleta ('cv') or x grids ('xgrid'), as in prosody.count_cv_grid_ngrams. the prosodic ones need a featpath
+    '''
+    if ngram_type=='seg':
+        return sgs.count_seg_ngrams(ld=words)['seg_ngrams']
+    fnc = pros.count_cv_skeleta if ngram_type=='cv' else pros.count_x_grids
+    shapes = fnc(ld=words, featpath=featpath, ignore_stress=ignore_stress)
+    return pros.count_cv_grid_ngrams(inddic=shapes)['ngramdic']
+
+
+def encode_counts(counts, index):
+    '''
+    (columns, counts) arrays for a {ngram: count} dictionary. ngrams missing from index are added to it
+    '''
+    cols = numpy.empty(len(counts), dtype=numpy.int64)
+    vals = numpy.empty(len(counts), dtype=numpy.int64)
+    for i, (ng, c) in enumerate(counts.items()):
+        if ng not in index:
+            index[ng] = len(index)
+        cols[i] = index[ng]
+        vals[i] = c
+    return cols, vals
+
+
+def build_matrix(**kwargs):
+    '''
+    counts the ngrams of the lexicon (kwargs['lex'], a list of words) once, and of each sublexicon in kwargs['sublexes'] ({name: list of words}).
+    kwargs['ngram_type'] is 'seg' (default), 'cv' or 'xgrid'.
+    returns kwargs with 'ngram_matrix':
+        ngram_type, index: {ngram: column}, ngrams: the column labels,
+        lex: the lexicon's counts (a vector), lexsize: the number of words in the lexicon, lextypes: how many columns the lexicon has (the first lextypes columns),
+        names: the sublexicon names, sub: a sparse sublexicon-by-ngram count matrix, sizes: the number of words in each sublexicon
+    '''
+    ngram_type = kwargs.get('ngram_type', 'seg')
+    index = {}
+    opts = {'featpath':kwargs.get('featpath'), 'ignore_stress':kwargs.get('ignore_stress', False)}
+    cols, vals = encode_counts(ngram_counts(kwargs['lex'], ngram_type, **opts), index)
+    lex = numpy.zeros(len(index), dtype=numpy.int64)
+    lex[cols] = vals
+    nm = {'ngram_type':ngram_type, 'index':index, 'lex':lex, 'lexsize':len(kwargs['lex']), 'lextypes':len(index),
+          'names':[], 'sub':sparse.csr_matrix((0, len(index)), dtype=numpy.int64), 'sizes':[]}
+    kwargs['ngram_matrix'] = add_sublexicons(nm, kwargs.get('sublexes', {}), **opts)
+    return kwargs
+
+
+def add_sublexicons(nm, sublexes, featpath=None, ignore_stress=False):
+    '''
+    adds rows for more sublexicons ({name: list of words}) to an ngram matrix, without recounting the lexicon. returns the matrix
+    '''
+    rows, cols, vals = [], [], []
+    for name, words in sublexes.items():
+        c, v = encode_counts(ngram_counts(words, nm['ngram_type'], featpath, ignore_stress), nm['index'])
+        rows.append(numpy.full(len(c), len(nm['names']), dtype=numpy.int64))
+        cols.append(c)
+        vals.append(v)
+        nm['names'].append(name)
+        nm['sizes'].append(len(words))
+    width = len(nm['index'])
+    nm['lex'] = numpy.concatenate([nm['lex'], numpy.zeros(width-len(nm['lex']), dtype=numpy.int64)])
+    old = nm['sub'].tocoo()
+    rows = numpy.concatenate([old.row.astype(numpy.int64)] + rows)
+    cols = numpy.concatenate([old.col.astype(numpy.int64)] + cols)
+    vals = numpy.concatenate([old.data] + vals)
+    nm['sub'] = sparse.csr_matrix((vals, (rows, cols)), shape=(len(nm['names']), width))
+    nm['ngrams'] = list(nm['index'])
+    return nm
+
+
+def lsub_table(nm, name):
+    '''
+    the {ngram: {'lex', 'sublex'}} table for one sublexicon: every ngram of the lexicon, then the ones only the sublexicon has
+    '''
+    row = nm['sub'].getrow(nm['names'].index(name))
+    subcounts = dict(zip(row.indices.tolist(), row.data.tolist()))
+    cols = list(range(nm['lextypes'])) + sorted(c for c in subcounts if c >= nm['lextypes'])
+    return {nm['ngrams'][c]:{'lex':int(nm['lex'][c]), 'sublex':subcounts.get(c, 0)} for c in cols}
+
+
+def write_lsub(table, outpath):
+    with open(outpath, 'w', encoding='utf-8') as f:
+        f.write("NGRAM\tLEX\tSUBLEX\n")
+        for i in table:
+            f.write(f"{i}\t{table[i]['lex']}\t{table[i]['sublex']}\n")
+
+
+def divergences(nm, smoothing=0.5, base=2):
+    '''
+    compares every sublexicon's ngram distribution with the lexicon's, all rows at once. returns {name: {...}} with
+        kl: KL(sublexicon || lexicon), how surprising the sublexicon's ngrams are given the lexicon's. both distributions get add-k smoothing over the lexicon's ngrams plus the sublexicon's unseen ones, so it stays finite when the sublexicon has an ngram the lexicon lacks (smoothing=0 gives the plain, possibly infinite, KL)
+        js: the Jensen-Shannon divergence, unsmoothed (between 0 and 1 in base 2)
+        cosine: the cosine similarity of the two count vectors
+        types: how many distinct ngrams the sublexicon has, and unseen: how many of those the lexicon lacks
+    only the sublexicons' nonzero entries are visited: the contribution of the lexicon's other ngrams is added in closed form.
+    '''
+    sub = nm['sub'].tocsr()
+    k = sub.shape[0]
+    lex = nm['lex'].astype(float)
+    nlex = lex.sum()
+    ntypes = numpy.diff(sub.indptr)
+    rows = numpy.repeat(numpy.arange(k), ntypes)
+    s = sub.data.astype(float)
+    l = lex[sub.indices]
+    nsub = numpy.bincount(rows, s, minlength=k)
+    unseen = numpy.bincount(rows, l==0, minlength=k)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        cosine = numpy.bincount(rows, s*l, minlength=k)/(numpy.sqrt(numpy.bincount(rows, s*s, minlength=k))*numpy.sqrt((lex*lex).sum()))
+        #Jensen-Shannon: where the sublexicon has no ngram, only the lexicon's half contributes, q*log(2)
+        p = s/nsub[rows]
+        q = l/nlex
+        m = (p+q)/2
+        seen = q > 0
+        kl_pm = numpy.bincount(rows, p*numpy.log(p/m), minlength=k)
+        kl_qm = numpy.bincount(rows[seen], q[seen]*numpy.log(q[seen]/m[seen]), minlength=k)
+        js = 0.5*kl_pm + 0.5*(kl_qm + numpy.log(2)*(1 - numpy.bincount(rows, q, minlength=k)))
+        #KL over each sublexicon's own vocabulary: the lexicon's ngrams plus its unseen ones
+        a = smoothing
+        vocab = nm['lextypes'] + unseen
+        pden = nsub + a*vocab
+        qden = nlex + a*vocab
+        p = (s+a)/pden[rows]
+        logq = numpy.log(l+a) - numpy.log(qden[rows])
+        kl_in = numpy.bincount(rows, numpy.where(p > 0, p*(numpy.log(p) - logq), 0), minlength=k)
+        #the lexicon ngrams missing from the sublexicon all get the same smoothed probability p0
+        p0 = a/pden
+        lexlog = numpy.log(lex[:nm['lextypes']]+a).sum()
+        rowlog = numpy.bincount(rows, numpy.where(seen, numpy.log(l+a), 0), minlength=k)
+        missing = vocab - ntypes
+        kl_out = numpy.where(p0 > 0, p0*(missing*numpy.log(p0) - (lexlog - rowlog) + missing*numpy.log(qden)), 0)
+        kl = kl_in + kl_out
+    logb = numpy.log(base)
+    out = {}
+    for i, name in enumerate(nm['names']):
+        out[name] = {'kl':float(kl[i]/logb), 'js':float(js[i]/logb), 'cosine':float(cosine[i]), 'types':int(ntypes[i]), 'unseen':int(unseen[i])}
+    return out
+
+
+if __name__=="__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="compares the ngram counts of one reference lexicon with any number of sublexicons")
+    parser.add_argument("--lexicon", help="partial path to the reference lexicon (inside 'data'), e.g. russian/freq_noun_stems", required=True)
+    parser.add_argument("--sublexicons", help="partial paths to the sublexicons", nargs='+', required=True)
+    parser.add_argument("--ngram_type", help="segmental ngrams, or ngrams over CV skeleta or x grids", choices=['seg', 'cv', 'xgrid'], default='seg')
+    parser.add_argument("--smoothing", help="add-k smoothing for the KL divergence (default 0.5; 0 for none)", type=float, default=0.5)
+    parser.add_argument("--tables", help="write the NGRAM/LEX/SUBLEX table of each sublexicon into its directory, as segments.py and prosody.py do", type=bool, default=False)
+    parser.add_argument("--keep_mb", help="keep morpheme boundaries (|) as segments instead of dropping them", type=bool, default=False)
+    parser.add_argument("--ignore_stress", help="ignore stress when counting x-grids", type=bool, default=False)
+    args = parser.parse_args()
+    lexdir = os.path.join(datapath, args.lexicon)
+    kwargs = {'ngram_type':args.ngram_type, 'featpath':os.path.join(lexdir, 'Features.txt'), 'ignore_stress':args.ignore_stress}
+    kwargs['lex'] = ldr.read_ld(ld=os.path.join(lexdir, 'LearningData.txt'), keep_mb=args.keep_mb, dedupe=True)
+    kwargs['sublexes'] = {s:ldr.read_ld(ld=os.path.join(datapath, s, 'LearningData.txt'), keep_mb=args.keep_mb, dedupe=True) for s in args.sublexicons}
+    nm = build_matrix(**kwargs)['ngram_matrix']
+    div = divergences(nm, smoothing=args.smoothing)
+    print(f"sublexicon\twords\tngrams\tunseen\tkl\tjs\tcosine")
+    for i, name in enumerate(nm['names']):
+        d = div[name]
+        print(f"{name}\t{nm['sizes'][i]}\t{d['types']}\t{d['unseen']}\t{d['kl']:.4f}\t{d['js']:.4f}\t{d['cosine']:.4f}")
+    if args.tables:
+        for name in nm['names']:
+            outpath = os.path.join(datapath, name, table_names[args.ngram_type])
+            write_lsub(lsub_table(nm, name), outpath)
+            print(f"{outpath} written")
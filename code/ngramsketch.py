@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import math, ast, re
+from functools import lru_cache
+from itertools import islice
+import numpy
+
+# should be in the same code directory
+import nclasses as pnc
+
+'''
+approximate ngram counting in fixed memory, for word lists too big for the exact dictionaries in segments.py.
+
+natural class ngrams are the problem: every segment belongs to ~50 natural classes in the Russian feature system, so each segmental trigram expands into ~125,000 class trigrams, and 17 words already give over 2 million of them. here the counts go into a count-min sketch instead of a dictionary: a depth x width table of counters, where each ngram adds its count to one counter per row (picked by a different hash per row), and its estimated count is the smallest of its counters.
+    - estimates are never too low, and too high by at most eps*N (N = the total count) with probability 1-delta, for width = e/eps and depth = ln(1/delta). updates are conservative (only the counters that would otherwise undercount go up), which makes the overestimates much smaller in practice
+    - memory is the table (8*width*depth bytes) plus a list of the topk heavy hitters, whatever the size of the word list. pass max_mb to cap the table; eps is then whatever that width allows (see error_bound())
+    - ngrams are encoded as integers (one digit per segment or class, in base number of symbols + 1), so whole batches are hashed and counted with numpy
+
+NgramSketch answers the same questions as the count dictionaries: sk[ngram] and sk.get(ngram) for any ngram (a space-separated string of segments, a class ngram string as segments.make_natclass_ngrams writes it, or a tuple of segments or classes), sk.get_many(ngrams) for a whole list at once, and iterating over it gives the heavy hitters, so sorted(sk, key=sk.get, reverse=True) gives the top-k table. sk.most_common(k) does the same as a list of pairs.
+
+    sk = sketch_ngrams(ld=ldr.stream_ld(ld=path), featpath=featpath, natclasses=True, max_mb=64)
+    sk['seg_ngrams'].most_common(20)
+'''
+
+def _mix(x):
+    '''
+    splitmix64 finalizer: scrambles structured integer keys before they are hashed into rows
+    '''
+    x = x.astype(numpy.uint64)
+    with numpy.errstate(over='ignore'):
+        x = (x ^ (x >> numpy.uint64(30))) * numpy.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> numpy.uint64(27))) * numpy.uint64(0x94D049BB133111EB)
+        x = x ^ (x >> numpy.uint64(31))
+    return x
+
+
+class CountMinSketch:
+    '''
+    a count-min sketch over uint64 keys. width is rounded up to a power of 2 (or down, to fit max_mb)
+    '''
+    def __init__(self, eps=1e-4, delta=1e-3, max_mb=None, seed=55, conservative=True):
+        depth = max(1, math.ceil(math.log(1/delta)))
+        logw = max(1, math.ceil(math.log2(math.e/eps)))
+        if max_mb is not None:
+            logw = min(logw, int(math.log2(max_mb*2**20/(8*depth))))
+        self.depth, self.width, self.logw = depth, 2**logw, logw
+        self.table = numpy.zeros((depth, self.width), dtype=numpy.int64)
+        rng = numpy.random.default_rng(seed)
+        #odd multipliers for multiply-shift hashing, one per row
+        self.mult = rng.integers(1, 2**63, size=depth, dtype=numpy.uint64)*numpy.uint64(2) + numpy.uint64(1)
+        self.conservative = conservative
+        self.total = 0
+
+    def cells(self, keys):
+        '''
+        depth x len(keys) column indices
+        '''
+        mixed = _mix(keys)
+        with numpy.errstate(over='ignore'):
+            return ((self.mult[:, None]*mixed[None, :]) >> numpy.uint64(64-self.logw)).astype(numpy.int64)
+
+    def update(self, keys, counts=None):
+        '''
+        adds counts (default 1 each) for an array of keys
+        '''
+        keys = numpy.asarray(keys, dtype=numpy.uint64)
+        counts = numpy.ones(len(keys), dtype=numpy.int64) if counts is None else numpy.asarray(counts, dtype=numpy.int64)
+        keys, inverse = numpy.unique(keys, return_inverse=True)
+        counts = numpy.bincount(inverse, weights=counts, minlength=len(keys)).astype(numpy.int64)
+        idx = self.cells(keys)
+        self.total += int(counts.sum())
+        if self.conservative:
+            new = self.table[numpy.arange(self.depth)[:, None], idx].min(axis=0) + counts
+            for r in range(self.depth):
+                numpy.maximum.at(self.table[r], idx[r], new)
+        else:
+            for r in range(self.depth):
+                numpy.add.at(self.table[r], idx[r], counts)
+        return keys
+
+    def query(self, keys):
+        keys = numpy.asarray(keys, dtype=numpy.uint64)
+        return self.table[numpy.arange(self.depth)[:, None], self.cells(keys)].min(axis=0)
+
+    def error_bound(self):
+        '''
+        (eps*N, delta): estimates exceed true counts by more than eps*N with probability at most delta
+        '''
+        return math.e/self.width*self.total, math.exp(-self.depth)
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+
+
+class NgramSketch:
+    '''
+    approximate ngram counts: a count-min sketch plus the topk heaviest ngrams seen so far.
+    symbols are the segments (or classes) that ngrams are made of; fmt turns a tuple of symbols into the string the exact counters use as a key, parse turns such a string back into symbols, and symkey makes a symbol hashable (classes are sets)
+    '''
+    def __init__(self, symbols, topk=10000, fmt=' '.join, parse=None, symkey=None, **kwargs):
+        self.symbols = list(symbols)
+        self.symkey = symkey or (lambda s: s)
+        self.parse = parse or (lambda g: g.split(' '))
+        self.ids = {self.symkey(s):i for i, s in enumerate(self.symbols)}
+        self.base = len(self.symbols)+1
+        self.fmt = fmt
+        self.topk = topk
+        self.cms = CountMinSketch(**kwargs)
+        self.heavy = {}
+        self.shown = {}
+
+    def encode(self, idmat):
+        '''
+        integer keys for a n x len matrix of symbol ids (-1 for padding, so that 'a' and 'a a' differ)
+        '''
+        keys = numpy.zeros(idmat.shape[0], dtype=numpy.uint64)
+        for j in range(idmat.shape[1]):
+            keys = keys*numpy.uint64(self.base) + (idmat[:, j]+1).astype(numpy.uint64)
+        return keys
+
+    def decode(self, key):
+        key = int(key)
+        out = []
+        while key:
+            key, d = divmod(key, self.base)
+            out.append(self.symbols[d-1])
+        return tuple(reversed(out))
+
+    def key(self, ngram):
+        if isinstance(ngram, str):
+            if ngram in self.shown:
+                return self.shown[ngram]
+            try:
+                ngram = self.parse(ngram)
+            except (ValueError, SyntaxError):
+                return None
+        ngram = [self.symkey(s) for s in ngram]
+        if any(s not in self.ids for s in ngram):
+            return None
+        #the same key as encode, without building an array for one ngram
+        key = 0
+        for s in ngram:
+            key = key*self.base + self.ids[s]+1
+        return key
+
+    def update_ids(self, idmat, counts=None):
+        keys = self.cms.update(self.encode(idmat), counts)
+        est = self.cms.query(keys)
+        #only keys that could make the top k are candidates
+        if len(keys) > self.topk:
+            top = numpy.argpartition(est, -self.topk)[-self.topk:]
+            keys, est = keys[top], est[top]
+        self.heavy.update(zip(keys.tolist(), est.tolist()))
+        if len(self.heavy) > 2*self.topk:
+            self.prune()
+
+    def prune(self):
+        hk = numpy.array(list(self.heavy), dtype=numpy.uint64)
+        est = self.cms.query(hk)
+        keep = numpy.argsort(-est, kind='stable')[:self.topk]
+        self.heavy = dict(zip(hk[keep].tolist(), est[keep].tolist()))
+
+    def update(self, ngrams, counts=None):
+        '''
+        adds ngrams (tuples or space-separated strings of symbols, all of the same length) with counts
+        '''
+        ngrams = [self.parse(g) if isinstance(g, str) else g for g in ngrams]
+        if ngrams:
+            self.update_ids(numpy.array([[self.ids[self.symkey(s)] for s in g] for g in ngrams]), counts)
+
+    def get(self, ngram, default=0):
+        key = self.key(ngram)
+        if key is None:
+            return default
+        return int(self.cms.query([key])[0])
+
+    def get_many(self, ngrams, default=0):
+        '''
+        get for a list of ngrams at once, as an array
+        '''
+        keys = [self.key(g) for g in ngrams]
+        found = numpy.array([k is not None for k in keys], dtype=bool)
+        out = numpy.full(len(keys), default, dtype=numpy.int64)
+        if found.any():
+            out[found] = self.cms.query([k for k in keys if k is not None])
+        return out
+
+    def __getitem__(self, ngram):
+        return self.get(ngram)
+
+    def most_common(self, k=None):
+        '''
+        [(ngram string, estimated count)] for the heaviest k ngrams, largest first
+        '''
+        self.prune()
+        out = [(self.fmt(self.decode(key)), c) for key, c in islice(self.heavy.items(), k)]
+        #the strings can be looked up again, even where they can't be split back into symbols
+        self.shown = {ngram:key for (ngram, c), key in zip(out, self.heavy)}
+        return out
+
+    def __iter__(self):
+        for ngram, c in self.most_common():
+            yield ngram
+
+    def __len__(self):
+        return len(self.heavy)
+
+    def __contains__(self, ngram):
+        return self.get(ngram) > 0
+
+    def error_bound(self):
+        return self.cms.error_bound()
+
+    @property
+    def nbytes(self):
+        return self.cms.nbytes
+
+
+def _class_fmt(classes):
+    return str(tuple(classes))
+
+
+set_literal = re.compile(r"\{[^{}]*\}")
+
+@lru_cache(maxsize=None)
+def _class_literal(lit):
+    return frozenset(ast.literal_eval(lit))
+
+def _class_parse(ngram):
+    '''
+    the classes in a key written by _class_fmt (or segments.make_natclass_ngrams), e.g. "({'-mb'}, {'+cor', '+strid'})". each set is parsed once and cached, since there are only as many as there are classes
+    '''
+    lits = set_literal.findall(ngram)
+    if not lits or set_literal.sub('', ngram).replace(' ', '')!='('+','*max(1, len(lits)-1)+')':
+        raise ValueError(f"not a class ngram: {ngram!r}")
+    return tuple(_class_literal(lit) for lit in lits)
+
+
+def sketch_ngrams(**kwargs):
+    '''
+    one pass over the words in kwargs['ld'] (a list or a stream, e.g. ldr.stream_ld), counting segmental ngrams (up to trigrams, as in segments.count_seg_ngrams) into kwargs['seg_ngrams'], an NgramSketch.
+    with kwargs['natclasses'], also counts the natural class ngrams that segments.make_natclass_ngrams would, into kwargs['natclass_ngrams'].
+    sketch options: eps, delta, max_mb (the cap for each sketch), topk, seed.
+    words are counted exactly in chunks of kwargs['chunk'] words, so each distinct segmental ngram in a chunk is expanded into class ngrams once.
+    '''
+    opts = {k:kwargs[k] for k in ('eps', 'delta', 'max_mb', 'topk', 'seed') if kwargs.get(k) is not None}
+    segdic = kwargs.get('segdic') or pnc.make_segdic(**kwargs)['segdic']
+    segsk = NgramSketch(segdic, **opts)
+    natsk, segclasses = None, None
+    if kwargs.get('natclasses'):
+        scd = kwargs.get('segclassdic') or pnc.sclassdic(**kwargs)['segclassdic']
+        classes, seen = [], set()
+        for s in scd:
+            for cl in scd[s]:
+                if frozenset(cl) not in seen:
+                    seen.add(frozenset(cl))
+                    classes.append(cl)
+        natsk = NgramSketch(classes, fmt=_class_fmt, parse=_class_parse, symkey=frozenset, **opts)
+        segclasses = {s:numpy.array([natsk.ids[frozenset(cl)] for cl in scd[s]]) for s in scd}
+    batch = kwargs.get('batch', 2**18)
+    words = iter(kwargs['ld'])
+    chunk = kwargs.get('chunk', 5000)
+    while True:
+        wds = list(islice(words, chunk))
+        if not wds:
+            break
+        counts = {}
+        for strw in wds:
+            segs = strw.split(" ")
+            for n in range(1, 4):
+                for i in range(len(segs)-n+1):
+                    g = tuple(segs[i:i+n])
+                    counts[g] = counts.get(g, 0)+1
+        for n in range(1, 4):
+            grams = [g for g in counts if len(g)==n]
+            if not grams:
+                continue
+            segsk.update(grams, [counts[g] for g in grams])
+            if natsk is None:
+                continue
+            buf, bufc, size = [], [], 0
+            for g in grams:
+                #every combination of the classes of each segment
+                grid = numpy.stack(numpy.meshgrid(*[segclasses[s] for s in g], indexing='ij'), axis=-1).reshape(-1, n)
+                buf.append(grid)
+                bufc.append(numpy.full(len(grid), counts[g], dtype=numpy.int64))
+                size += len(grid)
+                if size >= batch:
+                    natsk.update_ids(numpy.concatenate(buf), numpy.concatenate(bufc))
+                    buf, bufc, size = [], [], 0
+            if buf:
+                natsk.update_ids(numpy.concatenate(buf), numpy.concatenate(bufc))
+    kwargs['seg_ngrams'] = segsk
+    if natsk is not None:
+        kwargs['natclass_ngrams'] = natsk
+    if kwargs.get('verbosity', 1) > 0:
+        for name, sk in (('segmental', segsk), ('natural class', natsk)):
+            if sk is not None:
+                err, delta = sk.error_bound()
+                print(f"{name} ngrams: {sk.cms.total} counted in {sk.nbytes/2**20:.1f} MB, estimates within +{err:.0f} with probability {1-delta:.3f}")
+    return kwargs
@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os, sys, re, json, hashlib, pickle, time, inspect
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+'''
+a manifest-driven runner for the analyses in the paper, so that reproducing them is one command instead of a dozen, and nothing that hasn't changed gets recomputed.
+
+the manifest (TOML or JSON) lists datasets, each a lexicon/sublexicon pair with the analyses to run on it; see paper.toml:
+
+    [settings]
+    cache = "../pipeline_cache"
+    outdir = "../pipeline_out"
+    jobs = 4
+    nsamples = 100000
+
+    [[dataset]]
+    name = "astyj"
+    lexicon = "russian/freq_noun_stems"
+    sublexicon = "russian/freq_astyj"
+    analyses = ["last", "plotsims", "seg_ngrams", "cv_ngrams", "xgrid_ngrams", "contingency", "syllplot"]
+
+any setting (nsamples, engine, seed, without_replacement, test, stats, ...) can be overridden per dataset, as long as one of the dataset's analyses uses it; a manifest with a setting that would be ignored is rejected.
+
+the analyses are broken down into a graph of nodes--compiled features, word lists, ngram counts per lexicon, lexicon/sublexicon tables, simulations, plots--and each node's result is cached under a key that hashes its settings and the source of the code it runs together with the keys of its inputs, down to the contents of the LearningData.txt and Features.txt files. so when a LearningData.txt (or, say, segments.py) is edited, only the nodes that depend on it get a new key and are rerun; a lexicon shared by several datasets is read, compiled and counted once. nodes whose inputs are ready run in parallel, in worker processes.
+
+the text reports (last.txt, the ngram tables, contingency and stats results) are rewritten from the cached results at the end of every run; plots are nodes of their own.
+
+    $ python pipeline.py --manifest paper.toml
+    $ python pipeline.py --manifest paper.toml --dry_run True
+'''
+
+#bump this to invalidate every cached result, e.g. after changing the format of the artifacts. edits to the code a node runs change its key by themselves (see code_key)
+pipeline_version = 1
+
+codepath = os.path.dirname(os.path.abspath(__file__))
+
+datapath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+settings_default = {'cache':'pipeline_cache', 'outdir':'pipeline_out', 'jobs':None, 'nsamples':10000, 'engine':'numpy',
+                    'seed':None, 'without_replacement':False, 'test':'fisher', 'stats':[], 'keep_mb':False, 'ftype':'pdf'}
+
+analyses_all = ('last', 'plotsims', 'seg_ngrams', 'cv_ngrams', 'xgrid_ngrams', 'contingency', 'stats', 'syllplot')
+
+#the analyses that use each setting a dataset can override
+setting_uses = {'nsamples':('last', 'plotsims', 'stats'), 'engine':('last', 'plotsims', 'stats'), 'seed':('last', 'plotsims', 'stats'),
+                'without_replacement':('last', 'plotsims', 'stats'), 'test':('contingency',), 'stats':('stats',),
+                'keep_mb':('seg_ngrams', 'cv_ngrams', 'xgrid_ngrams'), 'ftype':('plotsims', 'syllplot')}
+
+
+def read_manifest(path):
+    '''
+    reads a TOML (python 3.11+) or JSON manifest. relative cache and outdir paths are taken relative to the manifest
+    '''
+    if path.endswith('.toml'):
+        import tomllib
+        with open(path, 'rb') as f:
+            manifest = tomllib.load(f)
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    settings = dict(settings_default, **manifest.get('settings', {}))
+    base = os.path.dirname(os.path.abspath(path))
+    for k in ('cache', 'outdir'):
+        settings[k] = os.path.join(base, settings[k])
+    datasets = manifest.get('dataset', manifest.get('datasets', []))
+    for ds in datasets:
+        for k in ('name', 'lexicon', 'sublexicon'):
+            if k not in ds:
+                raise ValueError(f"every dataset needs a {k}: {ds}")
+        unknown = [a for a in ds.get('analyses', []) if a not in analyses_all]
+        if unknown:
+            raise ValueError(f"unknown analyses in {ds['name']}: {', '.join(unknown)} (try {', '.join(analyses_all)})")
+        #a setting that none of the dataset's analyses use would be silently ignored
+        analyses = ds.get('analyses', analyses_all)
+        for k in ds:
+            if k in ('name', 'lexicon', 'sublexicon', 'analyses'):
+                continue
+            if k not in setting_uses:
+                raise ValueError(f"{ds['name']} sets {k}, which can't be set per dataset (try {', '.join(setting_uses)})")
+            if not any(a in analyses for a in setting_uses[k]):
+                raise ValueError(f"{ds['name']} sets {k}, but none of its analyses use it (add one of: {', '.join(setting_uses[k])})")
+        if 'stats' in ds.get('analyses', []) and not dict(settings, **ds)['stats']:
+            raise ValueError(f"{ds['name']} runs the stats analysis but sets no stats")
+    return settings, datasets
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# the node functions. each gets its settings and its inputs' results (file inputs as paths) and returns a picklable result
+
+def node_features(params, featpath):
+    import nclasses as pnc
+    fstuff = pnc.make_featdic(featpath=featpath)
+    nclassdic = pnc.compactdic(featpath=featpath, verbosity=0)['nclassdic']
+    return {'featdic':fstuff['featdic'], 'segdic':fstuff['segdic'], 'nclassdic':nclassdic}
+
+def node_words(params, ld):
+    import learningdata as ldr
+    return ldr.read_ld(ld=ld, keep_mb=params['keep_mb'], dedupe=params['dedupe'], verbosity=0)
+
+def node_seg_counts(params, words):
+    import segments as sgs
+    return sgs.count_seg_ngrams(ld=words)['seg_ngrams']
+
+def node_pros_counts(params, words, featpath):
+    import prosody as pros
+    if params['kind']=='cv':
+        shapes = pros.count_cv_skeleta(ld=words, featpath=featpath)
+    else:
+        shapes = pros.count_x_grids(ld=words, featpath=featpath, ignore_stress=False)
+    return pros.count_cv_grid_ngrams(inddic=shapes)['ngramdic']
+
+def node_lsub(params, lex, sublex):
+    '''
+    joins lexicon and sublexicon ngram counts, in the same order as segments.lexsublex_seg_ngrams
+    '''
+    outdic = {k:{'sublex':0, 'lex':lex[k]} for k in lex}
+    for k in sublex:
+        if k in outdic:
+            outdic[k]['sublex'] = sublex[k]
+        else:
+            outdic[k] = {'lex':0, 'sublex':sublex[k]}
+    return outdic
+
+def node_contingency(params, lsub):
+    import lex_comparison as lc
+    return lc.batch_contingency(lsub=lsub, test=params['test'], verbosity=0)['contingency']
+
+def sim_kwargs(params, features, lex, sublex):
+    return {'lex':lex, 'sublex':sublex, 'featdic':features['featdic'], 'segdic':features['segdic'],
+            'nclassdic':{'nclassdic':features['nclassdic']}, 'nsamples':params['nsamples'], 'engine':params['engine'],
+            'seed':params['seed'], 'without_replacement':params['without_replacement'], 'samsize':len(sublex), 'verbosity':0}
+
+def node_last(params, features, lex, sublex):
+    import lex_comparison as lc
+    k = lc.finc_syllcount_monte(**sim_kwargs(params, features, lex, sublex))
+    return {'finc':k['finc'], 'nclinc':k['nclinc'], 'nclasses':len(features['nclassdic'])}
+
+def syllcounts(words, features):
+    import nclasses as pnc
+    vowels = pnc.get_vowels(featdic=features['featdic'])
+    return [len([x for x in wd.split(' ') if x in vowels]) for wd in words]
+
+def node_plotsims(params, features, lex, sublex):
+    import lex_comparison as lc
+    kw = sim_kwargs(params, features, None, sublex)
+    kw['lex'] = syllcounts(lex, features)
+    sub = syllcounts(sublex, features)
+    kw['maxsize'] = max(sub)
+    kw['engine'] = params['engine']
+    return {'sim':lc.ransample(**kw), 'maxsize':max(sub)}
+
+def node_stats(params, features, lex, sublex):
+    import lex_comparison as lc
+    kw = sim_kwargs(params, features, lex, sublex)
+    kw['stats'] = params['stats']
+    kw['engine'] = params['engine'] if params['engine']!='python' else 'numpy'
+    return lc.stat_monte(**kw)['statsims']
+
+def node_simplot(params, plotsims):
+    import plotter
+    import lex_comparison as lc
+    os.makedirs(params['outdir'], exist_ok=True)
+    ci = lc.ci_long(plotsims['sim']['max_length'])
+    plotter.plot_sim_with_ci(plotsims['sim']['max_length'], ci, abline=plotsims['maxsize'], fname=params['fname'], show=False, ftype=params['ftype'], outdir=params['outdir'])
+    return [os.path.join(params['outdir'], f"{params['fname']}.{params['ftype']}")]
+
+def node_syllplot(params, ld, features):
+    import plotter
+    import nclasses as pnc
+    os.makedirs(params['outdir'], exist_ok=True)
+    plotter.plot_syllcounts(ld, show=False, ftype=params['ftype'], color=False, vowels=pnc.get_vowels(featdic=features['featdic']), outdir=params['outdir'])
+    return [os.path.join(params['outdir'], f"{os.path.basename(os.path.dirname(ld))}.{params['ftype']}")]
+
+node_funcs = {'features':node_features, 'words':node_words, 'seg_counts':node_seg_counts, 'pros_counts':node_pros_counts,
+              'lsub':node_lsub, 'contingency':node_contingency, 'last':node_last, 'plotsims':node_plotsims,
+              'stats':node_stats, 'simplot':node_simplot, 'syllplot':node_syllplot}
+
+#the modules in this directory that each node function imports; code_key follows their imports from there
+node_modules = {'features':('nclasses',), 'words':('learningdata',), 'seg_counts':('segments',), 'pros_counts':('prosody',),
+                'lsub':(), 'contingency':('lex_comparison',), 'last':('lex_comparison',), 'plotsims':('lex_comparison',),
+                'stats':('lex_comparison',), 'simplot':('plotter', 'lex_comparison'), 'syllplot':('plotter', 'nclasses')}
+
+#helpers in this file that node functions call
+node_helpers = {'last':(sim_kwargs,), 'plotsims':(sim_kwargs, syllcounts), 'stats':(sim_kwargs,)}
+
+#nodes whose results are files on disk: rerun if the files have gone missing
+file_nodes = ('simplot', 'syllplot')
+
+
+def build_graph(settings, datasets):
+    '''
+    returns {node id: {'func', 'params', 'deps': {argument: node id}, 'dataset'}}. shared inputs (the same file, the same lexicon's counts) get the same node id, so they are computed once, and have no dataset; the nodes that belong to one dataset's reports have its name
+    '''
+    graph = {}
+
+    def add(nid, func, params=None, deps=None, dataset=None):
+        if nid not in graph:
+            graph[nid] = {'func':func, 'params':params or {}, 'deps':deps or {}, 'dataset':dataset}
+        return nid
+
+    def source(path):
+        return add(f'file:{path}', 'file', {'path':path})
+
+    for ds in datasets:
+        opts = dict(settings, **{k:v for k, v in ds.items() if k in settings_default})
+        lexdir, subdir = os.path.join(datapath, ds['lexicon']), os.path.join(datapath, ds['sublexicon'])
+        outdir = os.path.join(settings['outdir'], ds['name'])
+        featfile = source(os.path.join(lexdir, 'Features.txt'))
+        feats = add(f'features:{lexdir}', 'features', deps={'featpath':featfile})
+        #the simulations sample every line, doublets and "|" included, as lex_comparison.py --last does; the ngram counts go over the distinct words, as segments.py and prosody.py do
+        words, simwords = {}, {}
+        for role, d in (('lex', lexdir), ('sublex', subdir)):
+            ld = source(os.path.join(d, 'LearningData.txt'))
+            words[role] = add(f"words:{d}:{opts['keep_mb']}:dedupe", 'words', {'keep_mb':opts['keep_mb'], 'dedupe':True}, {'ld':ld})
+            simwords[role] = add(f"words:{d}:all", 'words', {'keep_mb':True, 'dedupe':False}, {'ld':ld})
+        analyses = ds.get('analyses', analyses_all)
+        simparams = {k:opts[k] for k in ('nsamples', 'engine', 'seed', 'without_replacement')}
+        tables = []
+        for kind in ('seg', 'cv', 'xgrid'):
+            if f'{kind}_ngrams' not in analyses:
+                continue
+            counts = {}
+            for role, d in (('lex', lexdir), ('sublex', subdir)):
+                if kind=='seg':
+                    counts[role] = add(f'seg_counts:{words[role]}', 'seg_counts', deps={'words':words[role]})
+                else:
+                    counts[role] = add(f'{kind}_counts:{words[role]}', 'pros_counts', {'kind':kind}, {'words':words[role], 'featpath':featfile})
+            tables.append(add(f"lsub:{ds['name']}:{kind}", 'lsub', {'kind':kind}, counts, ds['name']))
+        if 'contingency' in analyses:
+            for t in tables:
+                add(f"contingency:{t}", 'contingency', {'test':opts['test']}, {'lsub':t}, ds['name'])
+        sims = {'features':feats, 'lex':simwords['lex'], 'sublex':simwords['sublex']}
+        if 'last' in analyses:
+            add(f"last:{ds['name']}", 'last', simparams, sims, ds['name'])
+        if 'plotsims' in analyses:
+            ps = add(f"plotsims:{ds['name']}", 'plotsims', simparams, sims, ds['name'])
+            fname = '_'.join([os.path.basename(lexdir), 'vs', os.path.basename(subdir)])
+            add(f"simplot:{ds['name']}", 'simplot', {'outdir':outdir, 'fname':fname, 'ftype':opts['ftype']}, {'plotsims':ps}, ds['name'])
+        if 'stats' in analyses and opts['stats']:
+            add(f"stats:{ds['name']}", 'stats', dict(simparams, stats=list(opts['stats'])), sims, ds['name'])
+        if 'syllplot' in analyses:
+            for d in (lexdir, subdir):
+                add(f"syllplot:{d}:{outdir}", 'syllplot', {'outdir':outdir, 'ftype':opts['ftype']},
+                    {'ld':source(os.path.join(d, 'LearningData.txt')), 'features':feats}, ds['name'])
+    return graph
+
+
+def topo_order(graph):
+    order, seen = [], set()
+    def visit(nid):
+        if nid in seen:
+            return
+        seen.add(nid)
+        for d in graph[nid]['deps'].values():
+            visit(d)
+        order.append(nid)
+    for nid in graph:
+        visit(nid)
+    return order
+
+
+local_import = re.compile(r"^\s*(?:import (\w+)|from (\w+) import)|lazy_module\('(\w+)'\)", re.M)
+
+def module_closure(modules):
+    '''
+    the modules in this directory that modules import, directly, lazily or through each other, themselves included
+    '''
+    seen, todo = set(), list(modules)
+    while todo:
+        mod = todo.pop()
+        path = os.path.join(codepath, f'{mod}.py')
+        if mod in seen or not os.path.exists(path):
+            continue
+        seen.add(mod)
+        with open(path, 'r', encoding='utf-8') as f:
+            todo += [a or b or c for a, b, c in local_import.findall(f.read())]
+    return sorted(seen)
+
+def code_key(func):
+    '''
+    a hash of the code behind a node: the source of its function and helpers here, and of every module it uses
+    '''
+    h = hashlib.sha256()
+    for f in (node_funcs[func],) + node_helpers.get(func, ()):
+        h.update(inspect.getsource(f).encode('utf-8'))
+    for mod in module_closure(node_modules[func]):
+        h.update(mod.encode('utf-8'))
+        h.update(file_hash(os.path.join(codepath, f'{mod}.py')).encode('utf-8'))
+    return h.hexdigest()
+
+
+def node_keys(graph):
+    '''
+    content keys for every node: files are hashed, and every other node hashes its function, the code behind it, its settings and its inputs' keys
+    '''
+    keys, codes = {}, {}
+    for nid in topo_order(graph):
+        node = graph[nid]
+        if node['func']=='file':
+            keys[nid] = file_hash(node['params']['path'])
+            continue
+        if node['func'] not in codes:
+            codes[node['func']] = code_key(node['func'])
+        ident = [pipeline_version, node['func'], codes[node['func']], node['params'], sorted((arg, keys[d]) for arg, d in node['deps'].items())]
+        keys[nid] = hashlib.sha256(json.dumps(ident, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    return keys
+
+
+def artifact_path(cache, func, key):
+    return os.path.join(cache, func, key + '.pkl')
+
+
+def load_artifact(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def is_cached(graph, keys, cache, nid):
+    node = graph[nid]
+    if node['func']=='file':
+        return True
+    path = artifact_path(cache, node['func'], keys[nid])
+    if not os.path.exists(path):
+        return False
+    if node['func'] in file_nodes:
+        return all(os.path.exists(x) for x in load_artifact(path))
+    return True
+
+
+def run_node(func, params, inputs, outpath):
+    '''
+    runs in a worker: loads the inputs (file inputs are passed as paths), runs the node, and saves its result atomically
+    '''
+    args = {arg:(load_artifact(val) if kind=='artifact' else val) for arg, (kind, val) in inputs.items()}
+    start = time.time()
+    result = node_funcs[func](params, **args)
+    os.makedirs(os.path.dirname(outpath), exist_ok=True)
+    tmp = f"{outpath}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, outpath)
+    return time.time() - start
+
+
+def _worker_init():
+    #workers never open plot windows
+    os.environ['MPLBACKEND'] = 'Agg'
+
+
+def run_graph(graph, settings, dry_run=False, force=(), verbosity=1):
+    '''
+    runs every node that isn't cached (or whose id starts with one of the force prefixes), in parallel where the graph allows. returns the node keys
+    '''
+    keys = node_keys(graph)
+    cache = settings['cache']
+    todo = [nid for nid in topo_order(graph) if not is_cached(graph, keys, cache, nid) or (graph[nid]['func']!='file' and nid.startswith(tuple(force)) and force)]
+    if verbosity > 0:
+        print(f"{len(graph)} nodes, {len(todo)} to run")
+    if dry_run:
+        for nid in todo:
+            print(f"would run {nid}")
+        return keys
+    pending = set(todo)
+    running = {}
+
+    def inputs(nid):
+        out = {}
+        for arg, d in graph[nid]['deps'].items():
+            if graph[d]['func']=='file':
+                out[arg] = ('path', graph[d]['params']['path'])
+            else:
+                out[arg] = ('artifact', artifact_path(cache, graph[d]['func'], keys[d]))
+        return out
+
+    with ProcessPoolExecutor(max_workers=settings['jobs'], initializer=_worker_init) as pool:
+        while pending or running:
+            ready = [nid for nid in pending if not any(d in pending or d in running.values() for d in graph[nid]['deps'].values())]
+            for nid in sorted(ready):
+                pending.discard(nid)
+                node = graph[nid]
+                fut = pool.submit(run_node, node['func'], node['params'], inputs(nid), artifact_path(cache, node['func'], keys[nid]))
+                running[fut] = nid
+            if not running:
+                raise RuntimeError(f"cannot schedule {sorted(pending)}: the graph has a cycle")
+            done, x = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                nid = running.pop(fut)
+                secs = fut.result()
+                if verbosity > 0:
+                    print(f"ran {nid} ({secs:.1f} s)")
+    return keys
+
+
+def write_table(lsub, outpath):
+    with open(outpath, 'w', encoding='utf-8') as f:
+        f.write("NGRAM\tLEX\tSUBLEX\n")
+        for i in lsub:
+            f.write(f"{i}\t{lsub[i]['lex']}\t{lsub[i]['sublex']}\n")
+
+
+def write_last(res, nsamples, outpath):
+    '''
+    the --last report of lex_comparison.py, as a file
+    '''
+    finc = res['finc']
+    with open(outpath, 'w', encoding='utf-8') as f:
+        f.write(f"How often the nat class of last seg and the max syll count were the same in simulation as in the sublexicon:\n{finc['joint']}/{nsamples}\n")
+        f.write("The natural classes of stem-final segments in the simulations:\n")
+        for i in sorted(finc['lastnclass'], key=finc['lastnclass'].get, reverse=True):
+            f.write(f"{i}\t{finc['lastnclass'][i]}\n")
+        f.write("Max stem lengths\n")
+        for i in sorted(finc['maxlenth'], key=finc['maxlenth'].get, reverse=True):
+            f.write(f"{i}\t{finc['maxlenth'][i]}\n")
+        f.write(f"There were {len(res['nclinc'])} natural classes out of {res['nclasses']} that did not occur in stem-final position in the sublexicon\n")
+        f.write("class\tsegs\tsize\tn_sims_not_drawn\n")
+        for i in res['nclinc']:
+            f.write(f"{i}\t{','.join(sorted(res['nclinc'][i]['segs']))}\t{len(res['nclinc'][i]['segs'])}\t{res['nclinc'][i]['sim']}\n")
+
+
+def write_reports(graph, keys, settings, datasets, verbosity=1):
+    '''
+    writes the text outputs of every dataset from the cached results
+    '''
+    import lex_comparison as lc
+    names = {'seg':'lex_sublex_segmental_ngrams', 'cv':'cv_ngrams', 'xgrid':'xgrid_ngrams'}
+    written = []
+    for ds in datasets:
+        outdir = os.path.join(settings['outdir'], ds['name'])
+        os.makedirs(outdir, exist_ok=True)
+        nsamples = ds.get('nsamples', settings['nsamples'])
+        for nid, node in graph.items():
+            if node['dataset']!=ds['name']:
+                continue
+            res = load_artifact(artifact_path(settings['cache'], node['func'], keys[nid]))
+            if node['func']=='lsub':
+                outpath = os.path.join(outdir, f"{names[node['params']['kind']]}.txt")
+                write_table(res, outpath)
+            elif node['func']=='contingency':
+                kind = graph[node['deps']['lsub']]['params']['kind']
+                outpath = os.path.join(outdir, f"{names[kind]}_{node['params']['test']}.txt")
+                lc.write_contingency(res, outpath)
+            elif node['func']=='last':
+                outpath = os.path.join(outdir, 'last.txt')
+                write_last(res, nsamples, outpath)
+            elif node['func']=='plotsims':
+                outpath = os.path.join(outdir, 'max_length.txt')
+                lc.write_hist(res['sim']['max_length'], outpath)
+            elif node['func']=='stats':
+                outpath = os.path.join(outdir, 'stats.txt')
+                with open(outpath, 'w', encoding='utf-8') as f:
+                    f.write("stat\tsublex\tmean_sim\tp_absent\tp_all\tp_low\tp_high\n")
+                    for spec in res:
+                        r = res[spec]
+                        f.write(f"{spec}\t{r['sublex']}\t{r['mean']:.3f}\t{r['p_absent']:.5f}\t{r['p_all']:.5f}\t{r['p_low']:.5f}\t{r['p_high']:.5f}\n")
+            else:
+                continue
+            written.append(outpath)
+    if verbosity > 0:
+        print(f"{len(written)} reports written to {settings['outdir']}")
+    return written
+
+
+if __name__=="__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="runs the analyses listed in a manifest, recomputing only what has changed")
+    parser.add_argument("--manifest", help="a TOML or JSON manifest of datasets and analyses (see paper.toml)", required=True)
+    parser.add_argument("--jobs", help="number of worker processes (default: the manifest's setting, or one per cpu)", type=int, default=None)
+    parser.add_argument("--dry_run", help="list the nodes that would run, without running them", type=bool, default=False)
+    parser.add_argument("--force", help="rerun the nodes whose ids start with these prefixes even if they are cached (e.g. last: or plotsims:astyj)", nargs='+', default=[])
+    parser.add_argument("--verbosity", help="0 for quiet", type=int, default=1)
+    args = parser.parse_args()
+    settings, datasets = read_manifest(args.manifest)
+    if args.jobs is not None:
+        settings['jobs'] = args.jobs
+    graph = build_graph(settings, datasets)
+    keys = run_graph(graph, settings, dry_run=args.dry_run, force=args.force, verbosity=args.verbosity)
+    if not args.dry_run:
+        write_reports(graph, keys, settings, datasets, verbosity=args.verbosity)
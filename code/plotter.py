@@ -5,18 +5,44 @@ import matplotlib.font_manager
 import os
 import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 import nclasses as pnc 
 
-def plot_sim_with_ci(values, ci, abline, bins=6, show=True, fname='simulation', ftype='pdf', color=False):
+plotdir_default = os.path.expanduser('~/git/smallsublex/plots')
+
+#the lexicons plotted for the paper, by language
+paper_lexicons = {'russian': ['freq_noun_stems',
+                              'freq_adj_stems',
+                              'astyj_stems_aranea',
+                              'ost_stems_aranea',
+                              'freq_astyj',
+                              'freq_ist',
+                              'freq_izm',
+                              'freq_ost',
+                              'freq_onok',
+                              'onok_stems_aranea'],
+                  'english': ['freq_all_adj',
+                              'freq_en',
+                              'freq_ify',
+                              'freq_ize',
+                              'freq_nouns']}
+
+def plot_sim_with_ci(values, ci, abline, bins=6, show=True, fname='simulation', ftype='pdf', color=False, outdir=plotdir_default):
     '''
     plot the maximum size cap in syllables for each simulation
     get confidence intervals for each simulation
     point to where the sublexicon sits within that span
+    values can be the list of per-sample values, or (better for big simulations) a histogram {value: number of samples}, which is plotted as weighted bars without re-expanding it
     '''
     libfont = {'fontname':'Linux Libertine O', 'size': 'x-large'}
     sns.set_theme(style='whitegrid')
     h_color='gray'
-    fig = sns.histplot(values, discrete=True, color=h_color).set_title("Monte Carlo max size: "+" ".join(fname.split("_")), **libfont)
+    if isinstance(values, dict):
+        xvals = sorted(values)
+        fig = sns.histplot(x=xvals, weights=[values[x] for x in xvals], discrete=True, color=h_color)
+    else:
+        fig = sns.histplot(values, discrete=True, color=h_color)
+    fig.set_title("Monte Carlo max size: "+" ".join(fname.split("_")), **libfont)
     if color:
         ci_color='r'
         abline_color='green'
@@ -28,13 +54,38 @@ def plot_sim_with_ci(values, ci, abline, bins=6, show=True, fname='simulation',
     plt.axvline(abline, linestyle="--", color=abline_color)
     if show:
         plt.show()
-    fig.figure.savefig(os.path.join(os.path.expanduser('~/git/smallsublex/plots'), '.'.join([fname, ftype])))
+    fig.figure.savefig(os.path.join(outdir, '.'.join([fname, ftype])))
     plt.clf()
     plt.close()
 
-def plot_syllcounts(fpath, show=True, ftype="pdf", color=True, featpath=""):
+def plot_sweep(sweep, show=True, fname='size_sweep', ftype='pdf', outdir=plotdir_default):
+    '''
+    plots lex_comparison.finc_sweep curves: the probability of the syllable cap, the final class, both, and the absence of each missing class, against sample size (log scale), with the sublexicon's own size marked
+    '''
+    libfont = {'fontname':'Linux Libertine O', 'size': 'x-large'}
+    sns.set_theme(style='whitegrid')
+    fig, ax = plt.subplots()
+    for name, style in (('syll', ':'), ('class', '--'), ('joint', '-')):
+        ax.plot(sweep['sizes'], sweep[name], linestyle=style, color='black', label=name)
+    #one legend entry for all the absent classes, which can be many
+    for i, cl in enumerate(sweep['absent']):
+        ax.plot(sweep['sizes'], sweep['absent'][cl], color='gray', linewidth=0.8, label='classes missing from the sublexicon' if i==0 else None)
+    ax.axvline(sweep['samsize'], linestyle='--', color='gray')
+    ax.set_yscale('log')
+    ax.set_xlabel('Sample size', **libfont)
+    ax.set_ylabel('Probability', **libfont)
+    ax.set_title(" ".join(fname.split("_")), **libfont)
+    ax.legend(fontsize='small')
+    fig.tight_layout()
+    if show:
+        plt.show()
+    fig.savefig(os.path.join(outdir, '.'.join([fname, ftype])))
+    plt.close()
+
+def plot_syllcounts(fpath, show=True, ftype="pdf", color=True, featpath="", vowels=None, outdir=plotdir_default):
     '''
     quick-and-dirty
+    pass in vowels (a set of +syllabic segs) to skip parsing the feature file again for every lexicon
     '''
     libfont = {'fontname':'Linux Libertine O', 'size': 'x-large'}
     plotdir = os.path.basename(os.path.split(fpath)[0])
@@ -42,7 +93,8 @@ def plot_syllcounts(fpath, show=True, ftype="pdf", color=True, featpath=""):
     values = {}
     sns.set_theme(style='whitegrid')
     sns.set_style("ticks")
-    vowels = pnc.get_vowels(**{'featpath':featpath})
+    if vowels is None:
+        vowels = pnc.get_vowels(**{'featpath':featpath})
     wlenths = []
     colors: {}
     with open(fpath, 'r') as f:
@@ -78,10 +130,10 @@ def plot_syllcounts(fpath, show=True, ftype="pdf", color=True, featpath=""):
             fig.ax.bar_label(c, label_type="edge")
     if show:
         plt.show()
-    fig.savefig(os.path.join(os.path.expanduser('~/git/smallsublex/plots'), '.'.join([plotdir, ftype])))
+    fig.savefig(os.path.join(outdir, '.'.join([plotdir, ftype])))
     plt.close()
 
-def plot_syllcount_by_freq(fpath, show=True, ftype="pdf"):
+def plot_syllcount_by_freq(fpath, show=True, ftype="pdf", outdir=plotdir_default):
     '''
     input is a tab-separated file, in IPA, with transcriptions space-separated.
     '''
@@ -97,34 +149,66 @@ def plot_syllcount_by_freq(fpath, show=True, ftype="pdf"):
     fig = sns.relplot(y="syllables", x="rank", data=df)
     if show:
         plt.show()
-    fig.figure.savefig(os.path.join(os.path.expanduser('~/git/smallsublex/plots'),"length_by_freq.pdf"))
+    fig.figure.savefig(os.path.join(outdir, '.'.join(["length_by_freq", ftype])))
     plt.close()
 
 
 
 
-if __name__=='__main__':
-    #plot_syllcount_by_freq('~/Desktop/nunya_bidnis/LearningData.txt')
-    fpath = os.path.expanduser('~/git/smallsublex/data/russian/Features.txt')
-    for i in ['freq_noun_stems',
-            'freq_adj_stems',
-            'astyj_stems_aranea',
-            'ost_stems_aranea',
-            'freq_astyj',
-            'freq_ist',
-            'freq_izm',
-            'freq_ost',
-            'freq_onok',
-            'onok_stems_aranea']:
-        plot_syllcounts(os.path.join(os.path.expanduser("~/git/smallsublex/data/russian"), i, "LearningData.txt"), color=False, featpath=fpath)
-        pass
+def _headless():
+    '''
+    runs in each worker process: switch to a non-interactive backend so nothing ever opens a window
+    '''
+    plt.switch_backend('Agg')
+
+def batch_plot_syllcounts(datadir, outdir, lexicons=paper_lexicons, jobs=None, ftype='pdf', color=False):
+    '''
+    renders the syllable count plots for every lexicon in {language: [lexicon dirs]} without showing them, in a pool of worker processes.
+    each language's Features.txt is parsed once, and the vowels are handed to the workers.
+    returns a list of the files written.
+    '''
+    os.environ['MPLBACKEND'] = 'Agg'
+    _headless()
+    os.makedirs(outdir, exist_ok=True)
+    tasks = []
+    for lang in lexicons:
+        featpath = os.path.join(datadir, lang, 'Features.txt')
+        if not os.path.exists(featpath):
+            print(f"no feature file for {lang} in {datadir}, skipping {len(lexicons[lang])} plots")
+            continue
+        vowels = pnc.get_vowels(**{'featpath':featpath})
+        for lex in lexicons[lang]:
+            fpath = os.path.join(datadir, lang, lex, 'LearningData.txt')
+            if os.path.exists(fpath):
+                tasks.append((fpath, {'show':False, 'ftype':ftype, 'color':color, 'vowels':vowels, 'outdir':outdir}))
+            else:
+                print(f"{fpath} does not exist, skipping")
+    written = []
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_headless) as pool:
+        futures = [pool.submit(plot_syllcounts, fpath, **kw) for fpath, kw in tasks]
+        for (fpath, kw), fut in zip(tasks, futures):
+            fut.result()
+            written.append(os.path.join(outdir, '.'.join([os.path.basename(os.path.dirname(fpath)), ftype])))
+    print(f"{len(written)} plots written to {outdir}")
+    return written
+
 
-    fpath = os.path.expanduser('~/git/smallsublex/data/english/Features.txt')
-    for i in ['freq_all_adj',
-              'freq_en',
-              'freq_ify',
-              'freq_ize',
-              'freq_nouns',
-              ]:
-        plot_syllcounts(os.path.join(os.path.expanduser("~/git/smallsublex/data/english"), i, "LearningData.txt"),
-                        color=False, featpath=fpath)
+if __name__=='__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="plots syllable counts for the lexicons in the paper")
+    parser.add_argument('--datadir', help="the 'data' directory, with a folder for each language (default: ../data)", default=os.path.join(os.path.dirname(os.getcwd()), 'data'))
+    parser.add_argument('--outdir', help="where to write the plots (default: ../plots)", default=os.path.join(os.path.dirname(os.getcwd()), 'plots'))
+    parser.add_argument('--language', help="plot only this language (default: all of them)", default=None)
+    parser.add_argument('--jobs', help="number of worker processes (default: one per cpu)", type=int, default=None)
+    parser.add_argument('--ftype', help="file type for the plots (default pdf)", default='pdf')
+    parser.add_argument('--show', help="plot one at a time in interactive windows instead of the headless batch", type=bool, default=False)
+    args = parser.parse_args()
+    lexicons = paper_lexicons if args.language is None else {args.language: paper_lexicons[args.language]}
+    if args.show:
+        for lang in lexicons:
+            fpath = os.path.join(args.datadir, lang, 'Features.txt')
+            vowels = pnc.get_vowels(**{'featpath':fpath})
+            for i in lexicons[lang]:
+                plot_syllcounts(os.path.join(args.datadir, lang, i, "LearningData.txt"), color=False, vowels=vowels, outdir=args.outdir, ftype=args.ftype)
+    else:
+        batch_plot_syllcounts(args.datadir, args.outdir, lexicons=lexicons, jobs=args.jobs, ftype=args.ftype)
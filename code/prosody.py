@@ -4,10 +4,15 @@
 
 import os, sys
 import re
-from nltk import ngrams
+import numpy
 
 # should be in the same code directory
 import nclasses as pnc
+import learningdata as ldr
+from lazyimport import lazy_module
+
+nltk = lazy_module('nltk')
+sparse = lazy_module('scipy.sparse')
 
 '''
 
@@ -63,6 +68,33 @@ def make_syllcount_dic(**kwargs):
         outdic[' '.join(word)] = sylls
     return outdic
 
+def cv_skeleton(word, consonants, vowels):
+    '''
+    rewrites one space-separated word as a CV skeleton. consonants should be sorted in reverse so that palatalized segs get replaced before their plain counterparts
+    '''
+    for cons in consonants:
+        word = word.replace(cons, "C")
+    for vow in vowels:
+        if len(vow)>1:
+            word = word.replace(vow, "VV")
+        else:
+            word = word.replace(vow, "V")
+    return word
+
+def x_grid(word, vowels, stress, lower=False):
+    '''
+    rewrites one space-separated word as an x grid: "# x X #" for a disyllable with final stress
+    '''
+    word_vowels = [x for x in word.split(" ") if x in vowels]
+    xgrid = "# "+" ".join(word_vowels)+ " #"
+    for v in stress:
+        xgrid = xgrid.replace(v, 'X')
+    for v in vowels:
+        xgrid = xgrid.replace(v, 'x')
+    if lower==True:
+        xgrid = xgrid.lower()
+    return xgrid
+
 def count_cv_skeleta(**kwargs):
     '''
     returns a dictionary with CV skeleta. needs a [syllabic] feature; if there is a morpheme boundary in the feature file, it must be named 'mb'.
@@ -77,13 +109,7 @@ def count_cv_skeleta(**kwargs):
     #to handle palatalization correctly (sorting in reverse ensures palatalized segs get replaced first):
     cvdic = {}
     for word in sorted(ld, reverse=True):
-        for cons in consonants:
-            word = word.replace(cons, "C")
-        for vow in vowels:
-            if len(vow)>1:
-                word = word.replace(vow, "VV")
-            else:
-                word = word.replace(vow, "V")
+        word = cv_skeleton(word, consonants, vowels)
         if word in cvdic:
             cvdic[word]+=1
         else:
@@ -107,15 +133,7 @@ def count_x_grids(**kwargs):
     stress = feats['+stress']
     xgriddic = {}
     for word in ld:
-        word = word.split(" ")
-        word_vowels = [x for x in word if x in vowels]
-        xgrid = "# "+" ".join(word_vowels)+ " #"
-        for v in stress:
-            xgrid = xgrid.replace(v, 'X')
-        for v in vowels:
-            xgrid = xgrid.replace(v, 'x')
-        if lower==True:
-            xgrid = xgrid.lower()
+        xgrid = x_grid(word, vowels, stress, lower)
         if xgrid in xgriddic:
             xgriddic[xgrid]+=1
         else:
@@ -141,7 +159,7 @@ def count_cv_grid_ngrams(**kwargs):
     outdic = dict()
     for strw in inddic:
         for i in range(1,5): 
-            for x in ngrams(strw.split(" "), i):
+            for x in nltk.ngrams(strw.split(" "), i):
                 strx = " ".join(x)
                 if strx in outdic:
                     outdic[strx]+=inddic[strw]
@@ -164,6 +182,44 @@ def count_cv_grid_ngrams(**kwargs):
     return kwargs
 
 
+def pros_ngram_incidence(**kwargs):
+    '''
+    the prosodic counterpart of segments.seg_ngram_incidence: turns each word into a CV skeleton (kwargs['CV']) or an x grid (kwargs['xgrids']), integer-encodes its ngrams (same range as count_cv_grid_ngrams), and returns a sparse word-by-ngram count matrix in kwargs['incidence'].
+    pass an existing kwargs['ngram_index'] to encode a sublexicon against the lexicon's ngrams.
+    '''
+    if 'words' in kwargs:
+        words = kwargs['words']
+    else:
+        words = list(kwargs.get('ld'))
+    feats = pnc.make_feat_vectors(**kwargs)['featdic']
+    vowels = feats['+syllabic']
+    if kwargs.get('CV'):
+        consonants = sorted(feats['-syllabic'], reverse=True)
+        shapes = [cv_skeleton(wd, consonants, vowels) for wd in words]
+    else:
+        shapes = [x_grid(wd, vowels, feats['+stress'], kwargs.get('ignore_stress')) for wd in words]
+    index = kwargs.get('ngram_index')
+    grow = index is None
+    if grow:
+        index = {}
+    rows, cols = [], []
+    for r, shape in enumerate(shapes):
+        for i in range(1,5):
+            for x in nltk.ngrams(shape.split(" "), i):
+                strx = " ".join(x)
+                if strx not in index:
+                    if not grow:
+                        continue
+                    index[strx] = len(index)
+                rows.append(r)
+                cols.append(index[strx])
+    data = numpy.ones(len(rows), dtype=numpy.int32)
+    kwargs['incidence'] = sparse.coo_matrix((data, (rows, cols)), shape=(len(words), len(index))).tocsr()
+    kwargs['ngram_index'] = index
+    kwargs['words'] = words
+    return kwargs
+
+
 def ngram_diff(**kwargs):
     '''
     gets two lexicons to compare, returns xgrid ngrams found in the lexicon but not in the sublexicon (assuming there is a subset relationship). if there isn't a subset relationship, it will print the differences.
@@ -172,13 +228,13 @@ def ngram_diff(**kwargs):
         fnc = count_cv_skeleta
     elif kwargs['xgrids']==True:
         fnc = count_x_grids
-    dummy = kwargs
+    dummy = dict(kwargs)
     dummy['ld']=dummy['lex']
     dummy['lexics']=True
-    lex_ngrams = count_cv_grid_ngrams(**fnc(**dummy))['ngramdic']
+    lex_ngrams = count_cv_grid_ngrams(**dict(dummy, inddic=fnc(**dummy)))['ngramdic']
     dummy['ld']=dummy['sublex']
     dummy['lexics']=False
-    sublex_ngrams = count_cv_grid_ngrams(**fnc(**dummy))['ngramdic']
+    sublex_ngrams = count_cv_grid_ngrams(**dict(dummy, inddic=fnc(**dummy)))['ngramdic']
     ngramdiff = {}.fromkeys(lex_ngrams)
     for k in sublex_ngrams:
         if k in lex_ngrams:
@@ -199,13 +255,13 @@ def lexsublex_pros_ngrams(**kwargs):
         fnc = count_cv_skeleta
     elif kwargs['xgrids']==True:
         fnc = count_x_grids
-    dummy = kwargs
+    dummy = dict(kwargs) #a copy, so the caller's 'ld' isn't overwritten
     dummy['ld']=dummy['lex']
     dummy['lexics']=True
-    lex_ngrams=count_cv_grid_ngrams(**fnc(**dummy))['ngramdic']
+    lex_ngrams=count_cv_grid_ngrams(**dict(dummy, inddic=fnc(**dummy)))['ngramdic']
     dummy['ld']=dummy['sublex']
     dummy['lexics']=False
-    sublex_ngrams=count_cv_grid_ngrams(**fnc(**dummy))['ngramdic']
+    sublex_ngrams=count_cv_grid_ngrams(**dict(dummy, inddic=fnc(**dummy)))['ngramdic']
     outdic = {}
     for k in lex_ngrams:
         outdic[k]={'sublex':0, "lex":lex_ngrams[k]}
@@ -234,20 +290,14 @@ if __name__=='__main__':
         parser.add_argument("--slice", help="prints to screen only a subset of dictionary whose syllable count is equal or greater than slice", type=int, default=False)
         parser.add_argument("--lex", help="partial path to the reference lexicon (inside 'data' directory)", default=None)
         parser.add_argument("--sublex", help="partial path to the reference sublexicon", default=None)
+        parser.add_argument("--keep_mb", help="keep morpheme boundaries (|) as segments (default: kept with --language, dropped with --lex and --sublex)", type=bool, default=None)
         parser.add_argument("--ignore_stress", help="ignore stress when counting x-grids (basically becomes syllable count", default=False)
         args=parser.parse_args()
         kwargs = vars(args)
         if args.language!=None:
             lgpath = os.path.join(os.path.dirname(os.getcwd()), 'data', args.language)
             ld = os.path.join(lgpath, 'LearningData.txt')
-            kwargs['ld']=set()
-            with open(ld, 'r', encoding='utf-8') as f:
-                for line in f:
-                    word = line.strip().split('\t')[0]
-                    if not word in kwargs['ld']:
-                        kwargs['ld'].add("# " + word+ " #")
-                    else:
-                        print(f"your word list has doublets! {word} appears at least twice")
+            kwargs['ld']=ldr.read_ld(ld=ld, keep_mb=args.keep_mb!=False, dedupe=True)
             kwargs['featpath'] = os.path.join(lgpath, 'Features.txt')
             try:
                 kwargs['featdic']=pnc.make_feat_vectors(**kwargs)
@@ -272,14 +322,7 @@ if __name__=='__main__':
             kwargs['featpath']=os.path.join(os.path.dirname(lexpath), "Features.txt")
             temp = {'lex':lexpath, "sublex":sublexpath}
             for s in temp:
-                kwargs[s]=set()
-                with open(temp[s], 'r', encoding='utf-8') as f:
-                    for line in f:
-                        word = line.strip().split('\t')[0].replace(" | ", " ")
-                        if not word in kwargs[s]:
-                            kwargs[s].add("# "+word + " #")
-                        else:
-                            print(f"Your word list has doublets! {word} appears at least twice")
+                kwargs[s]=ldr.read_ld(ld=temp[s], keep_mb=bool(args.keep_mb), dedupe=True)
             #ngram_diff(**kwargs)
             kwargs['CV'] = True
             out = lexsublex_pros_ngrams(**kwargs)['lsub_cv_ngrams']
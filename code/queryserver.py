@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os, sys, json, threading, hashlib
+import urllib.request, urllib.error
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+'''
+a long-lived local server that keeps feature systems and lexicons loaded, so that small queries don't each pay for python startup, numpy/scipy imports, compactdic (about a second on the Russian feature file) and indexing the lexicon.
+
+start it once:
+
+    $ python queryserver.py --serve --preload russian/freq_noun_stems
+
+and ask it things, from the thin client in this same file (which imports nothing heavy):
+
+    $ python queryserver.py --op tightest --language russian/freq_noun_stems --segs s,z,ʂ
+    $ python queryserver.py --op extension --language russian/freq_noun_stems --features +cor,+strid
+    $ python queryserver.py --op ngrams --language russian/freq_noun_stems --ngrams "a s t" "# v"
+    $ python queryserver.py --op query --language russian/freq_noun_stems --query final:+cor,+strid "ngram:a s t"
+    $ python queryserver.py --op sylls --language russian/freq_ost
+    $ python queryserver.py --op simulate --language russian/freq_noun_stems --sublanguage russian/freq_astyj --stats final=-son "syll<=2"
+    $ python queryserver.py --op classdiff --language russian/freq_noun_stems
+
+or from any other program, by POSTing a JSON object to http://127.0.0.1:8765/<op>. every answer is a JSON object; errors come back as {"error": message}, with status 400 for a bad request and 500 for anything that went wrong while answering it.
+
+languages are paths to directories in data/ (with LearningData.txt and Features.txt), as in the other scripts. a feature system is loaded once per Features.txt and shared by every lexicon that uses it. if a Features.txt is edited while the server runs, its classes are recomputed incrementally from the old ones on the next query (nclasses.update_classes), and --op classdiff says what changed.
+'''
+
+datapath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+host_default = '127.0.0.1'
+port_default = 8765
+
+
+def langdir(language):
+    return language if os.path.isabs(language) else os.path.join(datapath, language)
+
+
+class Holder:
+    '''
+    the loaded feature systems and lexicons, each built the first time it is asked for.
+    self.lock only guards the dictionaries; the loading itself holds a lock of its own per feature file or lexicon, so that queries about what is already loaded don't wait for something else to load
+    '''
+    def __init__(self, verbosity=1):
+        self.features = {}
+        self.edited = {}
+        self.lexicons = {}
+        self.loading = {}
+        self.lock = threading.Lock()
+        self.verbosity = verbosity
+
+    def load_lock(self, key):
+        with self.lock:
+            return self.loading.setdefault(key, threading.Lock())
+
+    def feature_system(self, featpath):
+        import nclasses as pnc
+        #keyed by content, since every lexicon directory has its own copy of the same Features.txt
+        with open(featpath, 'rb') as f:
+            fkey = hashlib.sha256(f.read()).hexdigest()
+        with self.load_lock(('features', fkey)):
+            with self.lock:
+                fsys = self.features.get(fkey)
+                prev = self.features.get(self.edited.get(featpath))
+            if fsys is None:
+                #an edited Features.txt is recomputed incrementally from the version loaded before
+                if prev is not None:
+                    state = pnc.update_classes(prev['state'], featpath=featpath, verbosity=self.verbosity)
+                else:
+                    if self.verbosity > 0:
+                        print(f"loading features from {featpath}")
+                    state = pnc.class_state(featpath=featpath, verbosity=0)
+                nclassdic = {'nclassdic':state['nclassdic']}
+                fclassdic = pnc.featclassdic(nclassdic=nclassdic['nclassdic'])['featclassdic']
+                fsys = {'featpath':featpath, 'featdic':state['featdic'], 'segdic':state['segdic'],
+                        'nclassdic':nclassdic, 'fclassdic':fclassdic, 'lattice':pnc.class_lattice(fclassdic),
+                        'state':{k:state[k] for k in ('segdic', 'featdic', 'verbosedic', 'nclassdic')},
+                        'classdiff':state.get('classdiff')}
+            with self.lock:
+                self.features[fkey] = fsys
+                self.edited[featpath] = fkey
+            return fsys
+
+    def lexicon(self, language):
+        import learningdata as ldr
+        import lexindex as lxi
+        import segments as sgs
+        import nclasses as pnc
+        path = langdir(language)
+        featpath = os.path.join(path, 'Features.txt')
+        fsys = self.feature_system(featpath)
+        with self.load_lock(('lexicon', path)):
+            with self.lock:
+                lex = self.lexicons.get(path)
+            #a lexicon whose feature file was edited is indexed again
+            if lex is None or lex['fsys'] is not fsys:
+                if self.verbosity > 0:
+                    print(f"loading lexicon {language}")
+                words = ldr.read_ld(ld=os.path.join(path, 'LearningData.txt'), verbosity=0)
+                vowels = pnc.get_vowels(featdic=fsys['featdic'])
+                sylls = {}
+                for wd in words:
+                    n = len([x for x in wd.split(' ') if x in vowels])
+                    sylls[n] = sylls.get(n, 0) + 1
+                lex = {'words':words, 'sylls':sylls, 'featpath':featpath, 'fsys':fsys,
+                       'ngrams':sgs.count_seg_ngrams(ld=words)['seg_ngrams'],
+                       'index':lxi.build_index(words=words, featpath=featpath, nclassdic=fsys['nclassdic'])}
+                with self.lock:
+                    self.lexicons[path] = lex
+            return lex
+
+
+def split_list(val):
+    return val if isinstance(val, list) else [x.strip() for x in str(val).split(',') if x.strip()]
+
+
+def int_param(req, key, default, least=1):
+    '''
+    req[key] as an int, checking that it is at least least
+    '''
+    try:
+        val = int(req.get(key, default))
+    except (TypeError, ValueError):
+        raise ValueError(f"{key} should be an integer, not {req[key]!r}")
+    if val < least:
+        raise ValueError(f"{key} should be at least {least}, not {val}")
+    return val
+
+
+def op_ping(holder, req):
+    return {'features':sorted(f['featpath'] for f in holder.features.values()), 'lexicons':sorted(holder.lexicons)}
+
+
+def op_classdiff(holder, req):
+    '''
+    how the natural classes changed when req['language']'s Features.txt was last edited while the server was running (see nclasses.update_classes)
+    '''
+    diff = holder.feature_system(os.path.join(langdir(req['language']), 'Features.txt'))['classdiff']
+    if diff is None:
+        return {'edited':False}
+    return {'edited':True, 'feats':diff['feats'], 'segs':diff['segs'],
+            'appeared':diff['appeared'], 'disappeared':diff['disappeared'], 'redescribed':diff['redescribed']}
+
+
+def op_tightest(holder, req):
+    '''
+    the smallest natural class containing req['segs'] (a list, or a comma-separated string)
+    '''
+    fsys = holder.feature_system(os.path.join(langdir(req['language']), 'Features.txt'))
+    segs = set(split_list(req['segs']))
+    #the tightest class is the smallest one in the lattice that contains all the segs
+    best = None
+    for cl in fsys['lattice']['order']:
+        if segs <= fsys['lattice']['segs'][cl]:
+            best = cl
+    if best is None:
+        return {'class':None, 'segs':None}
+    return {'class':best, 'segs':sorted(fsys['lattice']['segs'][best]), 'exact':fsys['lattice']['segs'][best]==segs}
+
+
+def op_extension(holder, req):
+    '''
+    the segments picked out by a feature bundle req['features'], and the class's compact description, if it has one
+    '''
+    import nclasses as pnc
+    fsys = holder.feature_system(os.path.join(langdir(req['language']), 'Features.txt'))
+    feats = split_list(req['features'])
+    unknown = [f for f in feats if f not in fsys['featdic']]
+    if unknown:
+        raise ValueError(f"unknown feature values: {', '.join(unknown)}")
+    segs = set(pnc.feats_to_segs(fsys['featdic'], feats))
+    names = [cl for cl in fsys['fclassdic'] if fsys['fclassdic'][cl]==segs]
+    return {'segs':sorted(segs), 'class':names[0] if names else None}
+
+
+def op_ngrams(holder, req):
+    '''
+    lexicon counts for each ngram in req['ngrams'] (as counted by segments.count_seg_ngrams), or the req['top'] most frequent ones
+    '''
+    lex = holder.lexicon(req['language'])
+    if 'top' in req:
+        top = sorted(lex['ngrams'], key=lex['ngrams'].get, reverse=True)[:int_param(req, 'top', 10)]
+        return {'counts':{g:lex['ngrams'][g] for g in top}}
+    return {'counts':{g:lex['ngrams'].get(' '.join(g.split()), 0) for g in req['ngrams']}}
+
+
+def op_query(holder, req):
+    '''
+    the words that satisfy every condition in req['query'] (one query string or a list of them, see lexindex.parse_key), up to req['limit'] of them
+    '''
+    import lexindex as lxi
+    lex = holder.lexicon(req['language'])
+    ids = lxi.query(lex['index'], [req['query']] if isinstance(req['query'], str) else req['query'])
+    limit = int_param(req, 'limit', 20, least=0)
+    return {'count':len(ids), 'words':[lex['words'][i].strip('# ') for i in (ids if limit==0 else ids[:limit])]}
+
+
+def op_sylls(holder, req):
+    lex = holder.lexicon(req['language'])
+    return {'sylls':{str(k):lex['sylls'][k] for k in sorted(lex['sylls'])}, 'words':len(lex['words'])}
+
+
+def op_simulate(holder, req):
+    '''
+    runs lex_comparison.stat_monte for req['stats'] with req['language'] as the lexicon and req['sublanguage'] as the sublexicon
+    '''
+    import lex_comparison as lc
+    nsamples = int_param(req, 'nsamples', 1000)
+    engine = req.get('engine', 'numpy')
+    if engine not in ('numpy', 'exact'):
+        raise ValueError(f"engine should be numpy or exact, not {engine!r}")
+    lex = holder.lexicon(req['language'])
+    sublex = holder.lexicon(req['sublanguage'])
+    fsys = holder.feature_system(lex['featpath'])
+    res = lc.stat_monte(lex=lex['words'], sublex=sublex['words'], stats=split_list(req['stats']) if isinstance(req['stats'], str) else req['stats'],
+                        featdic=fsys['featdic'], featpath=lex['featpath'], nsamples=nsamples,
+                        engine=engine, without_replacement=bool(req.get('without_replacement')),
+                        seed=req.get('seed'), verbosity=0)['statsims']
+    for spec in res:
+        res[spec]['hist'] = {str(k):v for k, v in sorted(res[spec]['hist'].items())}
+    return {'stats':res}
+
+
+ops = {'ping':op_ping, 'tightest':op_tightest, 'extension':op_extension, 'ngrams':op_ngrams,
+       'query':op_query, 'sylls':op_sylls, 'simulate':op_simulate, 'classdiff':op_classdiff}
+
+
+def to_json(obj):
+    #numpy scalars and sets
+    if hasattr(obj, 'item'):
+        return obj.item()
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    raise TypeError(f"cannot serialize {type(obj)}")
+
+
+def make_handler(holder):
+    class Handler(BaseHTTPRequestHandler):
+        def answer(self, status, obj):
+            body = json.dumps(obj, ensure_ascii=False, default=to_json).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            op = self.path.strip('/')
+            if op not in ops:
+                return self.answer(404, {'error':f"unknown op {op!r}; try one of {', '.join(ops)}"})
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                req = json.loads(self.rfile.read(length).decode('utf-8')) if length else {}
+                self.answer(200, ops[op](holder, req))
+            except (KeyError, ValueError, OSError) as e:
+                self.answer(400, {'error':f"{type(e).__name__}: {e}"})
+            except Exception as e:
+                #anything else is a bug, but the client should still get an answer and the server should keep running
+                if holder.verbosity > 0:
+                    import traceback
+                    traceback.print_exc()
+                self.answer(500, {'error':f"{type(e).__name__}: {e}"})
+
+        def do_GET(self):
+            if self.path.strip('/') in ('', 'ping'):
+                return self.answer(200, op_ping(holder, {}))
+            self.answer(405, {'error':"send queries as POST requests with a JSON body"})
+
+        def log_message(self, format, *args):
+            if holder.verbosity > 1:
+                super().log_message(format, *args)
+    return Handler
+
+
+def serve(host=host_default, port=port_default, preload=(), verbosity=1):
+    '''
+    runs the server until interrupted, after loading the preload languages
+    '''
+    holder = Holder(verbosity)
+    for language in preload:
+        holder.lexicon(language)
+    server = ThreadingHTTPServer((host, port), make_handler(holder))
+    if verbosity > 0:
+        print(f"listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def ask(op, req, host=host_default, port=port_default, timeout=600):
+    '''
+    sends one query to a running server and returns the decoded answer
+    '''
+    data = json.dumps(req).encode('utf-8')
+    r = urllib.request.Request(f"http://{host}:{port}/{op}", data=data, headers={'Content-Type':'application/json'})
+    try:
+        with urllib.request.urlopen(r, timeout=timeout) as f:
+            return json.loads(f.read().decode('utf-8'))
+    except urllib.error.HTTPError as e:
+        return json.loads(e.read().decode('utf-8'))
+
+
+if __name__=="__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="a local query server for natural classes, ngram counts, syllable counts and simulations, and a client for it")
+    parser.add_argument("--serve", help="start the server", type=bool, default=False)
+    parser.add_argument("--host", help=f"the address to listen on or connect to (default {host_default})", default=host_default)
+    parser.add_argument("--port", help=f"the port (default {port_default})", type=int, default=port_default)
+    parser.add_argument("--preload", help="languages to load when the server starts, e.g. russian/freq_noun_stems", nargs='+', default=[])
+    parser.add_argument("--verbosity", help="0 for a quiet server, 2 to log every request", type=int, default=1)
+    parser.add_argument("--op", help="the query to send to a running server", choices=sorted(ops), default=None)
+    parser.add_argument("--language", help="the lexicon (a directory in data/) to ask about")
+    parser.add_argument("--sublanguage", help="the sublexicon, for --op simulate")
+    parser.add_argument("--segs", help="comma-separated segments, for --op tightest")
+    parser.add_argument("--features", help="comma-separated feature values, for --op extension")
+    parser.add_argument("--ngrams", help="ngrams to count, for --op ngrams", nargs='+')
+    parser.add_argument("--top", help="with --op ngrams, the most frequent ngrams instead", type=int)
+    parser.add_argument("--query", help="conditions for --op query, e.g. final:+cor,+strid 'ngram:a s t'", nargs='+')
+    parser.add_argument("--limit", help="how many words --op query returns (default 20; 0 for all)", type=int, default=20)
+    parser.add_argument("--stats", help="word predicates for --op simulate, e.g. final=-son 'syll<=2'", nargs='+')
+    parser.add_argument("--nsamples", help="number of simulations for --op simulate (default 1,000)", type=int, default=1000)
+    parser.add_argument("--engine", help="numpy or exact, for --op simulate", default='numpy', choices=['numpy', 'exact'])
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.host, args.port, args.preload, args.verbosity)
+    elif args.op:
+        req = {k:v for k, v in vars(args).items() if v is not None and k in ('language', 'sublanguage', 'segs', 'features', 'ngrams', 'top', 'query', 'limit', 'stats', 'nsamples', 'engine')}
+        try:
+            print(json.dumps(ask(args.op, req, args.host, args.port), ensure_ascii=False, indent=1))
+        except urllib.error.URLError as e:
+            sys.exit(f"no server at {args.host}:{args.port} ({e.reason}); start one with --serve True")
+    else:
+        parser.print_help()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os, math, random, heapq
+import numpy
+
+import learningdata as ldr
+import translit as tr
+
+'''
+sampling helpers for the Monte Carlo simulations in lex_comparison.py.
+
+by default, the simulations draw uniformly over word types. this module adds token-frequency weighting: the ipm frequencies from the Sharoff list are joined to the words of a lexicon, and draws are made with Walker's alias method, which costs O(1) per draw after an O(n) setup (random.choices with weights does a binary search over cumulative weights for every draw).
+'''
+
+freqpath_default = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'raw_searches', 'sharoff_freq.txt')
+
+
+def alias_table(weights):
+    '''
+    builds Walker's alias table (Vose's version) for a list of non-negative weights.
+    returns {'prob': [...], 'alias': [...]}: to draw, pick a column i uniformly, then keep i with probability prob[i], else take alias[i]
+    '''
+    n = len(weights)
+    total = float(sum(weights))
+    if n == 0 or total <= 0:
+        raise ValueError("cannot sample from weights that are all zero")
+    scaled = [w*n/total for w in weights]
+    prob = [0.0]*n
+    alias = list(range(n))
+    small = [i for i, p in enumerate(scaled) if p < 1]
+    large = [i for i, p in enumerate(scaled) if p >= 1]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        prob[s] = scaled[s]
+        alias[s] = l
+        scaled[l] = scaled[l] - (1 - scaled[s])
+        if scaled[l] < 1:
+            small.append(l)
+        else:
+            large.append(l)
+    #whatever is left over is 1 up to rounding error
+    for i in small + large:
+        prob[i] = 1.0
+    return {'prob': prob, 'alias': alias}
+
+
+def alias_draw(table, k):
+    '''
+    k indices drawn (with replacement) from an alias table, using the random module, so that random.seed() and simstore checkpoints cover it
+    '''
+    prob, alias = table['prob'], table['alias']
+    n = len(prob)
+    out = []
+    for _ in range(k):
+        i = int(random.random()*n)
+        out.append(i if random.random() < prob[i] else alias[i])
+    return out
+
+
+def alias_draw_batch(table, shape, rng):
+    '''
+    the same with numpy: an array of indices of the given shape, drawn with a numpy Generator
+    '''
+    if 'nprob' not in table:
+        table['nprob'] = numpy.asarray(table['prob'])
+        table['nalias'] = numpy.asarray(table['alias'])
+    i = rng.integers(0, len(table['nprob']), size=shape)
+    return numpy.where(rng.random(shape) < table['nprob'][i], i, table['nalias'][i])
+
+
+def make_drawer(items, weights=None, replace=True):
+    '''
+    returns a function draw(k) giving k items drawn with replacement: uniformly (random.choices, as before) or, given weights, from an alias table.
+    with replace=False, draws are without replacement: random.sample, or successive weighted sampling via Efraimidis-Spirakis keys (the k largest u^(1/w))
+    '''
+    if not replace:
+        if weights is None:
+            return lambda k: random.sample(items, k)
+        return lambda k: [items[i] for i in heapq.nlargest(k, range(len(items)), key=lambda i: random.random()**(1/weights[i]))]
+    if weights is None:
+        return lambda k: random.choices(items, k=k)
+    table = alias_table(weights)
+    return lambda k: [items[i] for i in alias_draw(table, k)]
+
+
+def read_freqs(freqpath=freqpath_default, cat=None):
+    '''
+    reads the Sharoff frequency list (rank, ipm, lemma, part of speech) into {lemma: ipm}, optionally only for one part of speech. homographs get their frequencies added up
+    '''
+    freqs = {}
+    with open(freqpath, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip().split('\t')
+            if len(line) < 4 or (cat is not None and line[3] != cat):
+                continue
+            freqs[line[2]] = freqs.get(line[2], 0) + float(line[1])
+    return freqs
+
+
+def ld_lemmas(**kwargs):
+    '''
+    pairs every line of a LearningData file (kwargs['ld']) with an orthographic lemma, returning a list of (word, lemma) with words normalised as in learningdata.stream_ld.
+    the lemma is taken from the second tab-separated column if the file has one. otherwise, the lines are matched up with the alphabetically sorted Sharoff lemmas of kwargs['freqcat'] (this is how the freq_* lexicons were exported, e.g. freq_adj_stems is the Sharoff adjectives in order), if the counts agree; if they don't, the lemmas are transcribed and matched to the words (see translit.join_lemmas), and unmatched words get None.
+    returns None if none of this works.
+    '''
+    rows = []
+    with ldr.open_ld(kwargs['ld']) as f:
+        for line in f:
+            word = ldr.normalise(line, keep_mb=kwargs.get('keep_mb', True), pad=kwargs.get('pad', True))
+            if word is None:
+                continue
+            cols = line.rstrip('\r\n').split('\t')
+            rows.append((word, cols[1].strip() if len(cols) > 1 and cols[1].strip() else None))
+    if rows and all(lemma is not None for word, lemma in rows):
+        return rows
+    cat = kwargs.get('freqcat')
+    if cat is None:
+        return None
+    freqs = read_freqs(kwargs.get('freqpath', freqpath_default), cat)
+    lemmas = sorted(freqs)
+    if len(lemmas) == len(rows):
+        return [(word, lemma) for (word, x), lemma in zip(rows, lemmas)]
+    #the counts disagree (e.g. freq_noun_stems dropped some nouns): match the words to transcribed lemmas instead, most frequent lemma first for homophones
+    if kwargs.get('verbosity', 1) > 0:
+        print(f"{kwargs['ld']} has {len(rows)} words and no lemma column, and the frequency list has {len(lemmas)} {cat} lemmas, so they are matched up by transcription")
+    pairs = tr.join_lemmas([word for word, x in rows], sorted(lemmas, key=freqs.get, reverse=True), verbosity=kwargs.get('verbosity', 1))
+    if not any(lemma for word, lemma in pairs):
+        return None
+    return pairs
+
+
+def freq_weights(**kwargs):
+    '''
+    returns [(word, sampling weight)], one pair per line of kwargs['ld'], joined to the Sharoff frequencies (see ld_lemmas).
+    kwargs['weighting'] is 'freq' (ipm) or 'logfreq' (log(1+ipm)). words whose lemma is missing from the frequency list get the lowest frequency in the list.
+    returns None if the frequencies could not be joined.
+    '''
+    pairs = ld_lemmas(**kwargs)
+    if pairs is None:
+        return None
+    freqs = read_freqs(kwargs.get('freqpath', freqpath_default))
+    floor = min(freqs.values())
+    missing = sum(1 for word, lemma in pairs if lemma not in freqs)
+    if missing and kwargs.get('verbosity', 1) > 0:
+        print(f"{missing} words in {kwargs['ld']} have no frequency; they get the list's minimum, {floor} ipm")
+    if kwargs.get('weighting') == 'logfreq':
+        return [(word, math.log1p(freqs.get(lemma, floor))) for word, lemma in pairs]
+    return [(word, freqs.get(lemma, floor)) for word, lemma in pairs]
@@ -4,10 +4,17 @@
 
 import os 
 from itertools import product
-from nltk import ngrams
+import numpy
 
 # should be in the same code directory
 import nclasses as pnc
+import learningdata as ldr
+import ngramsketch as ngs
+import extcount as exc
+from lazyimport import lazy_module
+
+nltk = lazy_module('nltk')
+sparse = lazy_module('scipy.sparse')
 
 '''
 takes in a learning data file and a feature file and counts up segmental ngrams (up to 3), as well as the natural class sequences they correspond to. Thus, given 
@@ -28,14 +35,17 @@ def count_seg_ngrams(**kwargs):
     '''
     takes as input a dictionary of xgrids and counts from a lexicon
     returns counts of ngrams
+    with kwargs['spill_dir'], the counts are made on disk (see extcount.py), and kwargs['seg_ngrams'] is a read-only mapping over the count file there
     '''
+    if kwargs.get('spill_dir'):
+        return exc.count_ngrams(**dict(kwargs, outdir=kwargs['spill_dir']))
     inddic = kwargs.get('ld')
     outdic = {} 
     rng_bottom = 1
     rng_top = 4 #maximally trigrams
     for strw in inddic:
         for i in range(rng_bottom, rng_top): #can be tweaked later 
-            for x in ngrams(strw.split(" "), i):
+            for x in nltk.ngrams(strw.split(" "), i):
                 strx = " ".join(x)
                 if strx in outdic:
                     outdic[strx]+=1
@@ -49,6 +59,41 @@ def count_seg_ngrams(**kwargs):
     return(kwargs)
 
 
+def seg_ngram_incidence(**kwargs):
+    '''
+    integer-encodes the segmental ngrams (same range as count_seg_ngrams) of each word and returns a sparse word-by-ngram count matrix.
+    rows follow the order of kwargs['words'] (made from kwargs['ld'] if not given), columns follow kwargs['ngram_index'], which maps ngram strings to column numbers.
+    if an ngram_index is passed in, it is reused as is and ngrams outside of it are dropped--this is how a sublexicon gets encoded against the lexicon's ngrams.
+    '''
+    if 'words' in kwargs:
+        words = kwargs['words']
+    else:
+        words = list(kwargs.get('ld'))
+    index = kwargs.get('ngram_index')
+    grow = index is None
+    if grow:
+        index = {}
+    rows, cols = [], []
+    rng_bottom = 1
+    rng_top = 4 #maximally trigrams, as in count_seg_ngrams
+    for r, strw in enumerate(words):
+        for i in range(rng_bottom, rng_top):
+            for x in nltk.ngrams(strw.split(" "), i):
+                strx = " ".join(x)
+                if strx not in index:
+                    if not grow:
+                        continue
+                    index[strx] = len(index)
+                rows.append(r)
+                cols.append(index[strx])
+    data = numpy.ones(len(rows), dtype=numpy.int32)
+    #duplicate (row, col) entries are summed when converting to csr, so repeated ngrams within a word get counted
+    kwargs['incidence'] = sparse.coo_matrix((data, (rows, cols)), shape=(len(words), len(index))).tocsr()
+    kwargs['ngram_index'] = index
+    kwargs['words'] = words
+    return kwargs
+
+
 def make_natclass_ngrams(**kwargs):
     seg_ngrams = kwargs.get('seg_ngrams')
     if 'segclassdic' in kwargs:
@@ -70,15 +115,22 @@ def make_natclass_ngrams(**kwargs):
     return kwargs 
 
 
+def count_role_ngrams(kwargs, role):
+    '''
+    count_seg_ngrams for kwargs[role] ('lex' or 'sublex'), on a copy of kwargs so the caller's 'ld' isn't overwritten. with a spill_dir, each one counts into its own subdirectory of it, so the second count file doesn't overwrite the first
+    '''
+    dummy = dict(kwargs, ld=kwargs[role])
+    if kwargs.get('spill_dir'):
+        dummy['spill_dir'] = os.path.join(kwargs['spill_dir'], role)
+    return count_seg_ngrams(**dummy)['seg_ngrams']
+
+
 def find_seg_diff(**kwargs):
     '''
     gets two lexicons to compare, and returns segmental ngrams found in the lexicon but not in the sublexicon (assuming they're in a subset relationship). if there is no subset relationship, it will tell you.
     '''
-    dummy=kwargs
-    dummy['ld']=dummy['lex']
-    lex_seg_ngrams = count_seg_ngrams(**dummy)['seg_ngrams']
-    dummy['ld']=dummy['sublex']
-    sublex_seg_ngrams = count_seg_ngrams(**dummy)['seg_ngrams']
+    lex_seg_ngrams = count_role_ngrams(kwargs, 'lex')
+    sublex_seg_ngrams = count_role_ngrams(kwargs, 'sublex')
     segdiff = {}.fromkeys(lex_seg_ngrams) #assume a subset relationship by default
     for k in sublex_seg_ngrams:
         if k in lex_seg_ngrams:
@@ -95,11 +147,8 @@ def lexsublex_seg_ngrams(**kwargs):
     '''
     gets two lexicons, and returns a dictionary of segmental ngrams with counts in each lexicon 
     '''
-    dummy=kwargs
-    dummy['ld']=dummy['lex']
-    lex_seg_ngrams = count_seg_ngrams(**dummy)['seg_ngrams']
-    dummy['ld']=dummy['sublex']
-    sublex_seg_ngrams = count_seg_ngrams(**dummy)['seg_ngrams']
+    lex_seg_ngrams = count_role_ngrams(kwargs, 'lex')
+    sublex_seg_ngrams = count_role_ngrams(kwargs, 'sublex')
     outdic = {}
     for k in lex_seg_ngrams:
         outdic[k] = {'sublex':0, "lex":lex_seg_ngrams[k]}
@@ -127,25 +176,26 @@ if __name__=='__main__':
         parser.add_argument("--find_lex_segdiff", help="find differences between segmental ngrams in the lexicon and the sublexicon", type=bool, default=False)
         parser.add_argument("--lex", help="partial path to a reference lexicon", type=str, default=None)
         parser.add_argument("--sublex", help="partial path to the sublexicon", type=str, default=None)
+        parser.add_argument("--keep_mb", help="keep morpheme boundaries (|) as segments (default: kept with --language, dropped with --lex and --sublex)", type=bool, default=None)
         parser.add_argument('--countall', help="get all ngram counts for the lexicon and the sublexicon", type=bool, default=False)
+        parser.add_argument('--sketch_mb', help="count ngrams approximately, in count-min sketches of at most this many MB each (see ngramsketch.py), and write out only the top ngrams", type=float, default=None)
+        parser.add_argument('--spill_dir', help="count segmental ngrams exactly but out of core, spilling sorted runs into this directory (see extcount.py); with --lex and --sublex, into its lex and sublex subdirectories", type=str, default=None)
+        parser.add_argument('--topk', help="with --sketch_mb, how many of the most frequent ngrams to keep and write out", type=int, default=10000)
         args=parser.parse_args()
         kwargs = vars(args)
         if args.language!=None:
             lgpath = os.path.join(os.path.dirname(os.getcwd()), 'data', args.language)
             ld = os.path.join(lgpath, 'LearningData.txt')
-            kwargs['ld']=set()
-            with open(ld, 'r', encoding='utf-8') as f:
-                for line in f:
-                    word = line.strip().split('\t')[0]
-                    if not word in kwargs['ld']:
-                        kwargs['ld'].add("# " + word+ " #")
-                    else:
-                        print(f"your word list has doublets! {word} appears at least twice")
+            #count_seg_ngrams only goes over the words once, so they can be streamed
+            kwargs['ld']=ldr.stream_ld(ld=ld, keep_mb=args.keep_mb!=False, dedupe=True)
             kwargs['featpath'] = os.path.join(lgpath, 'Features.txt')
             if 'do_ngrams' != False:
                 try:
                     print("\ncounting segmental ngrams...")
-                    kwargs = make_natclass_ngrams(**count_seg_ngrams(**kwargs))
+                    if args.sketch_mb:
+                        kwargs = ngs.sketch_ngrams(natclasses=True, max_mb=args.sketch_mb, **kwargs)
+                    else:
+                        kwargs = make_natclass_ngrams(**count_seg_ngrams(**kwargs))
                     ngramdic = kwargs['seg_ngrams']
                     outpath=os.path.join(lgpath, 'segngrams.txt')
                     with open(outpath, 'w', encoding='utf-8') as f:
@@ -164,14 +214,7 @@ if __name__=='__main__':
             kwargs['featpath']=os.path.join(os.path.dirname(os.getcwd()), 'data', args.lex, 'Features.txt')
             temp = {'lex':lexpath, 'sublex':sublexpath}
             for s in temp:
-                kwargs[s] = set()
-                with open(temp[s], 'r', encoding='utf-8') as f:
-                    for line in f:
-                        word = line.strip().split('\t')[0].replace(" |", "")
-                        if not word in kwargs[s]:
-                            kwargs[s].add("# " + word + " #")
-                        else:
-                            print(f"Your word list has doublets! {word} appears at least twice")
+                kwargs[s] = ldr.read_ld(ld=temp[s], keep_mb=bool(args.keep_mb), dedupe=True)
             if kwargs['find_lex_segdiff']==True:
                 find_seg_diff(**kwargs)
             if kwargs['countall']==True:
@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import itertools, re
+import numpy
+
+import sampling as smp
+import prosody as pros
+from lazyimport import lazy_module
+
+special = lazy_module('scipy.special')
+stats = lazy_module('scipy.stats')
+
+'''
+batched Monte Carlo machinery for lex_comparison.py.
+
+the python engine in lex_comparison draws one sample at a time and re-parses every drawn word. here, the lexicon is compiled once into integer arrays (syllable count and final segment of each word, and a class-by-segment membership matrix), a whole batch of samples is drawn as a matrix of word indices, and the statistics for the batch come out of a few array operations.
+
+draws can be made with replacement (as random.choices does) or without (as a real sublexicon is: no stem occurs twice). the exact engine skips sampling altogether and uses the binomial/hypergeometric formulas for the probability that every word in a sample falls into a given subset of the lexicon.
+
+when the probability of a joint event is far below 1/nsamples (a sublexicon of 20 words that all end in one small class), plain draws almost never hit it. importance_prob draws from a lexicon tilted toward the words that satisfy it instead and reweights each hit by its likelihood ratio, which gives an unbiased estimate with a standard error, also for weighted draws without replacement, where there is no formula.
+
+arbitrary sample statistics can be declared as word predicates (see parse_stat), e.g.
+
+    final=-son                  the word ends in a [-son] segment
+    initial=+syllabic           it begins with a vowel
+    penult=t,tʲ                 its second-to-last segment is t or tʲ
+    stress=-1                   it has final stress (stress=1: initial stress, stress=0: no stressed vowel)
+    syll<=3                     it has at most 3 syllables (also syll>=N, syll=N)
+    xgrid=x X                   its x grid is exactly x X
+    cv=CVCVC                    its CV skeleton is exactly CVCVC
+    ngram=s t                   it contains the segment bigram s t ("#" for word edges)
+    syll<=3&final=-son          both
+    !ngram=# v                  it does not begin with v
+
+each predicate is computed once, as a boolean column over the lexicon; a batch of samples then needs a single fancy-indexing of the column matrix, which gives the number of words in each sample that satisfy each predicate.
+'''
+
+
+def word_segs(word):
+    return word.strip('# ').split(' ')
+
+
+def compile_lex(words, vowels, fclassdic):
+    '''
+    compiles a list of words into arrays:
+        syll: syllable count of each word
+        final: index (into segs) of each word's last segment
+        segs, segindex: the segment inventory and its reverse lookup
+        classes: the natural class names (keys of fclassdic, in order), classmat: classes x segs boolean membership matrix, classsize: number of segs per class
+    segments that occur in the words but not in any class (e.g. "|") still get a column, which belongs to no class
+    '''
+    segs = sorted(set().union(*fclassdic.values()))
+    segindex = {s:i for i, s in enumerate(segs)}
+    syll = numpy.zeros(len(words), dtype=numpy.int32)
+    final = numpy.zeros(len(words), dtype=numpy.int32)
+    for i, wd in enumerate(words):
+        wsegs = word_segs(wd)
+        syll[i] = len([x for x in wsegs if x in vowels])
+        if wsegs[-1] not in segindex:
+            segindex[wsegs[-1]] = len(segs)
+            segs.append(wsegs[-1])
+        final[i] = segindex[wsegs[-1]]
+    classes = list(fclassdic)
+    classmat = numpy.zeros((len(classes), len(segs)), dtype=bool)
+    for c, cl in enumerate(classes):
+        for s in fclassdic[cl]:
+            classmat[c, segindex[s]] = True
+    return {'syll':syll, 'final':final, 'segs':segs, 'segindex':segindex, 'classes':classes, 'classmat':classmat, 'classsize':classmat.sum(axis=1)}
+
+
+def batch_size(n, k, cells=2**22):
+    '''
+    how many samples to draw at once, keeping the index matrices to about cells entries
+    '''
+    return max(1, cells//max(n, k, 1))
+
+
+def draw_indices(n, k, b, rng, replace=True, weights=None, table=None, ordered=False):
+    '''
+    draws b samples of k indices out of range(n), as a b x k array.
+    with replacement: uniform integers, or an alias table (sampling.alias_table) if weights are given.
+    without replacement: a partial Fisher-Yates shuffle run on all b rows at once (min(k, n-k) swaps, each one vectorised over the batch); with weights, successive sampling via Efraimidis-Spirakis keys (the k largest u^(1/w)).
+    with ordered, the columns come out in the order they were drawn, so that the first j columns of each row are themselves a sample of j (k swaps however large k is, and weighted rows sorted by their keys)
+    '''
+    if replace:
+        if table is not None:
+            return smp.alias_draw_batch(table, (b, k), rng)
+        return rng.integers(0, n, size=(b, k))
+    if k > n:
+        raise ValueError(f"cannot draw {k} words without replacement from a lexicon of {n}")
+    if weights is not None:
+        keys = numpy.log(rng.random((b, n)))/numpy.asarray(weights)[None, :]
+        top = numpy.argpartition(-keys, k-1, axis=1)[:, :k]
+        if ordered:
+            top = numpy.take_along_axis(top, numpy.argsort(-numpy.take_along_axis(keys, top, axis=1), axis=1), axis=1)
+        return top
+    #after m swaps, both perm[:, :m] and perm[:, m:] are uniform random subsets, so at most n/2 swaps are ever needed
+    m = k if ordered else min(k, n-k)
+    perm = numpy.tile(numpy.arange(n, dtype=numpy.int32), (b, 1))
+    rows = numpy.arange(b)
+    for j in range(m):
+        r = rng.integers(j, n, size=b)
+        tmp = perm[rows, j].copy()
+        perm[rows, j] = perm[rows, r]
+        perm[rows, r] = tmp
+    return perm[:, :k] if m == k else perm[:, m:]
+
+
+def presence(values, nvals):
+    '''
+    b x nvals boolean matrix: which values occur in each row of a b x k matrix of values
+    '''
+    out = numpy.zeros((values.shape[0], nvals), dtype=bool)
+    out[numpy.arange(values.shape[0])[:, None], values] = True
+    return out
+
+
+def tightest_mask(comp, finals):
+    '''
+    the smallest class that has all of a sublexicon's final segments, as a boolean mask over comp['segs'] (just the finals themselves if no class has them all)
+    '''
+    subfinals = numpy.zeros(len(comp['segs']), dtype=bool)
+    subfinals[[comp['segindex'][x] for x in set(finals) if x in comp['segindex']]] = True
+    containing = ~(subfinals[None, :] & ~comp['classmat']).any(axis=1)
+    if containing.any():
+        return comp['classmat'][numpy.where(containing, comp['classsize'], len(comp['segs'])+1).argmin()]
+    return subfinals
+
+
+def finc_batch(comp, idx, submask, cap):
+    '''
+    the finc_syllcount_monte statistics for a batch of samples (idx: b x k word indices):
+        maxsyll: max syllable count in each sample
+        tightest: index of the smallest class containing all the sample's final segments (first one in class order if tied, -1 if none)
+        absent: for each class, the number of samples with no final segment from it
+        joint: the number of samples with max syllable count <= cap whose final segments all fall into submask (the sublexicon's tightest class), and hit: which ones
+    '''
+    return finc_stats(comp, presence(comp['final'][idx], len(comp['segs'])), comp['syll'][idx].max(axis=1), submask, cap)
+
+
+def finc_stats(comp, P, maxsyll, submask, cap):
+    '''
+    finc_batch, from the samples' final segments as a b x segs presence matrix and their max syllable counts
+    '''
+    Pf = P.astype(numpy.float32)
+    hits = Pf @ comp['classmat'].T.astype(numpy.float32)
+    outside = Pf @ (~comp['classmat']).T.astype(numpy.float32)
+    absent = (hits == 0).sum(axis=0)
+    sizes = numpy.where(outside == 0, comp['classsize'][None, :], numpy.iinfo(numpy.int32).max)
+    tightest = sizes.argmin(axis=1)
+    tightest[sizes.min(axis=1) == numpy.iinfo(numpy.int32).max] = -1
+    hit = (maxsyll <= cap) & ~(P & ~submask[None, :]).any(axis=1)
+    return {'maxsyll':maxsyll, 'tightest':tightest, 'absent':absent, 'joint':int(hit.sum()), 'hit':hit}
+
+
+def first_positions(values, nvals):
+    '''
+    b x nvals matrix: the first column in which each value occurs in each row of a b x k matrix of values (k if it doesn't). the presence matrix of the first j columns is then first_positions(...) < j, for any j
+    '''
+    b, k = values.shape
+    out = numpy.full((b, nvals), k, dtype=numpy.int32)
+    rows = numpy.arange(b)
+    for j in range(k-1, -1, -1):
+        out[rows, values[:, j]] = j
+    return out
+
+
+def prob_all_within(m, n, k, replace=True):
+    '''
+    probability that all k words of a sample from a lexicon of n fall into a given subset of m words: (m/n)^k with replacement, C(m,k)/C(n,k) without (hypergeometric). m can be an array
+    '''
+    m = numpy.asarray(m, dtype=float)
+    if replace:
+        return (m/n)**k
+    with numpy.errstate(invalid='ignore'):
+        logp = (special.gammaln(m+1) - special.gammaln(numpy.maximum(m-k, 0)+1)
+                - special.gammaln(n+1) + special.gammaln(n-k+1))
+    return numpy.where(m >= k, numpy.exp(logp), 0.0)
+
+
+def weighted_within(wsub, wtot, k):
+    '''
+    the same for weighted draws with replacement: (share of the total weight in the subset)^k
+    '''
+    return (numpy.asarray(wsub, dtype=float)/wtot)**k
+
+
+def subset_prob(mask, k, replace=True, weights=None):
+    '''
+    probability that a sample of k lands entirely in the words picked out by a boolean mask (or a matrix of masks, one per row)
+    '''
+    mask = numpy.asarray(mask)
+    if weights is not None:
+        if not replace:
+            raise ValueError("there is no closed form for weighted sampling without replacement")
+        weights = numpy.asarray(weights, dtype=float)
+        return weighted_within(mask @ weights, weights.sum(), k)
+    return prob_all_within(mask.sum(axis=-1), mask.shape[-1], k, replace)
+
+
+def importance_draws(q, k, b, rng, replace=True, table=None):
+    '''
+    b samples of k indices drawn from the proposal q (probabilities over the lexicon). without replacement the rows come out in the order successive sampling picks them (the Efraimidis-Spirakis keys, largest first), which the likelihood ratio needs
+    '''
+    if replace:
+        return smp.alias_draw_batch(table, (b, k), rng)
+    with numpy.errstate(divide='ignore'):
+        keys = numpy.log(rng.random((b, len(q))))/q[None, :]
+    top = numpy.argpartition(-keys, k-1, axis=1)[:, :k]
+    order = numpy.argsort(-numpy.take_along_axis(keys, top, axis=1), axis=1)
+    return numpy.take_along_axis(top, order, axis=1)
+
+
+def log_seq_prob(p, idx, replace=True):
+    '''
+    the log probability of each row of ordered draws idx under the probabilities p: sum of log p with replacement; without, each draw is renormalised over what is left, log p_i - log(1 - the mass drawn before it)
+    '''
+    lp = numpy.log(p[idx])
+    if replace:
+        return lp.sum(axis=1)
+    drawn = numpy.cumsum(p[idx], axis=1) - p[idx]
+    return (lp - numpy.log1p(-numpy.minimum(drawn, 1.0))).sum(axis=1)
+
+
+def importance_prob(good, k, nsamples, rng, replace=True, weights=None, tilt=1.0, batch=None):
+    '''
+    importance-sampling estimate of the probability that a sample of k lands entirely in the words picked out by the boolean mask good, for probabilities far too small for plain Monte Carlo to see.
+    samples are drawn from a tilted lexicon that puts the share tilt of its mass on the good words (tilt=1: only good words are drawn), each word keeping its relative weight within its half, and every hit is weighted by its likelihood ratio p(sample)/q(sample). the mean of the weighted hits is unbiased for any tilt above the good words' own share.
+    with replacement and tilt=1 every ratio is the same number, so the estimate is exact and its standard error 0 (subset_prob gives the same thing in closed form); the case that needs this is weighted sampling without replacement, where there is no closed form and the ratios only vary a little from sample to sample.
+    returns {'p': the estimate, 'se': its standard error, 'hits': samples that landed in good, 'nsamples', 'ess': the effective sample size of the hits}
+    '''
+    good = numpy.asarray(good, dtype=bool)
+    n = len(good)
+    p = numpy.ones(n) if weights is None else numpy.asarray(weights, dtype=float)
+    p = p/p.sum()
+    pgood = p[good].sum()
+    out = {'p':0.0, 'se':0.0, 'hits':0, 'nsamples':nsamples, 'ess':0.0}
+    if pgood == 0 or (not replace and numpy.count_nonzero(good & (p > 0)) < k):
+        return out
+    if pgood >= 1 or tilt <= pgood:
+        q = p
+    else:
+        q = numpy.where(good, p*tilt/pgood, p*(1-tilt)/(1-pgood))
+    table = smp.alias_table(q) if replace else None
+    batch = batch or batch_size(n, k)
+    total, totalsq, hits, done = 0.0, 0.0, 0, 0
+    #the ratios are summed relative to the largest one seen so far, so that probabilities around 1e-300 don't underflow
+    scale = None
+    while done < nsamples:
+        b = min(batch, nsamples-done)
+        idx = importance_draws(q, k, b, rng, replace, table)
+        hit = good[idx].all(axis=1)
+        logw = log_seq_prob(p, idx[hit], replace) - log_seq_prob(q, idx[hit], replace)
+        if len(logw):
+            if scale is None or logw.max() > scale:
+                new = logw.max()
+                if scale is not None:
+                    total *= numpy.exp(scale - new)
+                    totalsq *= numpy.exp(2*(scale - new))
+                scale = new
+            w = numpy.exp(logw - scale)
+            total += w.sum()
+            totalsq += (w*w).sum()
+            hits += len(w)
+        done += b
+    if hits:
+        mean = total/nsamples
+        var = max(totalsq/nsamples - mean*mean, 0.0)*nsamples/max(nsamples-1, 1)
+        out['p'] = float(numpy.exp(scale)*mean)
+        out['se'] = float(numpy.exp(scale)*numpy.sqrt(var/nsamples))
+        out['hits'] = hits
+        out['ess'] = float(total*total/totalsq)
+    return out
+
+
+def scan_probs(comp, caps, k, replace=True, weights=None):
+    '''
+    the probability, for every class x syllable cap at once, that a sample of k has every final segment in the class and no word over the cap.
+    the words (or weight) inside each restriction come from one classes x words by words x caps product, so a few hundred classes times a handful of caps is one matrix multiplication and one call to subset_prob's formulas.
+    returns (inside, probs): classes x caps arrays of the number of lexicon words that satisfy each restriction, and its probability
+    '''
+    caps = numpy.asarray(caps)
+    wordclass = comp['classmat'][:, comp['final']].astype(float)
+    under = (comp['syll'][:, None] <= caps[None, :]).astype(float)
+    inside = wordclass @ under
+    if weights is None:
+        return inside, prob_all_within(inside, len(comp['final']), k, replace)
+    if not replace:
+        raise ValueError("there is no closed form for weighted sampling without replacement")
+    weights = numpy.asarray(weights, dtype=float)
+    return inside, weighted_within(wordclass @ (under*weights[:, None]), weights.sum(), k)
+
+
+def max_dist(values, k, replace=True, weights=None):
+    '''
+    exact distribution of the maximum of a sample of k from a list of integer values (e.g. syllable counts): {value: probability}
+    '''
+    values = numpy.asarray(values)
+    levels = numpy.unique(values)
+    cdf = subset_prob(values[None, :] <= levels[:, None], k, replace, weights)
+    pmf = numpy.diff(numpy.concatenate([[0.0], cdf]))
+    return {int(v):float(p) for v, p in zip(levels, pmf) if p > 0}
+
+
+def min_dist(values, k, replace=True, weights=None):
+    '''
+    exact distribution of the minimum of a sample of k: {value: probability}
+    '''
+    values = numpy.asarray(values)
+    levels = numpy.unique(values)
+    sf = subset_prob(values[None, :] >= levels[:, None], k, replace, weights)
+    pmf = sf - numpy.concatenate([sf[1:], [0.0]])
+    return {int(v):float(p) for v, p in zip(levels, pmf) if p > 0}
+
+
+def exactly_types_prob(typecounts, target, k, replace=True):
+    '''
+    probability that a sample of k tokens from a lexicon of types ({type: number of tokens}) contains every type in target and nothing else, by inclusion-exclusion over subsets of target
+    '''
+    n = sum(typecounts.values())
+    target = [t for t in target if typecounts.get(t, 0) > 0]
+    total = 0.0
+    for r in range(len(target)+1):
+        for sub in itertools.combinations(target, r):
+            m = sum(typecounts[t] for t in sub)
+            total += (-1)**(len(target)-r)*float(prob_all_within(m, n, k, replace))
+    return max(total, 0.0)
+
+
+def word_props(word, vowels, stress=(), consonants=None):
+    '''
+    the properties of one word that the stat predicates refer to:
+        segs: the segments, without word boundaries
+        initial, final, penult: the first, last, and second-to-last segments (penult is None for one-segment words)
+        syllcount: the number of vowels
+        stresspos: which syllable (counting from 1) has the first stressed vowel, 0 if none
+        xgrid: the x grid, e.g. "xX" (see prosody.x_grid), without spaces or boundaries
+        cv: the CV skeleton, e.g. "CVCVC", if consonants are given (sorted in reverse, as prosody.cv_skeleton wants them)
+    '''
+    segs = word_segs(word)
+    wvowels = [x for x in segs if x in vowels]
+    stressed = [i for i, x in enumerate(wvowels) if x in stress]
+    props = {'segs':segs, 'initial':segs[0], 'final':segs[-1], 'penult':segs[-2] if len(segs)>1 else None,
+             'syllcount':len(wvowels), 'stresspos':stressed[0]+1 if stressed else 0,
+             'xgrid':pros.x_grid(' '.join(segs), vowels, stress).replace('#', '').replace(' ', '')}
+    if consonants is not None:
+        props['cv'] = pros.cv_skeleton(' '.join(segs), consonants, vowels).replace(' ', '')
+    return props
+
+
+stat_pattern = re.compile(r'^(!?)(initial|final|penult|stress|syll|xgrid|cv|ngram)(<=|>=|=)(.+)$')
+
+
+def parse_stat(spec):
+    '''
+    parses a stat spec (see the module docstring) into a list of atoms (negated, property, operator, value), to be and-ed together
+    '''
+    atoms = []
+    for part in spec.split('&'):
+        m = stat_pattern.match(part.strip())
+        if m is None:
+            raise ValueError(f"cannot parse the stat {part!r}: expected something like final=-son, syll<=3, stress=-1, xgrid=x X, cv=CVC or ngram=s t")
+        neg, prop, op, val = m.groups()
+        if op!='=' and prop not in ('syll', 'stress'):
+            raise ValueError(f"{prop} can only be compared with =, not {op}")
+        val = int(val) if prop in ('syll', 'stress') else val.strip()
+        atoms.append((neg=='!', prop, op, val))
+    return atoms
+
+
+def seg_class(val, featdic):
+    '''
+    the segments picked out by a class value: comma-separated features (+son,-voice) if they are all in featdic, otherwise a comma-separated list of segments
+    '''
+    items = [x.strip() for x in val.split(',')]
+    if all(x in featdic for x in items):
+        segs = featdic[items[0]]
+        for x in items[1:]:
+            segs = segs & featdic[x]
+        return set(segs)
+    return set(items)
+
+
+def atom_column(atom, props, featdic):
+    '''
+    one atom evaluated over a list of word_props, as a boolean array
+    '''
+    neg, prop, op, val = atom
+    if prop in ('initial', 'final', 'penult'):
+        segs = seg_class(val, featdic)
+        col = [p[prop] in segs for p in props]
+    elif prop=='syll':
+        vals = numpy.array([p['syllcount'] for p in props])
+        col = vals<=val if op=='<=' else vals>=val if op=='>=' else vals==val
+    elif prop=='stress':
+        pos = numpy.array([p['stresspos'] for p in props])
+        if val<0:
+            #counting from the end: -1 is the last syllable
+            pos = numpy.where(pos>0, numpy.array([p['syllcount'] for p in props])-pos+1, 0)
+            val = -val
+        col = pos<=val if op=='<=' else pos>=val if op=='>=' else pos==val
+        if op!='=':
+            col = col & (pos>0)
+    elif prop=='xgrid':
+        target = val.replace('#', '').replace(' ', '')
+        col = [p['xgrid']==target for p in props]
+    elif prop=='cv':
+        if props and 'cv' not in props[0]:
+            raise ValueError("cv stats need the consonants of the feature system")
+        target = val.replace('#', '').replace(' ', '')
+        col = [p['cv']==target for p in props]
+    else:
+        target = ' ' + ' '.join(val.split()) + ' '
+        col = [target in ' # ' + ' '.join(p['segs']) + ' # ' for p in props]
+    col = numpy.asarray(col, dtype=bool)
+    return ~col if neg else col
+
+
+def compile_stats(words, specs, featdic):
+    '''
+    precomputes a words x stats boolean matrix, one column per stat spec, each the conjunction of its atoms.
+    featdic is a feature-to-segments dictionary (nclasses.make_featdic), which supplies the vowels, stressed vowels, consonants, and classes
+    '''
+    vowels = featdic.get('+syllabic', featdic.get('+syll', set()))
+    consonants = featdic.get('-syllabic', featdic.get('-syll'))
+    props = [word_props(wd, vowels, featdic.get('+stress', set()), sorted(consonants, reverse=True) if consonants else None) for wd in words]
+    cols = numpy.ones((len(words), len(specs)), dtype=bool)
+    for j, spec in enumerate(specs):
+        for atom in parse_stat(spec):
+            cols[:, j] &= atom_column(atom, props, featdic)
+    return cols
+
+
+def stat_batch(cols, idx):
+    '''
+    for a batch of samples (idx: b x k word indices), the number of words in each sample that satisfy each stat: a b x stats array
+    '''
+    return cols[idx].sum(axis=1, dtype=numpy.int32)
+
+
+def count_dist(m, n, k, replace=True, share=None):
+    '''
+    exact distribution of the number of words from a subset of m (out of n) in a sample of k: binomial with replacement (success probability m/n, or share, the subset's share of the total weight), hypergeometric without.
+    returns an array of probabilities for 0..k
+    '''
+    x = numpy.arange(k+1)
+    if replace:
+        return stats.binom.pmf(x, k, m/n if share is None else share)
+    if share is not None:
+        raise ValueError("there is no closed form for weighted sampling without replacement")
+    return stats.hypergeom.pmf(x, n, m, k)
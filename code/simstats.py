@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy
+
+from lazyimport import lazy_module
+
+stats = lazy_module('scipy.stats')
+
+'''
+confidence intervals for the simulation and lexicon statistics in lex_comparison.py.
+
+lex_comparison.ci_long gives a normal-approximation interval for a mean, which is a poor fit for something like the maximum syllable count of a sample: it takes only a handful of values and is heavily skewed. this module adds
+    - bootstrap intervals (percentile and BCa) for the mean, the median, or any quantile
+    - exact binomial intervals (Clopper-Pearson and Wilson) for rates, e.g. how often the joint condition held, or how often a class was absent
+
+everything takes either a histogram {value: count}, as the simulations produce, or a plain list/array of values. a histogram is resampled with one multinomial draw per replicate (the resampled counts), so thousands of replicates cost a matrix product over the distinct values, not over the samples.
+'''
+
+
+def hist_arrays(data):
+    '''
+    (values, counts) arrays from a histogram {value: count} or from raw values
+    '''
+    if isinstance(data, dict):
+        values = numpy.array(list(data.keys()), dtype=float)
+        counts = numpy.array(list(data.values()), dtype=float)
+    else:
+        values, counts = numpy.unique(numpy.asarray(data, dtype=float), return_counts=True)
+    order = numpy.argsort(values)
+    return values[order], counts[order]
+
+
+def stat_from_counts(values, counts, stat='mean'):
+    '''
+    a statistic computed from (resampled) counts over sorted values. counts can be a vector or a replicates x values matrix.
+    stat is 'mean', 'median', or a quantile between 0 and 1
+    '''
+    counts = numpy.atleast_2d(counts)
+    n = counts.sum(axis=1)
+    if stat=='mean':
+        out = counts @ values / n
+    else:
+        q = 0.5 if stat=='median' else float(stat)
+        cum = numpy.cumsum(counts, axis=1)
+        #the lowest value whose cumulative count reaches q*n
+        out = values[(cum >= q*n[:, None]).argmax(axis=1)]
+    return out
+
+
+def bootstrap_reps(data, stat='mean', nboot=5000, rng=None, seed=None):
+    '''
+    nboot bootstrap replicates of a statistic, as an array.
+    histograms (and raw arrays with few distinct values) are resampled as multinomial counts over the distinct values
+    '''
+    rng = rng or numpy.random.default_rng(seed)
+    values, counts = hist_arrays(data)
+    n = int(counts.sum())
+    resampled = rng.multinomial(n, counts/counts.sum(), size=nboot)
+    return stat_from_counts(values, resampled, stat)
+
+
+def jackknife(values, counts, stat='mean'):
+    '''
+    leave-one-out values of a statistic, one per distinct value (leaving out one observation of it), returned with how many observations share it
+    '''
+    loo = counts[None, :] - numpy.eye(len(values))
+    keep = counts > 0
+    return stat_from_counts(values, loo[keep], stat), counts[keep]
+
+
+def bootstrap_ci(data, stat='mean', method='bca', alpha=0.05, nboot=5000, rng=None, seed=None):
+    '''
+    a (lower, upper) bootstrap confidence interval.
+    method is 'percentile' or 'bca' (bias-corrected and accelerated: shifts and stretches the percentiles to correct for bias and skew in the bootstrap distribution, with the acceleration estimated by the jackknife)
+    '''
+    reps = bootstrap_reps(data, stat, nboot, rng, seed)
+    if method=='percentile':
+        lo, hi = numpy.quantile(reps, [alpha/2, 1-alpha/2])
+        return (float(lo), float(hi))
+    values, counts = hist_arrays(data)
+    theta = stat_from_counts(values, counts, stat)[0]
+    prop = ((reps < theta).sum() + 0.5*(reps == theta).sum())/len(reps)
+    if prop <= 0 or prop >= 1:
+        #every replicate on one side: nothing to correct with
+        lo, hi = numpy.quantile(reps, [alpha/2, 1-alpha/2])
+        return (float(lo), float(hi))
+    z0 = stats.norm.ppf(prop)
+    jk, w = jackknife(values, counts, stat)
+    d = (jk*w).sum()/w.sum() - jk
+    denom = 6*((w*d**2).sum())**1.5
+    a = (w*d**3).sum()/denom if denom > 0 else 0.0
+    z = stats.norm.ppf([alpha/2, 1-alpha/2])
+    adj = stats.norm.cdf(z0 + (z0+z)/(1 - a*(z0+z)))
+    lo, hi = numpy.quantile(reps, adj)
+    return (float(lo), float(hi))
+
+
+def clopper_pearson(k, n, alpha=0.05):
+    '''
+    exact binomial interval for k successes out of n, from the beta distribution. k and n can be arrays
+    '''
+    k = numpy.asarray(k, dtype=float)
+    n = numpy.asarray(n, dtype=float)
+    with numpy.errstate(invalid='ignore'):
+        lo = numpy.where(k > 0, stats.beta.ppf(alpha/2, k, n-k+1), 0.0)
+        hi = numpy.where(k < n, stats.beta.ppf(1-alpha/2, k+1, n-k), 1.0)
+    return lo, hi
+
+
+def wilson(k, n, alpha=0.05):
+    '''
+    Wilson score interval for k successes out of n. k and n can be arrays
+    '''
+    k = numpy.asarray(k, dtype=float)
+    n = numpy.asarray(n, dtype=float)
+    z = stats.norm.ppf(1-alpha/2)
+    p = k/n
+    centre = (p + z**2/(2*n))/(1 + z**2/n)
+    half = z*numpy.sqrt(p*(1-p)/n + z**2/(4*n**2))/(1 + z**2/n)
+    return numpy.maximum(centre-half, 0.0), numpy.minimum(centre+half, 1.0)
+
+
+def binom_ci(k, n, method='clopper-pearson', alpha=0.05):
+    '''
+    a binomial rate interval: method is 'clopper-pearson' or 'wilson'. returns (lower, upper), floats for scalar input, arrays otherwise
+    '''
+    lo, hi = clopper_pearson(k, n, alpha) if method=='clopper-pearson' else wilson(k, n, alpha)
+    if numpy.ndim(lo)==0:
+        return (float(lo), float(hi))
+    return lo, hi
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os, json, hashlib, pickle, random
+import numpy
+
+'''
+a small on-disk store for Monte Carlo results, so that simulations can be resumed and never re-run for nothing.
+
+a result is keyed by what determines it: a hash of the lexicon, the sublexicon, and the feature file, plus nsamples, the seed, the sampling engine, and any other settings the simulation depends on. that includes the batch size and the checkpoint interval: the numpy engines draw a batch at a time and start a new batch at every checkpoint, so either one changes which random numbers go into which sample. the counters are saved as compressed numpy arrays (<key>.npz). while a simulation runs, it is checkpointed every so often (<key>.partial.npz) along with the state of the random number generator, so a killed run picks up where it left off, and gives the same result it would have given had it never been interrupted.
+
+usage, inside a simulation function:
+
+    key = simstore.make_key(func='finc', lex=lex, sublex=sublex, featpath=featpath, nsamples=nsamples, seed=seed, engine='python', batch=batch, checkpoint=checkpoint)
+    state = simstore.run_cached(state, step, key=key, **kwargs)
+
+where state is a dict of counters (ints or {value: count} dicts) and step(state, n) runs n more samples and updates them.
+'''
+
+
+def content_hash(items):
+    '''
+    order-insensitive hash of a collection of words (or syllable counts, x grids, ...). a dict is hashed with its values, so {'x x': 20} and {'x x': 21} differ
+    '''
+    h = hashlib.sha256()
+    if isinstance(items, dict):
+        lines = sorted(f"{k}\t{items[k]}" for k in items)
+    else:
+        lines = sorted(str(x) for x in items)
+    for line in lines:
+        h.update(line.encode('utf-8'))
+        h.update(b'\n')
+    return h.hexdigest()
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def make_key(**kwargs):
+    '''
+    builds the key for a simulation result. lex, sublex (collections) and featpath (a file) are hashed by content (lex together with its sampling weights, if any); everything else (func, nsamples, seed, engine, ...) is used as is and must be json-serializable
+    returns {'id': hex digest, 'meta': the dict that was hashed}
+    '''
+    meta = {}
+    if kwargs.get('weights') is not None:
+        #weights go with the items they weight
+        kwargs['lex'] = [f"{x}\t{w}" for x, w in zip(kwargs['lex'], kwargs['weights'])]
+    kwargs.pop('weights', None)
+    for k in sorted(kwargs):
+        if k in ('lex', 'sublex'):
+            meta[k] = content_hash(kwargs[k]) if kwargs[k] is not None else None
+        elif k == 'featpath':
+            meta['features'] = file_hash(kwargs[k]) if kwargs[k] else None
+        else:
+            meta[k] = kwargs[k]
+    digest = hashlib.sha256(json.dumps(meta, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    return {'id': digest, 'meta': meta}
+
+
+def _pack(state):
+    '''
+    flattens a state dict into numpy arrays: ints are stored as 0-d arrays, counters as paired key/value arrays
+    '''
+    arrays = {}
+    for name, val in state.items():
+        if isinstance(val, dict):
+            keys = list(val.keys())
+            if all(isinstance(x, (int, numpy.integer)) for x in keys):
+                arrays[f'k:{name}'] = numpy.array(keys, dtype=numpy.int64)
+            else:
+                arrays[f's:{name}'] = numpy.array([str(x) for x in keys], dtype=str)
+            arrays[f'v:{name}'] = numpy.array([val[x] for x in keys], dtype=numpy.int64)
+        else:
+            arrays[f'i:{name}'] = numpy.array(val, dtype=numpy.int64)
+    return arrays
+
+
+def _unpack(data):
+    state = {}
+    for name in data.files:
+        kind, field = name.split(':', 1)
+        if kind == 'i':
+            state[field] = int(data[name])
+        elif kind in ('k', 's'):
+            keys = [int(x) for x in data[name]] if kind == 'k' else [str(x) for x in data[name]]
+            state[field] = dict(zip(keys, (int(x) for x in data[f'v:{field}'])))
+    return state
+
+
+def save(path, state, meta, done, rngstate=None):
+    '''
+    writes a result (or a checkpoint) atomically: to a temporary file first, then renamed into place
+    '''
+    arrays = _pack(state)
+    arrays['meta:json'] = numpy.array(json.dumps(meta, default=str))
+    arrays['meta:done'] = numpy.array(done, dtype=numpy.int64)
+    if rngstate is not None:
+        arrays['meta:rng'] = numpy.frombuffer(pickle.dumps(rngstate), dtype=numpy.uint8)
+    tmp = path + '.tmp.npz'
+    numpy.savez_compressed(tmp, **arrays)
+    os.replace(tmp, path)
+
+
+def load(path):
+    '''
+    returns (state, meta, done, rngstate) for a stored result or checkpoint
+    '''
+    with numpy.load(path) as data:
+        meta = json.loads(str(data['meta:json']))
+        done = int(data['meta:done'])
+        rngstate = pickle.loads(data['meta:rng'].tobytes()) if 'meta:rng' in data.files else None
+        state = _unpack(data)
+    return state, meta, done, rngstate
+
+
+def get_rngstate(rng=None):
+    return random.getstate() if rng is None else rng.bit_generator.state
+
+
+def set_rngstate(state, rng=None):
+    if rng is None:
+        random.setstate(state)
+    else:
+        rng.bit_generator.state = state
+
+
+def run_cached(state, step, **kwargs):
+    '''
+    runs step(state, n) until kwargs['nsamples'] samples are done, and returns the final state.
+    with no kwargs['store'] directory, this just runs the simulation in one go.
+    with a store: a finished result with the same key is loaded and returned straight away; an interrupted one is resumed from its last checkpoint; otherwise the simulation starts from scratch, checkpointing every kwargs['checkpoint'] samples (default 10,000).
+    kwargs['rng'] is a numpy Generator if the simulation draws from one; otherwise the state of the random module is saved.
+    '''
+    nsamples = kwargs.get('nsamples')
+    storedir = kwargs.get('store')
+    rng = kwargs.get('rng')
+    verbosity = kwargs.get('verbosity', 1)
+    if not storedir:
+        step(state, nsamples)
+        return state
+    key = kwargs['key']
+    os.makedirs(storedir, exist_ok=True)
+    final = os.path.join(storedir, key['id'] + '.npz')
+    partial = os.path.join(storedir, key['id'] + '.partial.npz')
+    if os.path.exists(final):
+        if verbosity > 0:
+            print(f"loading stored result {key['id'][:12]} from {storedir}")
+        return load(final)[0]
+    done = 0
+    if os.path.exists(partial):
+        saved, meta, done, rngstate = load(partial)
+        state.update(saved)
+        set_rngstate(rngstate, rng)
+        if verbosity > 0:
+            print(f"resuming {key['id'][:12]} from checkpoint: {done}/{nsamples} samples done")
+    checkpoint = kwargs.get('checkpoint', 10000)
+    while done < nsamples:
+        n = min(checkpoint, nsamples - done)
+        step(state, n)
+        done += n
+        if done < nsamples:
+            save(partial, state, key['meta'], done, get_rngstate(rng))
+            if verbosity > 1:
+                print(f"checkpoint: {done}/{nsamples}")
+    save(final, state, key['meta'], done)
+    if os.path.exists(partial):
+        os.remove(partial)
+    return state
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os, sys, time, shutil
+
+# should be in the same code directory
+import nclasses as pnc
+import learningdata as ldr
+
+'''
+turns Russian orthography into LearningData transcriptions, following the conventions of the lexicons in data/russian:
+
+    абажу́р       -->   a b a ʐ ú r
+    компа́н|ия    -->   k o m p á nʲ | i j a      (or k o m p á nʲ | i j as a stem, with stem=True)
+    съём         -->   s j ó m
+
+    - consonants are palatalised before е ё и ю я and ь (if Features.txt has a palatalised counterpart: ж ш ц stay hard), also across a | boundary
+    - е ё ю я are j + vowel at the start of a word, after a vowel, and after ъ and ь; ы is i; vowels are not reduced
+    - stress is marked by a combining acute (U+0301) or an apostrophe after the vowel, and ё is always stressed. unmarked words come out unstressed
+    - | (or -) marks a morpheme boundary
+
+the rules are compiled into a trie over orthographic strings (a consonant together with a following ь, boundary, vowel and stress mark is one entry), and each word is transcribed by repeatedly taking the longest match. every segment the rules can produce is checked against the feature file when they are compiled, and words with characters the rules don't cover are reported rather than transcribed.
+
+    $ python translit.py --infile ../data/raw_searches/astyj_hits_06_13.txt --stem True --outdir russian/astyj_hits
+
+writes a new lexicon directory (LearningData.txt, with the orthographic lemma in a second column, and a copy of Features.txt). the same transcriptions are used to join Sharoff frequencies to lexicons that have no lemma column (see sampling.ld_lemmas).
+'''
+
+datapath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+featpath_default = os.path.join(datapath, 'russian', 'Features.txt')
+
+consonants = {'б':'b', 'в':'v', 'г':'ɡ', 'д':'d', 'ж':'ʐ', 'з':'z', 'к':'k', 'л':'l', 'м':'m', 'н':'n', 'п':'p', 'р':'r',
+              'с':'s', 'т':'t', 'ф':'f', 'х':'x', 'ц':'ʦ', 'ч':'ʨ', 'ш':'ʂ', 'щ':'ɕ', 'й':'j'}
+vowels = {'а':'a', 'о':'o', 'у':'u', 'ы':'i', 'э':'e', 'и':'i', 'я':'a', 'е':'e', 'ё':'o', 'ю':'u'}
+#vowels that palatalise a preceding consonant, and (all but и) start with j elsewhere
+soft = 'иеёюя'
+iotated = 'еёюя'
+stressed = {'a':'á', 'e':'é', 'i':'í', 'o':'ó', 'u':'ú'}
+unstressed = {v:k for k, v in stressed.items()}
+hushing = ('j', 'ʐ', 'ʂ', 'ʦ', 'ʨ', 'ɕ')
+vowel_set = set(vowels.values()) | set(stressed.values())
+stress_marks = ('\u0301', "'")
+boundaries = {'|':'|', '-':'|'}
+
+_tries = {}
+
+
+def vowel_segs(v, mark, initial):
+    '''
+    the segments of one vowel letter: initial says whether it is in j-position (word-initial, after a vowel, ъ or ь)
+    '''
+    seg = vowels[v]
+    if mark or v=='ё':
+        seg = stressed[seg]
+    return ['j', seg] if initial and v in iotated else [seg]
+
+
+def make_rules(segset):
+    '''
+    {orthographic string: [segments]} for every unit the trie matches
+    '''
+    def pal(c):
+        seg = consonants[c]
+        return seg+'ʲ' if seg+'ʲ' in segset else seg
+    marks = ('',) + stress_marks
+    rules = {}
+    for b, seg in boundaries.items():
+        rules[b] = [seg]
+    rules['ъ'] = []
+    rules['ь'] = []
+    for v in vowels:
+        for m in marks:
+            rules[v+m] = vowel_segs(v, m, True)
+            #after ь and ъ, и is j + i too (воробьи, чьи)
+            rules['ь'+v+m] = ['j'] + vowel_segs(v, m, False) if v=='и' else vowel_segs(v, m, True)
+            rules['ъ'+v+m] = vowel_segs(v, m, True)
+    for c in consonants:
+        rules[c] = [consonants[c]]
+        rules[c+'ь'] = [pal(c)]
+        for v in soft:
+            for m in marks:
+                rules[c+v+m] = [pal(c)] + vowel_segs(v, m, False)
+                rules[c+'ь'+v+m] = [pal(c), 'j'] + vowel_segs(v, m, False)
+                for b, seg in boundaries.items():
+                    rules[c+b+v+m] = [pal(c), seg] + vowel_segs(v, m, False)
+    return rules
+
+
+def compile_rules(featpath=featpath_default):
+    '''
+    the rules as a trie of nested dictionaries; the output for a string ending at a node is under the '' key.
+    raises ValueError if the rules produce a segment that is not in the feature file
+    '''
+    if featpath in _tries:
+        return _tries[featpath]
+    segset = set(pnc.make_segdic(featpath=featpath)['segdic'])
+    rules = make_rules(segset)
+    bad = sorted({s for out in rules.values() for s in out if s not in segset})
+    if bad:
+        raise ValueError(f"the transcription rules produce segments that are not in {featpath}: {' '.join(bad)}")
+    trie = {}
+    for orth, segs in rules.items():
+        node = trie
+        for ch in orth:
+            node = node.setdefault(ch, {})
+        node[''] = segs
+    _tries[featpath] = trie
+    return trie
+
+
+def transcribe(word, trie, stem=False):
+    '''
+    a list of segments for one orthographic word (by longest match), without word boundaries. with stem, a final vowel is dropped, as in the stem lexicons (здание -> z d á nʲ i j).
+    raises ValueError at the first character no rule covers
+    '''
+    word = word.strip().lower()
+    out = []
+    i, n = 0, len(word)
+    while i < n:
+        node, j, match, end = trie, i, None, i
+        while j < n and word[j] in node:
+            node = node[word[j]]
+            j += 1
+            if '' in node:
+                match, end = node[''], j
+        if match is None:
+            raise ValueError(f"no rule for {word[i]!r} in {word!r}")
+        out.extend(match)
+        i = end
+    if stem and len(out) > 1 and out[-1] in vowel_set:
+        out.pop()
+    return out
+
+
+def transcribe_list(**kwargs):
+    '''
+    transcribes the orthographic words in kwargs['words'], returning kwargs with
+        transcribed: [(word, transcription string)] for the words that could be transcribed
+        errors: [(word, message)] for the ones that couldn't
+    kwargs['stem'] strips final vowels; kwargs['featpath'] is the feature file to check segments against
+    '''
+    trie = compile_rules(kwargs.get('featpath', featpath_default))
+    stem = kwargs.get('stem', False)
+    done, errors = [], []
+    for w in kwargs['words']:
+        try:
+            done.append((w, ' '.join(transcribe(w, trie, stem))))
+        except ValueError as e:
+            errors.append((w, str(e)))
+    kwargs['transcribed'] = done
+    kwargs['errors'] = errors
+    if errors and kwargs.get('verbosity', 1) > 0:
+        print(f"{len(errors)} words could not be transcribed, e.g. {errors[0][1]}")
+    return kwargs
+
+
+def write_lexicon(**kwargs):
+    '''
+    writes kwargs['transcribed'] into a new lexicon directory under data (kwargs['outdir'], e.g. russian/astyj_hits): LearningData.txt with the lemma in a second column, and a copy of the feature file. doublets are written once
+    '''
+    outdir = os.path.join(datapath, kwargs['outdir'])
+    os.makedirs(outdir, exist_ok=True)
+    seen = ldr.make_doublet_check()
+    n = 0
+    with open(os.path.join(outdir, 'LearningData.txt'), 'w', encoding='utf-8') as f:
+        for lemma, segs in kwargs['transcribed']:
+            if not segs or seen(segs):
+                continue
+            f.write(f"{segs}\t{lemma}\n")
+            n += 1
+    shutil.copy(kwargs.get('featpath', featpath_default), os.path.join(outdir, 'Features.txt'))
+    if kwargs.get('verbosity', 1) > 0:
+        print(f"{n} words written to {outdir}")
+    return outdir
+
+
+def join_key(word):
+    '''
+    what a transcription is matched on when joining lemmas. the lexicons are hand-corrected where the spelling misleads, so the key drops what the spelling can't be trusted for:
+        stress, morpheme and word boundaries
+        e/o after soft and hushing consonants and j (Sharoff lemmas write ё as е)
+        palatalisation before e (loanwords such as адепт, бизнес are transcribed with hard consonants)
+        j after a soft or hushing consonant (вьюн is vʲ u n, and the stems of -ье/-ья nouns end in the soft consonant)
+    '''
+    segs = [unstressed.get(s, s) for s in word.split(' ') if s not in ('|', '#', '')]
+    out = []
+    for s in segs:
+        soft = out and (out[-1].endswith('ʲ') or out[-1] in hushing)
+        if s=='j' and soft and out[-1]!='j':
+            continue
+        if s=='e' or (s=='o' and soft):
+            s = 'E'
+            if out:
+                out[-1] = out[-1].rstrip('ʲ')
+        out.append(s)
+    return ' '.join(out)
+
+
+def join_lemmas(words, lemmas, featpath=featpath_default, verbosity=1):
+    '''
+    pairs LearningData words with orthographic lemmas by transcribing the lemmas (both whole and as stems) and matching on join_key. lemmas should be in order of preference (most frequent first), which decides between homophones.
+    returns [(word, lemma or None)]
+    '''
+    trie = compile_rules(featpath)
+    index = {}
+    for lemma in lemmas:
+        for stem in (False, True):
+            try:
+                key = join_key(' '.join(transcribe(lemma, trie, stem)))
+            except ValueError:
+                continue
+            index.setdefault(key, lemma)
+    out = [(w, index.get(join_key(w))) for w in words]
+    if verbosity > 0:
+        missing = sum(1 for w, l in out if l is None)
+        print(f"{len(out)-missing} of {len(out)} words matched to a lemma by transcription")
+    return out
+
+
+if __name__=="__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="transcribes Russian orthographic word lists into LearningData format")
+    parser.add_argument("--infile", help="a file of orthographic words, one per line (only the first tab-separated column is used, so frequency lists work)")
+    parser.add_argument("--freqcat", help="or: take the Sharoff lemmas of this part of speech (e.g. noun), most frequent first", default=None)
+    parser.add_argument("--stem", help="strip word-final vowels, as in the stem lexicons", type=bool, default=False)
+    parser.add_argument("--outdir", help="write a new lexicon directory under data (e.g. russian/astyj_hits); otherwise the transcriptions are printed", default=None)
+    parser.add_argument("--featpath", help="the feature file to check segments against and copy into outdir", default=featpath_default)
+    args = parser.parse_args()
+    if args.freqcat:
+        import sampling as smp
+        freqs = smp.read_freqs(cat=args.freqcat)
+        words = sorted(freqs, key=freqs.get, reverse=True)
+    else:
+        with open(args.infile, encoding='utf-8') as f:
+            words = [line.split('\t')[0].strip() for line in f if line.strip()]
+    start = time.time()
+    k = transcribe_list(words=words, stem=args.stem, featpath=args.featpath)
+    secs = time.time() - start
+    print(f"{len(k['transcribed'])} words transcribed in {secs:.2f} s ({len(words)/max(secs, 1e-9):.0f} words/s)", file=sys.stderr)
+    for w, msg in k['errors']:
+        print(f"{w}\t{msg}", file=sys.stderr)
+    if args.outdir:
+        write_lexicon(**k, outdir=args.outdir)
+    else:
+        for w, segs in k['transcribed']:
+            print(f"{segs}\t{w}")
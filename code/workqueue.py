@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os, sys, json, time, socket, hashlib, shutil, threading
+
+'''
+spreads very large Monte Carlo runs (the --last and --stats simulations of lex_comparison.py) over several machines that share a filesystem, with nothing but files in a queue directory: no scheduler, no server.
+
+    $ python workqueue.py --queue /lab/shared/q submit --lexicon russian/freq_noun_stems --sublexicon russian/freq_astyj --analysis last --nsamples 10000000 --shard 100000 --engine numpy
+    $ python workqueue.py --queue /lab/shared/q work --jobs 8        (on every machine that should help)
+    $ python workqueue.py --queue /lab/shared/q status
+    $ python workqueue.py --queue /lab/shared/q merge
+
+the queue directory holds
+    job.json: what to run (the analysis, lexicon and sublexicon, and the simulation settings), with an id hashed from all of it
+    todo/: one descriptor per shard (shard_00012.json: its number, number of samples and seed)
+    claimed/: a worker claims a shard by renaming its descriptor from todo/ into here, with the worker's name appended. a rename either happens or doesn't, so two workers can never claim the same shard. while it runs, the worker touches the claim every few seconds
+    results/: each shard's counters (shard_00012.<worker>.json), written to a temporary file and renamed into place, so a result file is always complete
+    done/: claims whose result has been written
+    rejected/: descriptors that belong to some other job (left over from an earlier submit), moved out of the way by the worker that claimed them
+
+shard seeds come from the job's seed and the shard number (numpy's SeedSequence), so a shard gives the same counts wherever and however many times it runs. that is what makes the merge safe:
+    - a shard with several results (it was requeued, but the first worker finished after all) is counted once, from the result whose file name sorts first
+    - shards whose worker died stay in claimed/ with an old timestamp; "requeue" moves the ones untouched for --stale seconds (default 100, ten heartbeats) back to todo/, and so does "work --stale 600" before a worker goes idle
+    - shards with no result yet are listed, and the merge adds up the ones that are there, reporting how many samples it has
+the merged counts are written to merged.txt in the queue directory, in the same format as the --last and --stats output.
+'''
+
+datapath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+analyses = ('last', 'stats')
+#how often a running worker touches its claim
+heartbeat = 10
+#requeue's default: a claim this many seconds old has missed ten heartbeats, so its worker is gone
+stale_default = 10*heartbeat
+
+
+def queue_dirs(queue):
+    return {d:os.path.join(queue, d) for d in ('todo', 'claimed', 'results', 'done', 'rejected')}
+
+
+def shard_name(i):
+    return f"shard_{i:05d}.json"
+
+
+def shard_number(fname):
+    return int(fname.split('.')[0].split('_')[1])
+
+
+def shard_seed(seed, i):
+    '''
+    an independent, reproducible seed for shard i of a job
+    '''
+    import numpy
+    return int(numpy.random.SeedSequence([seed, i]).generate_state(1)[0])
+
+
+def write_json(obj, path):
+    '''
+    writes atomically: to a temporary file in the same directory, then renamed into place
+    '''
+    tmp = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def read_json(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def submit(queue, job, shard=100000, force=False):
+    '''
+    writes job.json and one descriptor per shard of job['nsamples'] samples. job has the analysis, the lexicon and sublexicon (paths inside data) and the settings the workers pass on to lex_comparison (engine, seed, without_replacement, weighting, freqcat, freqpath, stats).
+    refuses to overwrite another job's queue unless force, which clears it first
+    '''
+    if job['analysis'] not in analyses:
+        raise ValueError(f"unknown analysis {job['analysis']} (try {', '.join(analyses)})")
+    if job.get('engine')=='exact':
+        raise ValueError("the exact engine doesn't sample, so there is nothing to distribute")
+    job = dict(job, seed=job['seed'] if job.get('seed') is not None else 55)
+    job['id'] = hashlib.sha256(json.dumps(job, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    jobpath = os.path.join(queue, 'job.json')
+    if os.path.exists(jobpath):
+        old = read_json(jobpath)
+        if old['id']!=job['id'] and not force:
+            raise ValueError(f"{queue} already holds job {old['id']}; use --force to replace it")
+        if force:
+            for d in queue_dirs(queue).values():
+                shutil.rmtree(d, ignore_errors=True)
+    for d in queue_dirs(queue).values():
+        os.makedirs(d, exist_ok=True)
+    nshards = -(-job['nsamples']//shard)
+    job['shards'] = nshards
+    write_json(job, jobpath)
+    dirs = queue_dirs(queue)
+    have = {shard_number(f) for d in ('todo', 'claimed', 'done') for f in os.listdir(dirs[d])}
+    n = 0
+    for i in range(nshards):
+        if i in have:
+            continue
+        size = min(shard, job['nsamples'] - i*shard)
+        write_json({'shard':i, 'nsamples':size, 'seed':shard_seed(job['seed'], i), 'job':job['id']}, os.path.join(dirs['todo'], shard_name(i)))
+        n += 1
+    print(f"job {job['id']}: {nshards} shards of up to {shard} samples, {n} queued in {queue}")
+    return job
+
+
+def claim(queue, worker):
+    '''
+    moves the first shard left in todo/ into claimed/ and returns the claim's path, or None if there is nothing left
+    '''
+    dirs = queue_dirs(queue)
+    for fname in sorted(os.listdir(dirs['todo'])):
+        if not fname.endswith('.json'):
+            continue
+        path = os.path.join(dirs['claimed'], f"{fname}.{worker}")
+        try:
+            os.rename(os.path.join(dirs['todo'], fname), path)
+        except (FileNotFoundError, FileExistsError):
+            #another worker got there first
+            continue
+        return path
+    return None
+
+
+def requeue(queue, stale):
+    '''
+    moves claims that haven't been touched for stale seconds (their worker died) back to todo/. returns the shards moved
+    '''
+    dirs = queue_dirs(queue)
+    moved = []
+    now = time.time()
+    for fname in sorted(os.listdir(dirs['claimed'])):
+        path = os.path.join(dirs['claimed'], fname)
+        try:
+            if now - os.path.getmtime(path) < stale:
+                continue
+            os.rename(path, os.path.join(dirs['todo'], fname.split('.json')[0] + '.json'))
+        except FileNotFoundError:
+            continue
+        moved.append(shard_number(fname))
+    if moved:
+        print(f"requeued stale shards {', '.join(map(str, moved))}")
+    return moved
+
+
+def load_job(job, verbosity=0):
+    '''
+    reads everything a worker needs for the job's simulations, once: the same kwargs lex_comparison.py builds for --last or --stats
+    '''
+    import nclasses as pnc
+    import learningdata as ldr
+    import sampling as smp
+    import lex_comparison as lc
+    lexdir = os.path.join(datapath, job['lexicon'])
+    kwargs = {'featpath':os.path.join(lexdir, 'Features.txt'), 'ignore_stress':False, 'verbosity':verbosity,
+              'engine':job.get('engine', 'numpy'), 'without_replacement':job.get('without_replacement', False)}
+    fstuff = pnc.make_featdic(featpath=kwargs['featpath'])
+    kwargs['featdic'] = fstuff['featdic']
+    kwargs['segdic'] = fstuff['segdic']
+    kwargs['nclassdic'] = pnc.compactdic(featpath=kwargs['featpath'], verbosity=0)
+    lexpath = os.path.join(lexdir, 'LearningData.txt')
+    kwargs['lex'] = ldr.read_ld(ld=lexpath, verbosity=verbosity)
+    kwargs['sublex'] = ldr.read_ld(ld=os.path.join(datapath, job['sublexicon'], 'LearningData.txt'), verbosity=verbosity)
+    kwargs['samsize'] = len(kwargs['sublex'])
+    kwargs['weights'] = lc.lexicon_weights(kwargs['lex'], **dict(kwargs, ld=lexpath, weighting=job.get('weighting', 'none'), freqcat=job.get('freqcat'), freqpath=job.get('freqpath') or smp.freqpath_default))
+    if job['analysis']=='stats':
+        kwargs['stats'] = job['stats']
+        if kwargs['engine']=='python':
+            kwargs['engine'] = 'numpy'
+    return kwargs
+
+
+def run_shard(job, kwargs, desc):
+    '''
+    one shard's counters: plain dictionaries of integers, so that shards add up
+    '''
+    import lex_comparison as lc
+    kw = dict(kwargs, nsamples=desc['nsamples'], seed=desc['seed'])
+    if job['analysis']=='last':
+        k = lc.finc_syllcount_monte(**kw)
+        return {'joint':k['finc']['joint'], 'lastnclass':k['finc']['lastnclass'], 'maxlenth':k['finc']['maxlenth'],
+                'absent':{cl:k['nclinc'][cl]['sim'] for cl in k['nclinc']}, 'segs':{cl:sorted(k['nclinc'][cl]['segs']) for cl in k['nclinc']},
+                'nclasses':len(kwargs['nclassdic']['nclassdic'])}
+    res = lc.stat_monte(**kw)['statsims']
+    return {'hists':{spec:res[spec]['hist'] for spec in res}, 'sublex':{spec:res[spec]['sublex'] for spec in res}}
+
+
+def touch_loop(path, stop):
+    while not stop.wait(heartbeat):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return
+
+
+def work(queue, worker=None, stale=None, verbosity=1):
+    '''
+    claims and runs shards until todo/ is empty. with stale, an idle worker first requeues claims abandoned for that many seconds and keeps going if it found any.
+    returns the number of shards this worker ran
+    '''
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    job = read_json(os.path.join(queue, 'job.json'))
+    dirs = queue_dirs(queue)
+    kwargs = None
+    ran = 0
+    while True:
+        path = claim(queue, worker)
+        if path is None:
+            if stale is not None and requeue(queue, stale):
+                continue
+            break
+        desc = read_json(path)
+        if desc['job']!=job['id']:
+            print(f"{os.path.basename(path)} belongs to job {desc['job']}, not {job['id']}; moving it to rejected/")
+            try:
+                os.rename(path, os.path.join(dirs['rejected'], os.path.basename(path)))
+            except FileNotFoundError:
+                pass
+            continue
+        if kwargs is None:
+            kwargs = load_job(job)
+        stop = threading.Event()
+        beat = threading.Thread(target=touch_loop, args=(path, stop), daemon=True)
+        beat.start()
+        start = time.time()
+        try:
+            counts = run_shard(job, kwargs, desc)
+        finally:
+            stop.set()
+            beat.join()
+        write_json(dict(desc, worker=worker, counts=counts, seconds=time.time()-start),
+                   os.path.join(dirs['results'], f"{shard_name(desc['shard'])[:-5]}.{worker}.json"))
+        try:
+            os.rename(path, os.path.join(dirs['done'], os.path.basename(path)))
+        except FileNotFoundError:
+            #requeued while it ran: the result is there anyway, and a second one will be ignored
+            pass
+        ran += 1
+        if verbosity > 0:
+            print(f"{worker}: shard {desc['shard']} ({desc['nsamples']} samples) in {time.time()-start:.1f} s")
+    return ran
+
+
+def _work(args):
+    queue, worker, stale = args
+    return work(queue, worker, stale, verbosity=1)
+
+
+def work_pool(queue, jobs, stale=None):
+    '''
+    runs jobs workers on this machine, in separate processes
+    '''
+    from concurrent.futures import ProcessPoolExecutor
+    host = socket.gethostname()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        ran = list(pool.map(_work, [(queue, f"{host}-{os.getpid()}-{i}", stale) for i in range(jobs)]))
+    print(f"{sum(ran)} shards run by {jobs} workers")
+    return sum(ran)
+
+
+def status(queue):
+    dirs = queue_dirs(queue)
+    job = read_json(os.path.join(queue, 'job.json'))
+    results = {shard_number(f) for f in os.listdir(dirs['results']) if f.endswith('.json')}
+    out = {'job':job['id'], 'shards':job['shards'], 'todo':len(os.listdir(dirs['todo'])), 'running':len(os.listdir(dirs['claimed'])),
+           'finished':len(results), 'rejected':len(os.listdir(dirs['rejected'])), 'missing':sorted(set(range(job['shards'])) - results)}
+    return out
+
+
+def hist_sum(hists):
+    out = {}
+    for h in hists:
+        for k, v in h.items():
+            out[k] = out.get(k, 0) + v
+    return out
+
+
+def merge(queue, verbosity=1):
+    '''
+    adds up the results of every shard, in shard order, taking one result per shard (the first by file name) and ignoring results from other jobs.
+    returns {'job', 'nsamples', 'shards', 'missing', 'duplicates', 'result'}, where result is what finc_syllcount_monte ('finc', 'nclinc', 'nclasses') or stat_monte (the statsims) would return for the samples merged
+    '''
+    import lex_comparison as lc
+    dirs = queue_dirs(queue)
+    job = read_json(os.path.join(queue, 'job.json'))
+    byshard = {}
+    for fname in sorted(os.listdir(dirs['results'])):
+        if not fname.endswith('.json'):
+            continue
+        res = read_json(os.path.join(dirs['results'], fname))
+        if res['job']==job['id']:
+            byshard.setdefault(res['shard'], []).append(res)
+    shards, duplicates = [], 0
+    for i in sorted(byshard):
+        shards.append(byshard[i][0])
+        duplicates += len(byshard[i]) - 1
+    nsamples = sum(r['nsamples'] for r in shards)
+    out = {'job':job['id'], 'nsamples':nsamples, 'shards':len(shards), 'missing':sorted(set(range(job['shards'])) - {r['shard'] for r in shards}), 'duplicates':duplicates}
+    counts = [r['counts'] for r in shards]
+    if not counts:
+        out['result'] = None
+    elif job['analysis']=='last':
+        segs = counts[0]['segs']
+        absent = hist_sum(c['absent'] for c in counts)
+        out['result'] = {'finc':{'joint':sum(c['joint'] for c in counts), 'lastnclass':hist_sum(c['lastnclass'] for c in counts),
+                                 'maxlenth':{int(k):v for k, v in hist_sum(c['maxlenth'] for c in counts).items()}},
+                         'nclinc':{cl:{'sim':absent[cl], 'segs':set(segs[cl])} for cl in segs}, 'nclasses':counts[0]['nclasses']}
+    else:
+        samsize = len(read_sublex(job))
+        out['result'] = {spec:lc.stat_summary({int(k):v for k, v in hist_sum(c['hists'][spec] for c in counts).items()}, counts[0]['sublex'][spec], samsize)
+                         for spec in counts[0]['hists']}
+    if verbosity > 0:
+        print(f"merged {len(shards)} of {job['shards']} shards ({nsamples} samples)" + (f", {duplicates} duplicate results ignored" if duplicates else "") + (f"; missing shards: {', '.join(map(str, out['missing']))}" if out['missing'] else ""))
+    return out
+
+
+def read_sublex(job):
+    import learningdata as ldr
+    return ldr.read_ld(ld=os.path.join(datapath, job['sublexicon'], 'LearningData.txt'), verbosity=0)
+
+
+def write_merged(job, merged, outpath):
+    import pipeline as ppl
+    import simstats as sts
+    res = merged['result']
+    if job['analysis']=='last':
+        ppl.write_last(res, merged['nsamples'], outpath)
+        lo, hi = sts.binom_ci(res['finc']['joint'], merged['nsamples'])
+        with open(outpath, 'a', encoding='utf-8') as f:
+            f.write(f"95% clopper-pearson interval for the joint rate: ({lo}, {hi})\n")
+    else:
+        with open(outpath, 'w', encoding='utf-8') as f:
+            f.write("stat\tsublex\tmean_sim\tp_absent\tp_all\tp_low\tp_high\n")
+            for spec, r in res.items():
+                f.write(f"{spec}\t{r['sublex']}\t{r['mean']:.3f}\t{r['p_absent']:.5f}\t{r['p_all']:.5f}\t{r['p_low']:.5f}\t{r['p_high']:.5f}\n")
+    print(f"merged results written to {outpath}")
+
+
+if __name__=="__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="runs lex_comparison simulations in shards, through a queue directory on a shared filesystem")
+    parser.add_argument("action", help="submit a job, work on it, show its status, requeue abandoned shards, or merge the results", choices=['submit', 'work', 'status', 'requeue', 'merge'])
+    parser.add_argument("--queue", help="the queue directory, on a filesystem every machine can see", required=True)
+    parser.add_argument("--lexicon", help="submit: the lexicon, a path to a directory in 'data'")
+    parser.add_argument("--sublexicon", help="submit: the sublexicon, a path to a directory in 'data'")
+    parser.add_argument("--analysis", help="submit: which simulation to run (default last)", choices=analyses, default='last')
+    parser.add_argument("--stats", help="submit: word predicates for --analysis stats, e.g. final=-son 'syll<=2'", nargs='+', default=None)
+    parser.add_argument("--nsamples", help="submit: total number of simulations", type=int, default=1000000)
+    parser.add_argument("--shard", help="submit: simulations per shard (default 100,000)", type=int, default=100000)
+    parser.add_argument("--engine", help="submit: python or numpy (default numpy)", choices=['python', 'numpy'], default='numpy')
+    parser.add_argument("--seed", help="submit: the job's seed; each shard's seed is derived from it (default 55)", type=int, default=None)
+    parser.add_argument("--without_replacement", help="submit: draw samples with no repeated words", type=bool, default=False)
+    parser.add_argument("--weighting", help="submit: none, freq or logfreq, as in lex_comparison.py", choices=['none', 'freq', 'logfreq'], default='none')
+    parser.add_argument("--freqcat", help="submit: part of speech for joining frequencies, as in lex_comparison.py", default=None)
+    parser.add_argument("--force", help="submit: replace whatever job the queue holds", type=bool, default=False)
+    parser.add_argument("--jobs", help="work: number of worker processes on this machine (default 1)", type=int, default=1)
+    parser.add_argument("--stale", help=f"work, requeue: seconds after which a claim nobody has touched counts as abandoned (requeue's default is {stale_default}; without it, work never requeues)", type=float, default=None)
+    args = parser.parse_args()
+    if args.action=='submit':
+        if not args.lexicon or not args.sublexicon:
+            sys.exit("submit needs --lexicon and --sublexicon")
+        if args.analysis=='stats' and not args.stats:
+            sys.exit("--analysis stats needs --stats")
+        job = {'analysis':args.analysis, 'lexicon':args.lexicon, 'sublexicon':args.sublexicon, 'nsamples':args.nsamples,
+               'engine':args.engine, 'seed':args.seed, 'without_replacement':args.without_replacement,
+               'weighting':args.weighting, 'freqcat':args.freqcat, 'stats':args.stats}
+        try:
+            submit(args.queue, job, shard=args.shard, force=args.force)
+        except ValueError as e:
+            sys.exit(str(e))
+    elif args.action=='work':
+        if args.jobs > 1:
+            work_pool(args.queue, args.jobs, args.stale)
+        else:
+            work(args.queue, stale=args.stale)
+    elif args.action=='status':
+        st = status(args.queue)
+        print(f"job {st['job']}: {st['shards']} shards, {st['todo']} to do, {st['running']} running, {st['finished']} finished" + (f", {st['rejected']} rejected (from another job)" if st['rejected'] else ""))
+        if st['missing'] and not st['todo'] and not st['running']:
+            print(f"no result for shards {', '.join(map(str, st['missing']))}")
+    elif args.action=='requeue':
+        requeue(args.queue, args.stale if args.stale is not None else stale_default)
+    else:
+        job = read_json(os.path.join(args.queue, 'job.json'))
+        merged = merge(args.queue)
+        if merged['result'] is not None:
+            write_merged(job, merged, os.path.join(args.queue, 'merged.txt'))